@@ -0,0 +1,230 @@
+"""
+Compact, versioned binary encoding of saved games, an alternative to the
+json hashes from Game.get_game_state(include_metadata=True).
+
+Only the fields Game.from_hash reads are kept (plus current_action, so json
+converts to binary and back without loss), everything derivable is
+dropped, and names become small enums:
+ - rooms as a list of hexes, each (x, y) as signed 2 byte ints with a room
+   index (rooms can be moved arbitrarily far during setup)
+ - a hex's aura and occupant packed into one byte
+ - each spell's faction and tapped flag as 3 bits of one bitfield
+A game is about 330 bytes instead of about 5.5KB of json (700 bytes zlibbed).
+
+Layout, all little endian:
+ - GAME_MAGIC or BOARD_MAGIC, then the schema version as one byte
+ - game only: game_id, created, updated, start_action, current_action as strings
+ - board: faction, actions and flags as bytes, info and error as strings,
+   the spell bitfield, the number of hexes, then 6 bytes per hex
+Strings are a 2 byte length (NONE_LENGTH for None) then utf-8.
+
+The enums below belong to schema versions 1 and 2. Changing them, or the
+layout, needs a new SCHEMA_VERSION with decoding kept for the old ones.
+Version 1 stored x and y as signed bytes, see HEXES.
+
+convert with: python -m backend.binary_format to-binary|to-json IN_FILE OUT_FILE
+"""
+import struct
+from json import dump, load
+from sys import argv, exit
+
+GAME_MAGIC = b'PIG'
+BOARD_MAGIC = b'PIB'
+SCHEMA_VERSION = 2
+NONE_LENGTH = 0xFFFF
+NO_ACTIONS = 0xFF # actions is None during setup
+
+FACTIONS = [None, 'Light', 'Dark']
+ROOMS = ['Pink', 'Indigo', 'Orange', 'Umber', 'Sapphire', 'Lime', 'Yellow', 'Shovel', 'Temp']
+OBJECTS = [None, 'Light', 'Dark', 'Priestess', 'Imposter', 'Opportunist', 'Usurper', 'Stonemason', 'Locksmith', 'Yeoman']
+SPELLS = ['Priestess', 'Purify', 'Imposter', 'Imprint', 'Opportunist', 'Overwork', 'Usurper', 'Upset', 'Stonemason', 'Shovel', 'Locksmith', 'Leap', 'Yeoman', 'Yoke']
+SPELL_BITS = 3 # 2 for the faction, 1 for tapped
+SPELL_BYTES = (len(SPELLS) * SPELL_BITS + 7) // 8
+
+HEADER = struct.Struct('<3sB')
+STRING_LENGTH = struct.Struct('<H')
+BOARD_FIELDS = struct.Struct('<BBB') # faction, actions, flags
+HEX = struct.Struct('<hhBB') # x, y, room, aura << 4 | occupant
+HEXES = {1: struct.Struct('<bbBB'), 2: HEX} # hex layout of each schema version
+GAME_OVER_FLAG = 1
+RESET_ON_FLAG = 2
+
+GAME_METADATA_KEYS = ['game_id', 'created', 'updated', 'start_action', 'current_action']
+
+############################
+# BOARD PARTS
+# the fields of Board.from_parts, read from a Board or a json hash
+############################
+
+def board_parts(board):
+    return {
+        'faction': board.faction,
+        'actions': board.actions,
+        'game_over': board.game_over,
+        'info': board.screen.info.text,
+        'error': board.screen.info.error,
+        'reset_on': board.screen.reset_on,
+        'hexes': [
+            (
+                int(hex.location.flat[0]),
+                int(hex.location.flat[1]),
+                room.name,
+                hex.aura,
+                hex.occupant.get_color() if hex.occupant else None,
+            )
+            for room in board.rooms for hex in room.hexes
+        ],
+        'spells': {spell.name: [spell.faction, spell.tapped] for spell in board.spells},
+    }
+
+def hash_board_parts(hash):
+    return {
+        'faction': hash['current_player'],
+        'actions': hash['actions_remaining'],
+        'game_over': hash['game_over'],
+        'info': hash['info'],
+        'error': hash['error'],
+        'reset_on': hash['reset_on'],
+        'hexes': [(h['x'], h['y'], h['room'], h['aura_color'], h['obj_color']) for h in hash['hexes']],
+        'spells': {spell['name']: [spell['faction'], spell['tapped']] for spell in hash['spells']},
+    }
+
+############################
+# ENCODING
+############################
+
+def encode_board(parts):
+    return HEADER.pack(BOARD_MAGIC, SCHEMA_VERSION) + _pack_board(parts)
+
+# metadata is a hash with GAME_METADATA_KEYS
+def encode_game(metadata, parts):
+    chunks = [HEADER.pack(GAME_MAGIC, SCHEMA_VERSION)]
+    chunks += [_pack_string(metadata.get(key)) for key in GAME_METADATA_KEYS]
+    chunks.append(_pack_board(parts))
+    return b''.join(chunks)
+
+def _pack_board(parts):
+    flags = (GAME_OVER_FLAG if parts['game_over'] else 0) | (RESET_ON_FLAG if parts['reset_on'] else 0)
+    actions = NO_ACTIONS if parts['actions'] == None else parts['actions']
+
+    spell_bits = 0
+    for idx, name in enumerate(SPELLS):
+        faction, tapped = parts['spells'][name]
+        spell_bits |= (FACTIONS.index(faction) | (4 if tapped else 0)) << (idx * SPELL_BITS)
+
+    chunks = [
+        BOARD_FIELDS.pack(FACTIONS.index(parts['faction']), actions, flags),
+        _pack_string(parts['info']),
+        _pack_string(parts['error']),
+        spell_bits.to_bytes(SPELL_BYTES, 'little'),
+        bytes([len(parts['hexes'])]),
+    ]
+    for x, y, room, aura, occupant in parts['hexes']:
+        chunks.append(HEX.pack(x, y, ROOMS.index(room), FACTIONS.index(aura) << 4 | OBJECTS.index(occupant)))
+    return b''.join(chunks)
+
+def _pack_string(text):
+    if text == None:
+        return STRING_LENGTH.pack(NONE_LENGTH)
+    data = text.encode()
+    return STRING_LENGTH.pack(len(data)) + data
+
+############################
+# DECODING
+############################
+
+# returns the parts for Board.from_parts
+def decode_board(data):
+    offset, version = _check_header(data, BOARD_MAGIC)
+    parts, _ = _unpack_board(data, offset, version)
+    return parts
+
+# returns the metadata hash and the board parts
+def decode_game(data):
+    offset, version = _check_header(data, GAME_MAGIC)
+    metadata = {}
+    for key in GAME_METADATA_KEYS:
+        metadata[key], offset = _unpack_string(data, offset)
+    parts, _ = _unpack_board(data, offset, version)
+    return metadata, parts
+
+def _check_header(data, magic):
+    found_magic, version = HEADER.unpack_from(data, 0)
+    if found_magic != magic:
+        raise ValueError('not a binary {}'.format('game' if magic == GAME_MAGIC else 'board'))
+    if version not in HEXES:
+        raise ValueError('unsupported binary schema version {}'.format(version))
+    return HEADER.size, version
+
+def _unpack_board(data, offset, version):
+    faction, actions, flags = BOARD_FIELDS.unpack_from(data, offset)
+    offset += BOARD_FIELDS.size
+    info, offset = _unpack_string(data, offset)
+    error, offset = _unpack_string(data, offset)
+
+    spell_bits = int.from_bytes(data[offset:offset + SPELL_BYTES], 'little')
+    offset += SPELL_BYTES
+    spells = {}
+    for idx, name in enumerate(SPELLS):
+        bits = spell_bits >> (idx * SPELL_BITS)
+        spells[name] = [FACTIONS[bits & 3], bool(bits & 4)]
+
+    n_hexes = data[offset]
+    offset += 1
+    hex_struct = HEXES[version]
+    hexes = [
+        (x, y, ROOMS[room], FACTIONS[aura_occupant >> 4], OBJECTS[aura_occupant & 15])
+        for x, y, room, aura_occupant in hex_struct.iter_unpack(data[offset:offset + n_hexes * hex_struct.size])
+    ]
+    offset += n_hexes * hex_struct.size
+
+    parts = {
+        'faction': FACTIONS[faction],
+        'actions': None if actions == NO_ACTIONS else actions,
+        'game_over': bool(flags & GAME_OVER_FLAG),
+        'info': info,
+        'error': error,
+        'reset_on': bool(flags & RESET_ON_FLAG),
+        'hexes': hexes,
+        'spells': spells,
+    }
+    return parts, offset
+
+def _unpack_string(data, offset):
+    length, = STRING_LENGTH.unpack_from(data, offset)
+    offset += STRING_LENGTH.size
+    if length == NONE_LENGTH:
+        return None, offset
+    return bytes(data[offset:offset + length]).decode(), offset + length
+
+############################
+# JSON CONVERSION
+############################
+
+# state is a hash from Game.get_game_state(include_metadata=True), as saved in json
+def state_to_bytes(state):
+    return encode_game(state, hash_board_parts(state))
+
+def bytes_to_state(data):
+    from backend.game import Game # backend.game imports this module
+
+    metadata, _ = decode_game(data)
+    state = Game.from_bytes(data).get_game_state(include_metadata=True)
+    state['current_action'] = metadata['current_action']
+    return state
+
+if __name__ == "__main__":
+    if len(argv) != 4 or argv[1] not in ['to-binary', 'to-json']:
+        print('usage: python -m backend.binary_format to-binary|to-json IN_FILE OUT_FILE')
+        exit(1)
+
+    if argv[1] == 'to-binary':
+        with open(argv[2], "r") as file:
+            data = state_to_bytes(load(file))
+        with open(argv[3], "wb") as file:
+            file.write(data)
+    else:
+        with open(argv[2], "rb") as file:
+            state = bytes_to_state(file.read())
+        with open(argv[3], "w") as file:
+            dump(state, file)
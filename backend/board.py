@@ -9,14 +9,22 @@ Board stores a full set of game state:
  - a graphics screen to send data to be displayed
 
  Creating a new board creates a full set of objects (Rooms, Spells, Artworks, Players)
+
+ The targets of each spell (see Spell.find_targets) are cached for the board
+ state they were found in: get_spell_targets compares the board's fingerprint
+ with the one the cache was filled for and starts over if anything changed,
+ so repeated prompts and polls only search the board once per state.
+The game state only includes castable spells and their targets between
+actions (see return_spell_data), not while a spell is being cast.
 """
 import numpy as np
 
+import backend.binary_format as binary_format
 from backend.artwork import Artwork
 from backend.errors import InvalidMove
 from backend.helpers import display_list, other_faction
 from backend.hex import Hex
-from backend.location import neighboring_region, find_adjacent_rooms, hexes_colocated, linked_rooms
+from backend.location import Layout, neighboring_region, find_adjacent_rooms, hexes_colocated, linked_rooms
 from backend.player import Player
 from backend.room import Room
 from backend.spell import (
@@ -121,6 +129,14 @@ class Board(object):
             )
         ]
 
+        # hex lookups and rays for the room positions in layout_key, see get_layout
+        self.layout = None
+        self.layout_key = None
+
+        # spell name to targets, for the board state with fingerprint spell_targets_key
+        self.spell_targets = {}
+        self.spell_targets_key = None
+
     def __str__(self):
         return '\n***BOARD***\n{overview}\nplayers:{players}\nartworks:{artworks}\n'.format(
             overview = self.get_state_msg(),
@@ -141,37 +157,49 @@ class Board(object):
 
     @staticmethod
     def from_hash(hash):
+        return Board.from_parts(
+            hash['screen'],
+            faction = hash['current_player'],
+            actions = hash['actions_remaining'],
+            game_over = hash['game_over'],
+            info = hash['info'],
+            error = hash['error'],
+            reset_on = hash['reset_on'],
+            hexes = [(h['x'], h['y'], h['room'], h['aura_color'], h['obj_color']) for h in hash['hexes']],
+            spells = {spell['name']: [spell['faction'], spell['tapped']] for spell in hash['spells']},
+        )
+
+    # build a board from the fields saved by from_hash and to_bytes
+    # hexes is a list of (x, y, room name, aura, occupant color) in room order,
+    # spells is a hash of spell name to [faction, tapped]
+    @staticmethod
+    def from_parts(screen, faction, actions, game_over, info, error, reset_on, hexes, spells):
         room_dict = {} # room name to list of hexes
         obj_dict = {} # object name to hex
-        spell_dict = {} # spell name to a list of [faction, tapped]
-        for hex_hash in hash['hexes']:
-            x, y = hex_hash['x'], hex_hash['y']
+        for x, y, room_name, aura, obj_color in hexes:
             location = np.matrix([x, y, -1*x - y])
 
             hex = Hex(None, location)
-            hex.aura = hex_hash['aura_color']
+            hex.aura = aura
 
-            obj_dict[hex_hash['obj_color']] = hex
+            obj_dict[obj_color] = hex
 
-            room_hexes = room_dict.get(hex_hash['room'], [])
+            room_hexes = room_dict.get(room_name, [])
             room_hexes.append(hex)
-            room_dict[hex_hash['room']] = room_hexes
-
-        for spell in hash['spells']:
-            spell_dict[spell['name']] = [spell['faction'], spell['tapped']]
+            room_dict[room_name] = room_hexes
 
         board = Board(
-            hash['screen'],
-            faction = hash['current_player'],
-            actions = hash['actions_remaining'],
+            screen,
+            faction = faction,
+            actions = actions,
         )
-        board.game_over = hash['game_over']
-        board.screen.info.text = hash['info']
-        board.screen.info.error = hash['error']
-        board.screen.reset_on = hash['reset_on']
+        board.game_over = game_over
+        board.screen.info.text = info
+        board.screen.info.error = error
+        board.screen.reset_on = reset_on
         for spell in board.spells:
-            spell.faction = spell_dict[spell.name][0]
-            spell.tapped = spell_dict[spell.name][1]
+            spell.faction = spells[spell.name][0]
+            spell.tapped = spells[spell.name][1]
             if spell.artwork:
                 spell.artwork.faction = spell.faction
 
@@ -183,14 +211,26 @@ class Board(object):
             if artwork.color in obj_dict:
                 artwork.hex = obj_dict[artwork.color] # TODO: rename color to name or spell
                 artwork.hex.set_object(artwork)
+        # the Shovel room only exists once Shovel has been cast
+        if 'Shovel' in room_dict:
+            board.rooms.append(Room('Shovel', None, [], None, None))
         for room in board.rooms:
             room.hexes = room_dict[room.name]
             room.root = room.hexes[0]
             for hex in room.hexes:
                 hex.room = room
+            room.moved()
 
         return board
 
+    # compact binary encoding, see backend/binary_format.py
+    def to_bytes(self):
+        return binary_format.encode_board(binary_format.board_parts(self))
+
+    @staticmethod
+    def from_bytes(data, screen):
+        return Board.from_parts(screen, **binary_format.decode_board(data))
+
     def get_current_player(self):
         return self.players[self.faction]
 
@@ -235,6 +275,45 @@ class Board(object):
 
         return eligible_spells
 
+    # everything spell targets depend on: whose turn it is, who owns which
+    # spells, and where the hexes, auras and objects are
+    def fingerprint(self):
+        return (
+            self.faction,
+            tuple((spell.faction, spell.tapped) for spell in self.spells),
+            tuple(
+                (room.name, hex.location.tobytes(), hex.aura, hex.occupant and str(hex.occupant))
+                for room in self.rooms for hex in room.hexes
+            ),
+        )
+
+    # forget the spell targets found for an earlier board state
+    def refresh_spell_targets(self):
+        key = self.fingerprint()
+        if key != self.spell_targets_key:
+            self.spell_targets = {}
+            self.spell_targets_key = key
+
+    # targets of spell for the current board state, found on first use. Pass
+    # refresh=False if refresh_spell_targets was just called
+    def get_spell_targets(self, spell, refresh=True):
+        if refresh:
+            self.refresh_spell_targets()
+        if spell.name not in self.spell_targets:
+            self.spell_targets[spell.name] = spell.find_targets(self)
+        return self.spell_targets[spell.name]
+
+    # list of (spell, targets) for the spells the current player can cast now,
+    # targets is None for spells that do not start by choosing a target
+    def get_castable_spells(self):
+        castable = []
+        self.refresh_spell_targets()
+        for spell in self.get_eligible_spells():
+            targets = self.get_spell_targets(spell, refresh=False)
+            if targets == None or len(targets) > 0:
+                castable.append((spell, targets))
+        return castable
+
     def is_game_over(self):
         if not self.check_game_over:
             return False
@@ -257,6 +336,15 @@ class Board(object):
     # board layout methods #
     ########################
 
+    # Layout of the rooms where they are now, rebuilt when a room moves or
+    # rooms are added or removed
+    def get_layout(self):
+        key = tuple(room.layout_id for room in self.rooms)
+        if key != self.layout_key:
+            self.layout = Layout(self.rooms)
+            self.layout_key = key
+        return self.layout
+
     def get_room(self, hex):
         # find the room containing the given hex
         rooms = [room for room in self.rooms if hex in room.hexes]
@@ -367,18 +455,28 @@ class Board(object):
                 })
         return hex_maps
 
-    def return_spell_data(self):
+    # include_targets is False while a spell is being cast. 'castable' and
+    # 'targets' are left out then, and while the Shovel's Temp room is out,
+    # since the board is between states and they would mean nothing
+    def return_spell_data(self, include_targets=True):
         data = []
         active_spells = self.get_eligible_spells(include_unplaced=True)
+        include_targets = include_targets and not self.game_over and not any(room.name == 'Temp' for room in self.rooms)
+        castable_spells = dict(self.get_castable_spells()) if include_targets else {}
         for spell in self.spells:
-            data.append({
+            spell_data = {
                 'name': spell.name,
                 'faction': spell.faction,
                 'tapped': spell.tapped,
                 'has_artwork': bool(spell.artwork),
                 'unplaced_artwork': bool(spell.artwork and not spell.artwork.hex),
                 'active': not self.game_over and spell in active_spells,
-            })
+            }
+            if include_targets:
+                targets = castable_spells.get(spell)
+                spell_data['castable'] = spell in castable_spells
+                spell_data['targets'] = [target_data(target) for target in targets] if targets else []
+            data.append(spell_data)
         return data
 
     def flush_spell_data(self):
@@ -436,3 +534,11 @@ class Board(object):
             self.actions,
             '' if self.actions == 1 else 's',
         )
+
+# json for a spell target: [x, y] for hexes and locations, the name of anything else
+def target_data(target):
+    if isinstance(target, Hex):
+        target = target.location
+    if isinstance(target, np.matrix):
+        return [int(target.flat[0]), int(target.flat[1])]
+    return str(target)
@@ -1,17 +1,17 @@
 """
 Overall game class to track info related to turns and the board.
 """
+import backend.binary_format as binary_format
 from backend.board import Board
 from backend.errors import InvalidMove
 from backend.helpers import other_faction
 from backend.location import find_adjacent_hexes, location_to_axial
-from graphics.pygame_screen import PygameScreen
-from graphics.js_screen import MockScreen
-import graphics.pygame_input as pygame_input
-import graphics.js_input as js_input
+from backend.store import JsonStore
 import copy
-from json import dump
+import importlib
+import itertools
 from datetime import datetime as dt
+from time import perf_counter
 
 # TODO:
 # - cancel options - ex. when choosing spell to cast
@@ -23,25 +23,60 @@ from datetime import datetime as dt
 #    - track who started, who won, and with what spells
 #    - not loose game state when server restarts
 
+# unique across all games in the process (not across processes or restarts,
+# see heroku/spectator.py), so a version identifies one state of one game
+VERSIONS = itertools.count(1)
+
+# screen module and class for each frontend mode, imported when first used so
+# the server (js mode) never imports pygame. Screens have the module of input
+# functions for their frontend as their input attribute.
+SCREENS = {
+    'js': ('graphics.js_screen', 'MockScreen'),
+    'pygame': ('graphics.pygame_screen', 'PygameScreen'),
+}
+
+# inputs that can be sent in a batch, see Game.apply_batch
+BATCH_KEYS = ['current_action', 'current_keypress', 'click_x', 'click_y', 'choice_idx', 'click_spell_idx']
+
 class Game(object):
-    def __init__(self, game_id):
-        # choose pygame vs js frontend
-        # IMPORTANT: if you update, also update imports in spell.py
-        self.mode = 'js' # 'js' or 'pygame'
+    store = JsonStore('saved_games') # where games are saved, see backend/store.py
+
+    def __init__(self, game_id, mode='js'):
+        self.mode = mode # 'js' or 'pygame', see SCREENS
 
         self.game_id = game_id
-        self.screen_input = js_input if self.mode == 'js' else pygame_input
-        self.screen = MockScreen() if self.mode == 'js' else PygameScreen()
+        self.screen = Game.make_screen(mode)
         self.old_board = Board(self.screen)
         self.current_board = copy.deepcopy(self.old_board)
         self.start_action = 'place rooms'
 
         self.created = Game.current_time_str()
         self.updated = Game.current_time_str()
+        self.version = next(VERSIONS) # changes whenever get_game_state changes
+        self.last_state = None # returned by the last do_action, to tell if the next one changed anything
+
+        # inputs of actions since the last save, for stores that log them
+        self.events = []
+        self.replaying = False # True while a store replays events, disables saving
+        self.synced = True # True when old_board matches current_board
+
+        # used to report per request metrics, see do_action
+        self.last_spell = None # name of the spell cast in the last request
+        self.save_seconds = 0 # time spent in save_to_file
 
     def __str__(self):
         return str(self.current_board)
 
+    @staticmethod
+    def make_screen(mode):
+        module_name, class_name = SCREENS[mode]
+        return getattr(importlib.import_module(module_name), class_name)()
+
+    # input functions of the frontend, see graphics/js_input.py and graphics/pygame_input.py
+    @property
+    def screen_input(self):
+        return self.screen.input
+
     def is_game_over(self):
         return self.current_board.is_game_over()
 
@@ -65,6 +100,31 @@ class Game(object):
 
         return game
 
+    # compact binary encoding, see backend/binary_format.py
+    # from_bytes(to_bytes()) rebuilds the same state as from_hash(get_game_state(include_metadata=True))
+    def to_bytes(self):
+        metadata = {
+            'game_id': self.game_id,
+            'created': self.created,
+            'updated': self.updated,
+            'start_action': self.start_action,
+            'current_action': self.screen.data['current_action'] if self.screen.data else 'none',
+        }
+        return binary_format.encode_game(metadata, binary_format.board_parts(self.current_board))
+
+    @staticmethod
+    def from_bytes(data):
+        metadata, parts = binary_format.decode_game(data)
+        game = Game(metadata['game_id'])
+        game.start_action = metadata['start_action'] or 'none'
+        game.created = metadata['created']
+        game.updated = metadata['updated']
+
+        game.current_board = Board.from_parts(game.screen, **parts)
+        game.sync_boards()
+
+        return game
+
     @staticmethod
     def filename(game_id=None):
         if game_id:
@@ -77,9 +137,14 @@ class Game(object):
         return dt.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
 
     def save_to_file(self):
-        data = self.get_game_state(include_metadata=True)
-        with open(Game.filename(self.game_id), "w") as file:
-            dump(data, file)
+        if not self.replaying:
+            start = perf_counter()
+            Game.store.save(self)
+            self.save_seconds += perf_counter() - start
+
+    # return whether from_hash can rebuild the game exactly from get_game_state
+    def can_snapshot(self):
+        return self.synced and self.start_action in ['none', 'end game'] and not self.screen.choices
 
     def move(self):
         if self.current_board.actions < 1:
@@ -226,6 +291,7 @@ class Game(object):
             all_spells = self.current_board.spells)
         if spell == None:
             return False
+        self.last_spell = spell.name
 
         try:
             done = spell.cast(self.current_board)
@@ -240,6 +306,7 @@ class Game(object):
 
     def reset_turn(self):
         self.current_board = copy.deepcopy(self.old_board)
+        self.synced = True
         return True
 
     def maybe_claim_spell(self):
@@ -277,6 +344,7 @@ class Game(object):
 
     def sync_boards(self):
         self.old_board = copy.deepcopy(self.current_board)
+        self.synced = True
 
     def place_rooms(self):
         instructions = \
@@ -448,6 +516,9 @@ class Game(object):
             return
 
         print('[{}] calling action:{}, player:{}'.format(self.game_id, action, request_player))
+        if not self.replaying:
+            self.events.append({'time': self.updated, 'data': dict(self.screen.data)})
+        self.synced = False
         self.screen.info.error = None
         done = False
         done_msg = ''
@@ -587,33 +658,102 @@ class Game(object):
             'current_player': self.current_board.faction,
             'actions_remaining': self.current_board.actions,
             'hexes': self.current_board.return_hex_data(),
-            'spells': self.current_board.return_spell_data(),
+            'spells': self.current_board.return_spell_data(include_targets=action != 'cast spell'),
         })
         return data
 
     # main method for js frontend
     # TODO: check is_game_over at needed points in spells
-    def do_action(self, data):
+    # if timings is a hash it is filled with the seconds spent in each phase,
+    # time spent saving is only counted in save_to_file
+    # data['batch'] can hold a list of inputs to apply in order, see apply_batch
+    def do_action(self, data, timings=None):
+        last_updated = self.updated
         self.updated = Game.current_time_str()
-        self.screen.data = data
-
-        try:
-            self.call_action()
-        except InvalidMove as error:
-            self.screen.info.text = 'Select an option (click button or use keybinding)'
-            self.screen.info.error = 'INVALID MOVE: {}'.format(error)
-            self.screen.choices = []
-            self.screen.action_buttons_on = True
-            self.screen.data['current_action'] = 'none'
+        self.last_spell = None
+        self.save_seconds = 0
+        steps = data.pop('batch', None)
+
+        start = perf_counter()
+        if steps == None:
+            self.screen.data = data
+            self.apply_input()
+        else:
+            step_errors = self.apply_batch(data, steps)
+        called = perf_counter()
+        call_save_seconds = self.save_seconds
 
-        if self.is_game_over():
+        game_over = self.is_game_over()
+        checked = perf_counter()
+        if game_over:
             self.start_action = 'end game'
             self.screen.data['current_action'] = 'end game'
             self.end_game()
+        ended = perf_counter()
 
         # print('[{}] do_action return, action:{}'.format(self.game_id, self.screen.data['current_action']))
-        return self.get_game_state()
-
+        state = self.get_game_state()
+        # polls and inputs from the player whose turn it is not leave the
+        # state as it was, so spectator snapshots and ETags stay valid
+        if state == self.last_state:
+            self.updated = last_updated
+        else:
+            self.version = next(VERSIONS)
+            self.last_state = state
+        if steps != None:
+            state = dict(state, step_errors=step_errors)
+
+        if timings != None:
+            timings['call_action'] = called - start - call_save_seconds
+            timings['is_game_over'] = checked - called
+            if game_over:
+                timings['end_game'] = ended - checked - (self.save_seconds - call_save_seconds)
+            timings['get_game_state'] = perf_counter() - ended
+            if self.save_seconds:
+                timings['save_to_file'] = self.save_seconds
+        return state
+
+    # call the action for the input in self.screen.data
+    # returns the error message if the move was invalid
+    def apply_input(self):
+        try:
+            self.call_action()
+        except InvalidMove as error:
+            return self.reject_input(error)
+
+    # show error and go back to choosing an action, returns the error message
+    def reject_input(self, error):
+        self.screen.info.text = 'Select an option (click button or use keybinding)'
+        self.screen.info.error = 'INVALID MOVE: {}'.format(error)
+        self.screen.choices = []
+        self.screen.action_buttons_on = True
+        self.screen.data['current_action'] = 'none'
+        return self.screen.info.error
+
+    # apply several inputs (hashes with any of BATCH_KEYS) as if each was sent
+    # in its own request, but only build the game state once at the end.
+    # Each step uses the current_action left by the step before unless it
+    # has its own. Stops at the first invalid move or when the game ends.
+    # A batch that is not a list of hashes is rejected as one invalid move.
+    # returns a list with the error (or None) of each step that was applied
+    def apply_batch(self, data, steps):
+        step_errors = []
+        self.screen.data = dict(data)
+        if not isinstance(steps, list) or not all(isinstance(step, dict) for step in steps):
+            self.screen.info.error = None
+            return [self.reject_input(InvalidMove('batch must be a list of hashes'))]
+        current_action = data.get('current_action')
+        for step in steps:
+            self.screen.data = dict(data, current_action=current_action)
+            self.screen.data.update({k: v for k, v in step.items() if k in BATCH_KEYS})
+            self.screen.info.error = None # so each step only reports its own error
+
+            invalid_move = self.apply_input()
+            step_errors.append(invalid_move or self.screen.info.error)
+            current_action = self.screen.data['current_action']
+            if invalid_move or self.current_board.game_over:
+                break
+        return step_errors
 
 if __name__ == "__main__":
     piously = Game("Dark")
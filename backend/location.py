@@ -4,6 +4,12 @@ This is implemented using numpy's array class.
 
 This file has lots of different helpers for working with locations and
 computing linked regions
+
+Hexes are looked up by location in the board's Layout (see Board.get_layout),
+which is only rebuilt when a room moves. The Layout also keeps "rays": for a
+location and each of unit_directions, the hexes in that direction, nearest
+first, up to the first gap. Neighbors, Leap and Yoke are lookups in these.
+It also keeps the perimeter of the board, where the Shovel can be placed.
 """
 import numpy as np
 
@@ -16,6 +22,9 @@ unit_directions = [
     np.matrix([0,1,-1]),
 ]
 
+# unit_directions as axial coordinate steps
+unit_steps = [(int(u.flat[0]), int(u.flat[1])) for u in unit_directions]
+
 # convert a location vector to a axial coordinate tuple
 def location_to_axial(location):
     return (location.flat[0], location.flat[1])
@@ -31,10 +40,7 @@ def hexes_colocated(hex1, hex2):
 
 # given a board and a location, return the hex at this location, or None if no hex exists
 def find_hex(board, location):
-    for test_hex in board.get_all_hexes():
-        if (test_hex.location == location).all():
-            return test_hex
-    return None
+    return board.get_layout().find_hex(location)
 
 # find the hex at direction relative to direction
 def find_neighbor_hex(board, starting_hex, direction):
@@ -43,35 +49,20 @@ def find_neighbor_hex(board, starting_hex, direction):
 # given a hex, return the (up to six) neighboring hexes
 def find_adjacent_hexes(board, starting_hex, return_nones = False):
     adjacent_hexes = []
-    for u in unit_directions:
-        neighbor = find_neighbor_hex(board, starting_hex, u)
-        if neighbor != None or return_nones:
-            adjacent_hexes.append(neighbor)
+    for ray in board.get_layout().get_rays(starting_hex.location):
+        if ray:
+            adjacent_hexes.append(ray[0])
+        elif return_nones:
+            adjacent_hexes.append(None)
     return adjacent_hexes
 
-# return True if two pieces on hex1 and hex2 can Leap, and False otherwise
+# return True if two pieces on hex1 and hex2 can Leap, and False otherwise:
+# they must be in a row with no empty positions between them
 def leap_eligible(board, hex1, hex2):
-    if hex1 == hex2:
-        return False
-    try:
-        displacement = hex1.location - hex2.location
-    except AttributeError:
-        # You tried to leap, but passed nonexistent hexes or locations. Shame on you.
+    if hex1 == hex2 or hex1 == None or hex2 == None:
+        # You tried to leap, but passed nonexistent hexes. Shame on you.
         return False
-    nonzero_entries = [x for x in displacement.flat if x != 0]
-    number_of_tiles = np.gcd.reduce(nonzero_entries)
-    # get a "unit" vector in the direction between hex1 and hex2
-    u = (1/number_of_tiles) * displacement
-    # check to see if the pieces are aligned along one of the three coordinate lines,
-    # which is equivalent to if u-x is zero for x in unit_directions
-    if all([ (u-x).any() for x in unit_directions]):
-        return False
-    else:
-        # check each position in the row and make sure none are empty
-        for i in range(number_of_tiles):
-            if not find_hex(board, hex2.location + i*u):
-                return False
-        return True
+    return any(hex2 in ray for ray in board.get_layout().get_rays(hex1.location))
 
 # given a hex, return the list of all hexes connected to the starting hex
 # if check_auras, only return hexes connected to the starting hex by monochromatic auras
@@ -147,15 +138,63 @@ def find_adjacent_rooms(board, starting_room, include_shovel=True):
                     adjacent_rooms.append(room)
     return adjacent_rooms
 
-# return locations adjacent to entries of hex_list which do not have hexes
+# return locations adjacent to entries of hex_list which do not have hexes,
+# each once. For the whole board use Layout.get_perimeter instead.
 def find_unoccupied_neighbors(board, hex_list):
-    unoccupied_locations = []
+    layout = board.get_layout()
+    unoccupied_axials = {} # axial coordinates to True, in the order found
     for hex in hex_list:
-        for u in unit_directions:
-            # see if there is a hex in direction u from hex
-            test_location = hex.location + u
-            if not(find_neighbor_hex(board,hex,u)):
-                unoccupied_locations.append(test_location)
-    # TODO: remove duplicates from unoccupied_locations
-    # it cannot be cast to set since matrices are not hashable
-    return unoccupied_locations
+        x, y = location_to_axial(hex.location)
+        for (dx, dy), ray in zip(unit_steps, layout.get_rays(hex.location)):
+            # see if there is a hex in this direction from hex
+            if not ray:
+                unoccupied_axials[(x + dx, y + dy)] = True
+    return [axial_to_location(axial) for axial in unoccupied_axials]
+
+class Layout(object):
+    # rooms should not move while the Layout is in use, see Room.moved
+    def __init__(self, rooms):
+        # axial coordinates to hex. If rooms overlap (while the Stonemason
+        # moves one) the hex of the earlier room is found, as by a search.
+        self.hexes = {}
+        for room in rooms:
+            for hex in room.hexes:
+                self.hexes.setdefault(location_to_axial(hex.location), hex)
+
+        self.rays = {} # axial coordinates to a ray per unit direction, filled by get_rays
+        self.perimeter = None # see get_perimeter
+
+    def find_hex(self, location):
+        return self.hexes.get(location_to_axial(location))
+
+    # list with the ray from location in each of unit_directions
+    def get_rays(self, location):
+        x, y = location_to_axial(location)
+        rays = self.rays.get((x, y))
+        if rays == None:
+            rays = []
+            for dx, dy in unit_steps:
+                ray = []
+                step = 1
+                while (x + step * dx, y + step * dy) in self.hexes:
+                    ray.append(self.hexes[(x + step * dx, y + step * dy)])
+                    step += 1
+                rays.append(ray)
+            self.rays[(x, y)] = rays
+        return rays
+
+    # axial coordinates of the empty positions next to the board, each once,
+    # in the order of the hexes they are next to
+    def get_perimeter(self):
+        if self.perimeter == None:
+            perimeter = {}
+            for x, y in self.hexes:
+                for dx, dy in unit_steps:
+                    if (x + dx, y + dy) not in self.hexes:
+                        perimeter[(x + dx, y + dy)] = True
+            self.perimeter = list(perimeter)
+        return self.perimeter
+
+    # list with the hex next to location in each of unit_directions, or None
+    def get_neighbors(self, location):
+        return [ray[0] if ray else None for ray in self.get_rays(location)]
@@ -2,8 +2,13 @@
 One of the seven rooms of the temple.
 """
 from backend.hex import Hex
+import itertools
 import numpy as np
 
+# unique across all rooms in the process, so a layout id identifies one
+# position of one room's hexes, see Board.get_layout
+LAYOUT_IDS = itertools.count(1)
+
 class Room(object):
     def __init__(self, name, root, shape, a_spell, b_spell, relative_shape=True):
         # root is the location of the first hex of the room if relative_shape
@@ -22,10 +27,15 @@ class Room(object):
             # ignore
             self.hexes = [Hex(self, x) for x in shape]
         self.name = name
+        self.layout_id = next(LAYOUT_IDS) # changes whenever the hexes move
 
     def __str__(self):
         return self.name
 
+    # must be called after changing the location of any hex in the room
+    def moved(self):
+        self.layout_id = next(LAYOUT_IDS)
+
     def color_name(self):
         if self.name == 'Temp' or self.name == 'Shovel':
             return self.name
@@ -38,11 +48,13 @@ class Room(object):
         rotate_matrix = np.matrix([[ 0,0,-1],[-1,0,0],[0,-1,0]]).astype(int)
         for hex in self.hexes:
             hex.location = ((hex.location-self.hexes[0].location) * (rotate_matrix ** increment) + self.hexes[0].location).astype(int)
+        self.moved()
 
     def translate(self, displacement):
         # moves the whole room by displacement
         for hex in self.hexes:
             hex.location = hex.location + displacement
+        self.moved()
 
     def keyboard_movement(self, key):
         if key == "left" or key == "ArrowLeft":
@@ -8,8 +8,6 @@ and may have a pointer to an associated artwork.
 from backend.errors import InvalidMove
 from backend.helpers import other_faction
 from backend.room import Room
-# from graphics.pygame_input import choose_from_list, choose_hexes, get_keypress
-from graphics.js_input import choose_from_list, choose_hexes, get_keypress
 from copy import deepcopy
 
 import backend.location as location
@@ -43,6 +41,12 @@ class Spell(object):
     def cast(self, board):
         raise NotImplementedError() # must be overwridden
 
+    # the choices of the first prompt of cast(), or None if cast() does not
+    # start by choosing from a list. Use board.get_spell_targets, which keeps
+    # these until the board changes.
+    def find_targets(self, board):
+        return None
+
     def untap(self):
         """Used in Board.end_turn to reset spell states"""
         self.tapped = False
@@ -100,10 +104,9 @@ class Priestess(Spell):
         self._validate_spell_status_and_tap(board)
 
         # choose the hex to bless
-        adjacent_linked_hexes = location.adjacent_linked_region(board, board.artworks[0].hex)
-        target_hex = choose_hexes(
+        target_hex = board.screen.input.choose_hexes(
             board.screen,
-            adjacent_linked_hexes,
+            board.get_spell_targets(self),
             prompt_text = 'Click hex to grow linked region',
             error_text = 'There are no hexes which the Priestess may bless',
         )
@@ -113,6 +116,9 @@ class Priestess(Spell):
         target_hex.aura = board.faction
         return self._exit_cast(done=True)
 
+    def find_targets(self, board):
+        return location.adjacent_linked_region(board, self.artwork.hex)
+
 class Purify(Spell):
     def __init__(self):
         super(Purify, self).__init__()
@@ -122,13 +128,10 @@ class Purify(Spell):
 
     def cast(self, board):
         self._validate_spell_status_and_tap(board)
-        adj_hexes = location.find_adjacent_hexes(board, board.get_current_player().hex)
-        # get list of occupied neighbors which are the wrong aura
-        purifiable_hexes = [h for h in adj_hexes if (h.occupant and h.aura != board.faction)]
         # choose from neighbors which are occupied
-        hex = choose_hexes(
+        hex = board.screen.input.choose_hexes(
             board.screen,
-            purifiable_hexes,
+            board.get_spell_targets(self),
             prompt_text = 'Click hex to bless',
             error_text = 'No hexes to Purify',
         )
@@ -138,6 +141,13 @@ class Purify(Spell):
         hex.aura = board.faction
         return self._exit_cast(done=True)
 
+    def find_targets(self, board):
+        if board.get_current_player().hex == None:
+            return []
+        adj_hexes = location.find_adjacent_hexes(board, board.get_current_player().hex)
+        # get list of occupied neighbors which are the wrong aura
+        return [h for h in adj_hexes if (h.occupant and h.aura != board.faction)]
+
 class Imposter(Spell):
     def __init__(self, artwork):
         super(Imposter, self).__init__()
@@ -153,9 +163,9 @@ class Imposter(Spell):
             board.screen.choices.append(True)
 
         # get a linked room.
-        target_room = board.screen.choice(2) or choose_from_list(
+        target_room = board.screen.choice(2) or board.screen.input.choose_from_list(
             board.screen,
-            location.linked_rooms(board, self.artwork.hex),
+            board.get_spell_targets(self),
             prompt_text = 'Choose room to copy to:',
         )
         if target_room == None:
@@ -168,7 +178,7 @@ class Imposter(Spell):
             if len(aura_list) == 0:
                 pass
             elif 'Dark' in aura_list and 'Light' in aura_list:
-                aura = choose_from_list(
+                aura = board.screen.input.choose_from_list(
                     board.screen,
                     ['Dark', 'Light'],
                     prompt_text = 'Choose aura for Shovel:',
@@ -185,6 +195,9 @@ class Imposter(Spell):
             return self._exit_cast(done=True)
         return self._exit_cast(done=False)
 
+    def find_targets(self, board):
+        return location.linked_rooms(board, self.artwork.hex)
+
 class Imprint(Spell):
     def __init__(self):
         super(Imprint, self).__init__()
@@ -230,17 +243,9 @@ class Opportunist(Spell):
     def cast(self, board):
         self._validate_spell_status_and_tap(board)
 
-        rooms_names = [room.color_name() for room in location.linked_rooms(board, self.artwork.hex)]
-
-        eligible_spells = []
-        for spell in board.spells:
-            if spell.faction == board.faction and spell.tapped and \
-                    spell != self and spell.name[0] in rooms_names:
-                eligible_spells.append(spell)
-
-        spell = choose_from_list(
+        spell = board.screen.input.choose_from_list(
             board.screen,
-            eligible_spells,
+            board.get_spell_targets(self),
             prompt_text = 'Choose spell to reuse:',
             error_text = 'There are no linked used spells',
             all_spells = board.spells,
@@ -252,6 +257,16 @@ class Opportunist(Spell):
 
         return self._exit_cast(done=True)
 
+    def find_targets(self, board):
+        rooms_names = [room.color_name() for room in location.linked_rooms(board, self.artwork.hex)]
+
+        eligible_spells = []
+        for spell in board.spells:
+            if spell.faction == board.faction and spell.tapped and \
+                    spell != self and spell.name[0] in rooms_names:
+                eligible_spells.append(spell)
+        return eligible_spells
+
 class Overwork(Spell):
     def __init__(self):
         super(Overwork, self).__init__()
@@ -279,9 +294,9 @@ class Usurper(Spell):
         for i in range(2):
             prev_choice = board.screen.choice(1 + i)
             if prev_choice == None:
-                hex_to_flip = choose_hexes(
+                hex_to_flip = board.screen.input.choose_hexes(
                     board.screen,
-                    location.linked_hexes(board, self.artwork.hex),
+                    board.get_spell_targets(self),
                     prompt_text = 'Click a {} aura to flip'.format(self.faction),
                 )
                 if hex_to_flip == None:
@@ -295,7 +310,7 @@ class Usurper(Spell):
         for i in range(2):
             prev_choice = board.screen.choice(3 + i)
             if prev_choice == None:
-                hex_to_change = board.screen.choice(3 + i) or choose_hexes(
+                hex_to_change = board.screen.choice(3 + i) or board.screen.input.choose_hexes(
                     board.screen,
                     location.adjacent_linked_region(board, self.artwork.hex),
                     prompt_text = 'Click a hex on which to grow',
@@ -306,6 +321,9 @@ class Usurper(Spell):
                 board.flush_aura_data()
         return self._exit_cast(done=True)
 
+    def find_targets(self, board):
+        return location.linked_hexes(board, self.artwork.hex)
+
 class Upset(Spell):
     def __init__(self):
         super(Upset, self).__init__()
@@ -337,9 +355,9 @@ class Stonemason(Spell):
         self._validate_artwork_status(board)
         board.check_game_over = False
 
-        moving_room = board.screen.choice(1) or choose_from_list(
+        moving_room = board.screen.choice(1) or board.screen.input.choose_from_list(
             board.screen,
-            location.linked_rooms(board, self.artwork.hex),
+            board.get_spell_targets(self),
             prompt_text="Choose a linked room to move:"
         )
         if moving_room == None:
@@ -353,7 +371,7 @@ class Stonemason(Spell):
         finished_with_stonemason = False
 
         while not(finished_with_stonemason):
-            key = get_keypress(board.screen)
+            key = board.screen.input.get_keypress(board.screen)
             if key == None:
                 return self._exit_cast(done=False)
             elif key == "return" or key == "Enter":
@@ -383,6 +401,9 @@ class Stonemason(Spell):
         board.check_game_over = True
         return self._exit_cast(done=True)
 
+    def find_targets(self, board):
+        return location.linked_rooms(board, self.artwork.hex)
+
 class Shovel(Spell):
     def __init__(self):
         super(Shovel, self).__init__()
@@ -403,17 +424,9 @@ class Shovel(Spell):
         temp_is_placed = any([room.name == "Temp" for room in board.rooms])
         shovel_room = next((room for room in board.rooms if room.name == "Shovel"), None)
         if not temp_is_placed:
-            player_on_shovel = board.get_current_player().hex.room == shovel_room
-
-            if player_on_shovel:
-                # shovel can move anywhere - get neighbors of the whole board
-                temp_locations = location.find_unoccupied_neighbors(board, board.get_all_hexes())
-            else:
-                # shovel can move to adjacent spots that are empty - get player's neighbors
-                player_hex = board.get_current_player().hex
-                temp_locations = location.find_unoccupied_neighbors(board,[player_hex])
-                if temp_locations == []:
-                    raise InvalidMove("There's nowhere to place the Shovel")
+            temp_locations = board.get_spell_targets(self)
+            if temp_locations == []:
+                raise InvalidMove("There's nowhere to place the Shovel")
 
             # make a temporary room with these locations
             board.rooms.append(Room(
@@ -427,7 +440,7 @@ class Shovel(Spell):
 
         # get the (possibly first-ever) location for the Shovel
         board.flush_hex_data()
-        shovel_hex = choose_hexes(
+        shovel_hex = board.screen.input.choose_hexes(
             board.screen,
             board.rooms[-1].hexes,
             prompt_text = "Choose where the Shovel will go"
@@ -440,12 +453,26 @@ class Shovel(Spell):
         board.rooms.pop()
         if shovel_room:
             shovel_room.hexes[0].location = shovel_location
+            shovel_room.moved()
         else:
             board.rooms.append(self.create_Shovel_room(shovel_location))
 
         board.flush_hex_data()
         return self._exit_cast(done=True)
 
+    # the locations the Shovel can move to
+    def find_targets(self, board):
+        shovel_room = next((room for room in board.rooms if room.name == "Shovel"), None)
+        player_hex = board.get_current_player().hex
+        if player_hex == None:
+            return []
+        elif player_hex.room == shovel_room:
+            # shovel can move anywhere - get the perimeter of the whole board
+            return [location.axial_to_location(axial) for axial in board.get_layout().get_perimeter()]
+        else:
+            # shovel can move to adjacent spots that are empty - get player's neighbors
+            return location.find_unoccupied_neighbors(board, [player_hex])
+
 class Locksmith(Spell):
     def __init__(self, artwork):
         super(Locksmith, self).__init__()
@@ -456,10 +483,6 @@ class Locksmith(Spell):
 
     def cast(self, board):
         self._validate_spell_status_and_tap(board)
-        # get list of linked objects
-        linked_hexes = location.linked_hexes(board, self.artwork.hex)
-        linked_objects = [hex.occupant for hex in linked_hexes if hex.occupant]
-
         # get list of hexes to move to from the board
         target_hexes = [hex for hex in board.get_all_hexes() if not(hex.occupant)]
         if target_hexes == []:
@@ -468,15 +491,15 @@ class Locksmith(Spell):
 
         # choose a linked object to move. There should always be at least one,
         # since we've validated that the Locksmith is on an aura
-        target_object = board.screen.choice(1) or choose_from_list(
+        target_object = board.screen.choice(1) or board.screen.input.choose_from_list(
             board.screen,
-            linked_objects,
+            board.get_spell_targets(self),
             prompt_text='Choose object to move:',
         )
         if target_object == None:
             return self._exit_cast(done=False)
 
-        target_hex = choose_hexes(
+        target_hex = board.screen.input.choose_hexes(
             board.screen,
             target_hexes,
             prompt_text='Click where to move {}'.format(target_object)
@@ -487,6 +510,11 @@ class Locksmith(Spell):
         board.move_object(target_object, from_hex = target_object.hex, to_hex = target_hex)
         return self._exit_cast(done=True)
 
+    # the linked objects
+    def find_targets(self, board):
+        linked_hexes = location.linked_hexes(board, self.artwork.hex)
+        return [hex.occupant for hex in linked_hexes if hex.occupant]
+
 class Leap(Spell):
     def __init__(self):
         super(Leap, self).__init__()
@@ -499,15 +527,9 @@ class Leap(Spell):
 
         current_player = board.get_current_player()
 
-        # get list of leap-able objects
-        leapable_objects = []
-        for obj in board.get_placed_non_player_objects():
-            if location.leap_eligible(board, current_player.hex, obj.hex):
-                leapable_objects.append(obj)
-
-        target_object = choose_from_list(
+        target_object = board.screen.input.choose_from_list(
             board.screen,
-            leapable_objects,
+            board.get_spell_targets(self),
             'Choose an object to Leap with:',
             'There\'s no object to Leap with',
         )
@@ -517,6 +539,15 @@ class Leap(Spell):
         board.swap_object(current_player, target_object)
         return self._exit_cast(done=True)
 
+    # the leap-able objects
+    def find_targets(self, board):
+        current_player = board.get_current_player()
+        leapable_objects = []
+        for obj in board.get_placed_non_player_objects():
+            if location.leap_eligible(board, current_player.hex, obj.hex):
+                leapable_objects.append(obj)
+        return leapable_objects
+
 class Yeoman(Spell):
     def __init__(self, artwork):
         super(Yeoman, self).__init__()
@@ -529,18 +560,18 @@ class Yeoman(Spell):
     def cast(self, board, str=[]):
         self._validate_artwork_status(board)
 
-        linked_rooms = location.linked_rooms(board, self.artwork.hex)
+        linked_rooms = board.get_spell_targets(self)
         while True:
             # check if user is done casting
             board.screen.info.text = "Press enter to stop casting or any other key to contine" # TODO: remove
             board.flush_gamepieces()
-            key = get_keypress(board.screen, enable_buttons = False)
+            key = board.screen.input.get_keypress(board.screen, enable_buttons = False)
             if key == "return" or key == "Enter":
                 board.screen.action_buttons_on = True
                 return self._exit_cast(done=True)
 
             object_locations = [hex for room in linked_rooms for hex in room.hexes if hex.occupant]
-            from_hex = board.screen.choice(1) or choose_hexes(
+            from_hex = board.screen.choice(1) or board.screen.input.choose_hexes(
                 board.screen,
                 object_locations,
                 prompt_text = "Click an object to move or press enter to end",
@@ -549,7 +580,7 @@ class Yeoman(Spell):
                 return self._exit_cast(done=False)
 
             obj = from_hex.occupant
-            to_hex = choose_hexes(
+            to_hex = board.screen.input.choose_hexes(
                 board.screen,
                 from_hex.room.hexes,
                 prompt_text = "Click where to move {}".format(obj),
@@ -572,6 +603,9 @@ class Yeoman(Spell):
                 board.screen.action_buttons_on = True
                 return self._exit_cast(done=True)
 
+    # the rooms whose objects can be rearranged
+    def find_targets(self, board):
+        return location.linked_rooms(board, self.artwork.hex)
 
 class Yoke(Spell):
     def __init__(self):
@@ -585,9 +619,9 @@ class Yoke(Spell):
         current_player = board.get_current_player()
 
         # get target object for yoking
-        target_object = board.screen.choice(1) or choose_from_list(
+        target_object = board.screen.choice(1) or board.screen.input.choose_from_list(
             board.screen,
-            board.get_placed_non_player_objects(),
+            board.get_spell_targets(self),
             'Pick an object to Yoke with:',
             'There is no other object to Yoke',
         )
@@ -597,9 +631,10 @@ class Yoke(Spell):
         # get directions for yolking
         # elements are: (player_destination, target_destination)
         possible_location_data = []
-        for u in location.unit_directions:
-            player_destination = location.find_neighbor_hex(board, current_player.hex, u)
-            target_destination = location.find_neighbor_hex(board, target_object.hex, u)
+        layout = board.get_layout()
+        for player_destination, target_destination in zip(
+                layout.get_neighbors(current_player.hex.location),
+                layout.get_neighbors(target_object.hex.location)):
             player_can_move = player_destination and (
                 not(player_destination.occupant) or player_destination.occupant == target_object
             )
@@ -609,7 +644,7 @@ class Yoke(Spell):
             if (player_can_move and target_can_move):
                 possible_location_data.append((player_destination, target_destination))
         # if there's more than one direction, ask user for input
-        player_direction = choose_hexes(
+        player_direction = board.screen.input.choose_hexes(
             board.screen,
             [x[0] for x in possible_location_data],
             prompt_text = "Choose the destination of the player:",
@@ -627,6 +662,9 @@ class Yoke(Spell):
         board.move_object(target_object, target_object.hex, movement_data[1])
         return self._exit_cast(done=True)
 
+    def find_targets(self, board):
+        return board.get_placed_non_player_objects()
+
 """
 Helper method to place auras on hexes, used in Imposter and Upset.
 
@@ -662,7 +700,7 @@ def place_auras_on_hexes(board, spell, aura_list, hex_list, choice_idx):
     all_auras = deepcopy(auras_to_place)
     for aura in all_auras:
         auras_to_place.remove(aura)
-        new_hex = choose_hexes(
+        new_hex = board.screen.input.choose_hexes(
             board.screen,
             [hex for hex in hex_list if not hex.aura],
             prompt_text = "Click a hex for aura {}.\nAfter this you will place {}".format(
@@ -0,0 +1,697 @@
+"""
+Persistence backends for saved games.
+
+A store saves the state returned by Game.get_game_state(include_metadata=True)
+and gives it back to be rebuilt with Game.from_hash. Game.store holds the
+store in use, which can be picked with store_from_url():
+ - 'json:DIRECTORY' one JSON file per game (the original format)
+ - 'sqlite:PATH' one SQLite database in WAL mode, so it can be shared by
+    several worker processes
+ - 'log:DIRECTORY' an append-only log per game of the inputs of each
+    completed action, with a full snapshot at the end of turns
+Any of these can be wrapped in a WriteBehindStore to save in the background.
+
+All stores implement:
+ - save(game) / write(game_id, state): save a game
+ - load(game_id): return the saved state, or None
+ - load_game(game_id): return the saved Game, or None
+ - exists(game_id), delete(game_id)
+ - list_games(game_over, updated_after, updated_before, limit, offset):
+    metadata of saved games, most recently updated first
+ - flush() / close(): make sure pending writes are on disk
+"""
+import atexit
+import os
+import sqlite3
+import zlib
+from json import dump, dumps, load, loads, JSONDecodeError
+from queue import Queue
+from threading import Condition, RLock, Thread, Timer
+from time import monotonic, perf_counter
+
+METADATA_KEYS = ['game_id', 'created', 'updated', 'game_over', 'start_action']
+
+class Store(object):
+    # whether load_game can rebuild games that are mid setup, mid turn, or
+    # mid spell (Game.from_hash can only rebuild games where can_snapshot())
+    restores_any_state = False
+
+    def save(self, game):
+        self.commit(game.game_id, self.prepare(game))
+
+    # saving is split into prepare(), which captures what needs to be saved
+    # without touching the disk, and commit(), which writes it. This lets
+    # WriteBehindStore run commit() in a background thread.
+    def prepare(self, game):
+        game.events = [] # only used by EventLogStore
+        return game.get_game_state(include_metadata=True)
+
+    def commit(self, game_id, payload):
+        self.write(game_id, payload)
+
+    # combine two prepared payloads for the same game, in order
+    def merge(self, old_payload, new_payload):
+        return new_payload
+
+    def write(self, game_id, state):
+        raise NotImplementedError() # must be overwridden
+
+    def load(self, game_id):
+        raise NotImplementedError() # must be overwridden
+
+    def load_game(self, game_id):
+        from backend.game import Game # imported here to avoid a circular import
+        state = self.load(game_id)
+        if state == None:
+            return None
+        return Game.from_hash(state)
+
+    def exists(self, game_id):
+        return self.load(game_id) != None
+
+    def delete(self, game_id):
+        raise NotImplementedError() # must be overwridden
+
+    def list_games(self, game_over=None, updated_after=None, updated_before=None, limit=None, offset=0, known=None):
+        raise NotImplementedError() # must be overwridden
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def stats(self):
+        return {}
+
+class JsonStore(Store):
+    def __init__(self, directory='saved_games', fsync=False):
+        self.directory = directory
+        self.fsync = fsync
+
+    def filename(self, game_id):
+        return os.path.join(self.directory, '{}.json'.format(game_id))
+
+    def write(self, game_id, state):
+        # write to a temp file and rename so a crash never leaves half a game
+        filepath = self.filename(game_id)
+        temp_path = filepath + '.tmp'
+        with open(temp_path, "w") as file:
+            dump(state, file)
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp_path, filepath)
+
+    def load(self, game_id):
+        filepath = self.filename(game_id)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, "r") as file:
+            return load(file)
+
+    def exists(self, game_id):
+        return os.path.exists(self.filename(game_id))
+
+    def delete(self, game_id):
+        filepath = self.filename(game_id)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+    # known is a hash of game_id to metadata from a previous call, files
+    # that have not changed since then are not parsed again
+    def list_games(self, game_over=None, updated_after=None, updated_before=None, limit=None, offset=0, known=None):
+        known = known or {}
+        games = []
+        for fn in os.listdir(self.directory):
+            if not fn.endswith('.json'):
+                continue
+            filepath = os.path.join(self.directory, fn)
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue # deleted since listdir
+
+            game_id = fn[:-len('.json')]
+            metadata = known.get(game_id)
+            if not metadata or metadata.get('mtime') != stat.st_mtime or metadata.get('size') != stat.st_size:
+                try:
+                    with open(filepath, "r") as file:
+                        metadata = game_metadata(load(file))
+                except (JSONDecodeError, KeyError, OSError) as error:
+                    print('could not read {}: {}'.format(fn, error))
+                    continue
+                metadata.update({'mtime': stat.st_mtime, 'size': stat.st_size})
+            games.append(metadata)
+
+        games = filter_games(games, game_over, updated_after, updated_before)
+        games.sort(key=lambda x: x['updated'], reverse=True)
+        return games[offset:offset + limit if limit else None]
+
+class SqliteStore(Store):
+    # statements are constants so sqlite3's statement cache reuses them
+    CREATE_SQL = [
+        'CREATE TABLE IF NOT EXISTS games ('
+        '  game_id TEXT PRIMARY KEY,'
+        '  created TEXT NOT NULL,'
+        '  updated TEXT NOT NULL,'
+        '  game_over INTEGER NOT NULL,'
+        '  start_action TEXT,'
+        '  state BLOB NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS games_updated ON games (updated)',
+        'CREATE INDEX IF NOT EXISTS games_game_over_updated ON games (game_over, updated)',
+    ]
+    UPSERT_SQL = 'INSERT OR REPLACE INTO games (game_id, created, updated, game_over, start_action, state) VALUES (?, ?, ?, ?, ?, ?)'
+    LOAD_SQL = 'SELECT state FROM games WHERE game_id = ?'
+    EXISTS_SQL = 'SELECT 1 FROM games WHERE game_id = ?'
+    DELETE_SQL = 'DELETE FROM games WHERE game_id = ?'
+    LIST_SQL = 'SELECT game_id, created, updated, game_over, start_action FROM games'
+
+    def __init__(self, path='saved_games.sqlite3', batch_size=20, batch_seconds=1.0, fsync=False):
+        # writes are committed once batch_size are pending or batch_seconds
+        # have passed since the last commit, whichever comes first
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.pending = {} # game_id to row waiting to be committed
+        self.last_commit = monotonic()
+        self.timer = None # commits pending rows if no more writes come in
+        self.lock = RLock()
+
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous={}'.format('FULL' if fsync else 'NORMAL'))
+        for sql in self.CREATE_SQL:
+            self.db.execute(sql)
+
+    def write(self, game_id, state):
+        row = (
+            game_id,
+            state['created'],
+            state['updated'],
+            int(state['game_over']),
+            state.get('start_action'),
+            encode_state(state),
+        )
+        with self.lock:
+            self.pending[game_id] = row
+            if len(self.pending) >= self.batch_size or monotonic() - self.last_commit > self.batch_seconds:
+                self.flush()
+            elif not self.timer:
+                self.timer = Timer(self.batch_seconds, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            if self.pending:
+                rows = list(self.pending.values())
+                self.db.execute('BEGIN IMMEDIATE')
+                try:
+                    self.db.executemany(self.UPSERT_SQL, rows)
+                    self.db.execute('COMMIT')
+                except sqlite3.Error:
+                    self.db.execute('ROLLBACK')
+                    raise
+                self.pending = {}
+            self.last_commit = monotonic()
+
+    def load(self, game_id):
+        with self.lock:
+            if game_id in self.pending:
+                return decode_state(self.pending[game_id][-1])
+            row = self.db.execute(self.LOAD_SQL, (game_id,)).fetchone()
+        return decode_state(row[0]) if row else None
+
+    def exists(self, game_id):
+        with self.lock:
+            if game_id in self.pending:
+                return True
+            return self.db.execute(self.EXISTS_SQL, (game_id,)).fetchone() != None
+
+    def delete(self, game_id):
+        with self.lock:
+            self.pending.pop(game_id, None)
+            self.db.execute(self.DELETE_SQL, (game_id,))
+
+    def list_games(self, game_over=None, updated_after=None, updated_before=None, limit=None, offset=0, known=None):
+        self.flush()
+
+        conditions, params = [], []
+        if game_over != None:
+            conditions.append('game_over = ?')
+            params.append(int(game_over))
+        if updated_after:
+            conditions.append('updated >= ?')
+            params.append(updated_after)
+        if updated_before:
+            conditions.append('updated < ?')
+            params.append(updated_before)
+
+        sql = self.LIST_SQL
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY updated DESC LIMIT ? OFFSET ?'
+        params += [limit if limit else -1, offset]
+
+        with self.lock:
+            rows = self.db.execute(sql, params).fetchall()
+        return [{
+            'game_id': row[0],
+            'created': row[1],
+            'updated': row[2],
+            'game_over': bool(row[3]),
+            'start_action': row[4],
+        } for row in rows]
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
+class EventLogStore(Store):
+    """
+    Each game has a JSON lines file with these records:
+     - {'type': 'game', 'game_id', 'created'}: first line of the file
+     - {'type': 'event', 'seq', 'time', 'data'}: the request data of an
+        action, passed to Game.do_action again to replay it
+     - {'type': 'snapshot', 'seq', 'state'}: get_game_state(include_metadata=True)
+        after the event numbered seq
+
+    Snapshots can only be rebuilt by Game.from_hash between turns, so they
+    are written every snapshot_every turns and when the game ends. Loading
+    a game replays the events after the latest snapshot. Once a log has more
+    than compact_after snapshots, older snapshots are removed in a
+    background thread. Events are never removed, so a game can be rebuilt
+    as of any event with load_game(game_id, seq).
+    """
+    restores_any_state = True
+
+    def __init__(self, directory='saved_logs', snapshot_every=1, compact_after=5, fsync=False):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.compact_after = compact_after
+        self.fsync = fsync
+        self.logs = {} # game_id to hash of seq, snapshots, turns since last snapshot
+        self.lock = RLock()
+        self.compact_queue = Queue()
+        self.compactor = None
+        os.makedirs(directory, exist_ok=True)
+
+    def filename(self, game_id):
+        return os.path.join(self.directory, '{}.log'.format(game_id))
+
+    def prepare(self, game):
+        events, game.events = game.events, []
+        with self.lock:
+            log = self._log_info(game.game_id)
+            records = []
+            if not log['started']:
+                records.append({'type': 'game', 'game_id': game.game_id, 'created': game.created})
+                log['started'] = True
+
+            for event in events:
+                log['seq'] += 1
+                records.append({'type': 'event', 'seq': log['seq'], 'time': event['time'], 'data': event['data']})
+
+            if events and (game.can_snapshot() or game.current_board.game_over):
+                log['turns'] += 1
+                if log['turns'] >= self.snapshot_every or game.current_board.game_over:
+                    records.append({
+                        'type': 'snapshot',
+                        'seq': log['seq'],
+                        'state': game.get_game_state(include_metadata=True),
+                    })
+                    log['turns'] = 0
+        return records
+
+    def commit(self, game_id, records):
+        with self.lock:
+            self._append(game_id, records)
+            log = self._log_info(game_id)
+            log['snapshots'] += len([record for record in records if record['type'] == 'snapshot'])
+            if log['snapshots'] > self.compact_after:
+                self.compact_in_background(game_id)
+
+    def merge(self, old_records, new_records):
+        return old_records + new_records
+
+    def write(self, game_id, state):
+        # used to copy games in from other stores
+        with self.lock:
+            log = self._log_info(game_id)
+            records = []
+            if not log['started']:
+                records.append({'type': 'game', 'game_id': game_id, 'created': state['created']})
+                log['started'] = True
+            records.append({'type': 'snapshot', 'seq': log['seq'], 'state': state})
+            self.commit(game_id, records)
+
+    def load(self, game_id):
+        game = self.load_game(game_id)
+        if game == None:
+            return None
+        return game.get_game_state(include_metadata=True)
+
+    # rebuild a game from its latest snapshot and the events after it, or
+    # as of event number seq if it is given
+    def load_game(self, game_id, seq=None):
+        from backend.game import Game # imported here to avoid a circular import
+        records = self._read(game_id)
+        if not records:
+            return None
+
+        snapshot = None
+        events = []
+        for record in records[1:]:
+            if seq != None and record['seq'] > seq:
+                break
+            elif record['type'] == 'snapshot':
+                snapshot = record
+                events = []
+            else:
+                events.append(record)
+
+        if snapshot:
+            game = Game.from_hash(snapshot['state'])
+        else:
+            game = Game(game_id)
+            game.created = records[0]['created']
+
+        game.replaying = True
+        for event in events:
+            game.do_action(dict(event['data']))
+        game.replaying = False
+        if events:
+            game.updated = events[-1]['time']
+
+        return game
+
+    def exists(self, game_id):
+        return os.path.exists(self.filename(game_id))
+
+    def delete(self, game_id):
+        with self.lock:
+            self.logs.pop(game_id, None)
+            filepath = self.filename(game_id)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+    def list_games(self, game_over=None, updated_after=None, updated_before=None, limit=None, offset=0, known=None):
+        known = known or {}
+        games = []
+        for fn in os.listdir(self.directory):
+            if not fn.endswith('.log'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, fn))
+            except OSError:
+                continue # deleted since listdir
+
+            game_id = fn[:-len('.log')]
+            metadata = known.get(game_id)
+            if not metadata or metadata.get('mtime') != stat.st_mtime or metadata.get('size') != stat.st_size:
+                records = self._read(game_id)
+                if not records:
+                    continue
+                metadata = log_metadata(records)
+                metadata.update({'mtime': stat.st_mtime, 'size': stat.st_size})
+            games.append(metadata)
+
+        games = filter_games(games, game_over, updated_after, updated_before)
+        games.sort(key=lambda x: x['updated'], reverse=True)
+        return games[offset:offset + limit if limit else None]
+
+    # rewrite a game's log without the snapshots older than the latest one
+    def compact(self, game_id):
+        with self.lock:
+            records = self._read(game_id)
+            snapshot_idxs = [idx for idx, record in enumerate(records) if record['type'] == 'snapshot']
+            if len(snapshot_idxs) < 2:
+                return
+
+            latest = snapshot_idxs[-1]
+            records = [record for idx, record in enumerate(records) if record['type'] != 'snapshot' or idx == latest]
+            filepath = self.filename(game_id)
+            temp_path = filepath + '.tmp'
+            with open(temp_path, "w") as file:
+                file.write(''.join(dumps(record, separators=(',', ':')) + '\n' for record in records))
+            os.replace(temp_path, filepath)
+            self._log_info(game_id)['snapshots'] = 1
+
+    def compact_in_background(self, game_id):
+        if not self.compactor:
+            self.compactor = Thread(target=self._compact_loop, name='log-compactor', daemon=True)
+            self.compactor.start()
+        self.compact_queue.put(game_id)
+
+    ############################
+    # INTERNAL METHODS
+    ############################
+
+    def _compact_loop(self):
+        while True:
+            game_id = self.compact_queue.get()
+            try:
+                self.compact(game_id)
+            except (OSError, ValueError) as error:
+                print('[{}] could not compact log: {}'.format(game_id, error))
+
+    def _log_info(self, game_id):
+        if game_id not in self.logs:
+            records = self._read(game_id)
+            snapshots = [record for record in records if record['type'] == 'snapshot']
+            self.logs[game_id] = {
+                'started': bool(records), # whether the 'game' record was written
+                'seq': records[-1].get('seq', 0) if records else 0,
+                'snapshots': len(snapshots),
+                'turns': 0,
+            }
+        return self.logs[game_id]
+
+    def _read(self, game_id):
+        filepath = self.filename(game_id)
+        if not os.path.exists(filepath):
+            return []
+        with open(filepath, "r") as file:
+            # skip a partly written last line, left if the server died mid write
+            records = []
+            for line in file:
+                try:
+                    records.append(loads(line))
+                except JSONDecodeError:
+                    break
+            return records
+
+    def _append(self, game_id, records):
+        if not records:
+            return
+        with open(self.filename(game_id), "a") as file:
+            file.write(''.join(dumps(record, separators=(',', ':')) + '\n' for record in records))
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+
+class WriteBehindStore(Store):
+    """
+    Wraps another store so saves return right away: save() only runs the
+    store's prepare() and marks the game dirty. A background thread commits
+    dirty games every interval seconds, coalescing multiple saves of the
+    same game into one write, then flushes the store once for the group.
+    Pending saves are flushed before a game is loaded, and by close() (which
+    runs at exit) if flush_on_shutdown, otherwise close() drops them.
+    """
+    def __init__(self, store, interval=1.0, flush_on_shutdown=True):
+        self.store = store
+        self.interval = interval
+        self.flush_on_shutdown = flush_on_shutdown
+        self.restores_any_state = store.restores_any_state
+
+        self.dirty = {} # game_id to payload waiting to be committed
+        self.cond = Condition()
+        self.flush_lock = RLock() # held while committing so writes stay in order
+        self.closed = False
+
+        # metrics
+        self.saves = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_games = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.last_flush_seconds = 0
+        self.max_flush_seconds = 0
+        self.total_flush_seconds = 0
+
+        self.thread = Thread(target=self._run, name='write-behind', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def save(self, game):
+        payload = self.store.prepare(game)
+        with self.cond:
+            if game.game_id in self.dirty:
+                payload = self.store.merge(self.dirty[game.game_id], payload)
+                self.coalesced += 1
+            self.dirty[game.game_id] = payload
+            self.saves += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self.dirty))
+
+    def write(self, game_id, state):
+        self.flush_game(game_id)
+        self.store.write(game_id, state)
+
+    def load(self, game_id):
+        self.flush_game(game_id)
+        return self.store.load(game_id)
+
+    def load_game(self, game_id):
+        self.flush_game(game_id)
+        return self.store.load_game(game_id)
+
+    def exists(self, game_id):
+        return game_id in self.dirty or self.store.exists(game_id)
+
+    def delete(self, game_id):
+        with self.flush_lock:
+            with self.cond:
+                self.dirty.pop(game_id, None)
+            self.store.delete(game_id)
+
+    def list_games(self, *args, **kwargs):
+        self.flush()
+        return self.store.list_games(*args, **kwargs)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.cond:
+                dirty, self.dirty = self.dirty, {}
+            if not dirty:
+                return
+
+            start = perf_counter()
+            for game_id, payload in dirty.items():
+                self._commit(game_id, payload)
+            self.store.flush()
+            seconds = perf_counter() - start
+
+            self.flushes += 1
+            self.flushed_games += len(dirty)
+            self.last_flush_seconds = seconds
+            self.max_flush_seconds = max(self.max_flush_seconds, seconds)
+            self.total_flush_seconds += seconds
+
+    def flush_game(self, game_id):
+        with self.flush_lock:
+            with self.cond:
+                payload = self.dirty.pop(game_id, None)
+            if payload != None:
+                self._commit(game_id, payload)
+                self.store.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        if self.flush_on_shutdown:
+            self.flush()
+        elif self.dirty:
+            print('dropping unsaved changes to {} games'.format(len(self.dirty)))
+        self.store.close()
+
+    def stats(self):
+        return dict(self.store.stats(), **{
+            'write_behind_queue_depth': len(self.dirty),
+            'write_behind_max_queue_depth': self.max_queue_depth,
+            'write_behind_saves': self.saves,
+            'write_behind_coalesced': self.coalesced,
+            'write_behind_flushes': self.flushes,
+            'write_behind_flushed_games': self.flushed_games,
+            'write_behind_errors': self.errors,
+            'write_behind_last_flush_seconds': self.last_flush_seconds,
+            'write_behind_max_flush_seconds': self.max_flush_seconds,
+            'write_behind_avg_flush_seconds': self.total_flush_seconds / self.flushes if self.flushes else None,
+        })
+
+    ############################
+    # INTERNAL METHODS
+    ############################
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self.closed:
+                    self.cond.wait(self.interval)
+                if self.closed:
+                    return # close() flushes, if it should
+            self.flush()
+
+    def _commit(self, game_id, payload):
+        try:
+            self.store.commit(game_id, payload)
+        except Exception as error:
+            # put the payload back in front of newer saves to retry next flush
+            print('[{}] could not save game: {}'.format(game_id, error))
+            self.errors += 1
+            with self.cond:
+                if game_id in self.dirty:
+                    payload = self.store.merge(payload, self.dirty[game_id])
+                self.dirty[game_id] = payload
+
+# return a store from a url like 'json:saved_games' or 'sqlite:games.sqlite3'
+def store_from_url(url, fsync=False):
+    kind, _, path = url.partition(':')
+    if kind == 'json':
+        return JsonStore(path or 'saved_games', fsync=fsync)
+    elif kind == 'sqlite':
+        return SqliteStore(path or 'saved_games.sqlite3', fsync=fsync)
+    elif kind == 'log':
+        return EventLogStore(path or 'saved_logs', fsync=fsync)
+    else:
+        raise ValueError('Unknown game store "{}"'.format(url))
+
+# copy all games from one store to another, returns the number of games copied
+def migrate(from_store, to_store):
+    n_games = 0
+    for metadata in from_store.list_games():
+        state = from_store.load(metadata['game_id'])
+        if state:
+            to_store.write(metadata['game_id'], state)
+            n_games += 1
+    to_store.flush()
+    return n_games
+
+def game_metadata(state):
+    return {key: state.get(key) for key in METADATA_KEYS}
+
+# metadata from the records of an EventLogStore log
+def log_metadata(records):
+    last = records[-1]
+    if last['type'] == 'snapshot':
+        return game_metadata(last['state'])
+    return {
+        'game_id': records[0]['game_id'],
+        'created': records[0]['created'],
+        'updated': last.get('time', records[0]['created']),
+        'game_over': False,
+        'start_action': None,
+    }
+
+def filter_games(games, game_over=None, updated_after=None, updated_before=None):
+    return [
+        game for game in games
+        if (game_over == None or game['game_over'] == game_over)
+        and (not updated_after or game['updated'] >= updated_after)
+        and (not updated_before or game['updated'] < updated_before)
+    ]
+
+def encode_state(state):
+    return zlib.compress(dumps(state, separators=(',', ':')).encode())
+
+def decode_state(blob):
+    return loads(zlib.decompress(blob).decode())
@@ -0,0 +1,111 @@
+"""
+Compare the json save format with the binary one (see
+backend/binary_format.py): size, save time and load time, and check that
+both rebuild the same game state.
+
+The corpus is every json file in saved_games/ plus the states of games
+played with the random policy of heroku/loadtest.py, one state per request,
+plus new games with a room pushed far off the board during setup
+(EDGE_DISTANCES), which must also survive a round trip.
+
+run with: python -m benchmarks.binary_format [N_GAMES]
+"""
+import argparse
+import contextlib
+import glob
+import io
+import random
+import tempfile
+import zlib
+from json import dumps, load, loads
+from sys import argv
+from threading import Event
+from time import perf_counter
+
+import numpy as np
+
+import heroku.app as server
+from backend.game import Game
+from backend.store import JsonStore
+from heroku.loadtest import GameSession, Results
+from heroku.replay import FlaskClient
+
+class CorpusClient(FlaskClient):
+    # records the saved state of the game after every request
+    def __init__(self, app, corpus):
+        super().__init__(app)
+        self.corpus = corpus
+
+    def post(self, payload):
+        response = super().post(payload)
+        game = server.GAMES.games.get(payload['game_id'])
+        if game:
+            self.corpus.append(game.get_game_state(include_metadata=True))
+        return response
+
+def build_corpus(n_games):
+    corpus = []
+    for path in glob.glob('saved_games/*.json'):
+        with open(path, "r") as file:
+            corpus.append(load(file))
+
+    args = argparse.Namespace(policy='random', poll_seconds=0, think_seconds=0, max_turns=20)
+    with tempfile.TemporaryDirectory() as directory:
+        Game.store = JsonStore(directory)
+        server.INDEX.path = directory + '/games.index'
+        client = CorpusClient(server.app, corpus)
+        results = Results()
+        for idx in range(n_games):
+            GameSession(client, 'corpus{}'.format(idx), results, args, random.Random(idx)).play(Event())
+    return corpus
+
+# how far a room is pushed from the board in the edge states, rooms have no
+# bounds during setup
+EDGE_DISTANCES = [127, 128, -128, -129, 1000, -1000, 32767 - 10, -32768 + 10]
+
+def edge_states():
+    states = []
+    for distance in EDGE_DISTANCES:
+        for direction in [np.matrix([1,0,-1]), np.matrix([0,1,-1])]:
+            game = Game('edge')
+            game.current_board.rooms[0].translate(distance * direction)
+            states.append(game.get_game_state(include_metadata=True))
+    return states
+
+def time_per_item(function, items):
+    start = perf_counter()
+    for item in items:
+        function(item)
+    return (perf_counter() - start) / len(items)
+
+if __name__ == "__main__":
+    n_games = int(argv[1]) if len(argv) > 1 else 10
+
+    with contextlib.redirect_stdout(io.StringIO()): # hide game logging
+        corpus = build_corpus(n_games) + edge_states()
+        games = [Game.from_hash(loads(dumps(state))) for state in corpus]
+        json_texts = [dumps(state) for state in corpus]
+        binaries = [game.to_bytes() for game in games]
+
+        # both formats must rebuild the same state
+        mismatches = 0
+        for state, data in zip(corpus, binaries):
+            from_json = Game.from_hash(loads(dumps(state))).get_game_state(include_metadata=True)
+            from_binary = Game.from_bytes(data).get_game_state(include_metadata=True)
+            mismatches += from_json != from_binary
+
+        save_json = time_per_item(lambda game: dumps(game.get_game_state(include_metadata=True)), games)
+        save_binary = time_per_item(lambda game: game.to_bytes(), games)
+        load_json = time_per_item(lambda text: Game.from_hash(loads(text)), json_texts)
+        load_binary = time_per_item(Game.from_bytes, binaries)
+
+    json_size = sum(len(text) for text in json_texts) / len(corpus)
+    zlib_size = sum(len(zlib.compress(text.encode())) for text in json_texts) / len(corpus)
+    binary_size = sum(len(data) for data in binaries) / len(corpus)
+
+    print('{} game states, {} rebuilt differently'.format(len(corpus), mismatches))
+    print('{:>8}: {:>7.0f} bytes'.format('json', json_size))
+    print('{:>8}: {:>7.0f} bytes'.format('json+zlib', zlib_size))
+    print('{:>8}: {:>7.0f} bytes ({:.1f}x smaller than json)'.format('binary', binary_size, json_size / binary_size))
+    print('save: json {:.3f}ms, binary {:.3f}ms ({:.1f}x)'.format(1000 * save_json, 1000 * save_binary, save_json / save_binary))
+    print('load: json {:.3f}ms, binary {:.3f}ms ({:.1f}x)'.format(1000 * load_json, 1000 * load_binary, load_json / load_binary))
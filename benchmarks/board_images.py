@@ -0,0 +1,59 @@
+"""
+Time for concurrent requests to /<game_id>/image.png that all miss the
+ImageCache (graphics/board_image.py), for boards from games played with the
+random policy of heroku/loadtest.py, each thread asking for its own boards:
+ - request thread: drawn in the thread that asked, one at a time
+ - pool: drawn in RENDER_PROCESSES render processes (at least 2 here), which
+   can only draw in parallel with more than one cpu
+Then every thread asks for the same new board, which the pool should only
+draw once.
+
+run with: python -m benchmarks.board_images [N_GAMES] [N_THREADS]
+"""
+import contextlib
+import io
+from sys import argv
+from threading import Thread
+from time import perf_counter
+
+from benchmarks.binary_format import build_corpus
+from graphics.board_image import ImageCache, RENDER_PROCESSES, state_to_board_bytes
+
+# each thread gets every n_threads-th board, returns the seconds to get them all
+# and the slowest single get
+def time_gets(cache, boards, n_threads):
+    slowest = [0]
+    def get_all(shard):
+        for board_bytes in shard:
+            start = perf_counter()
+            cache.get(board_bytes)
+            slowest[0] = max(slowest[0], perf_counter() - start)
+
+    threads = [Thread(target=get_all, args=(boards[idx::n_threads],)) for idx in range(n_threads)]
+    start = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return perf_counter() - start, slowest[0]
+
+if __name__ == "__main__":
+    n_games = int(argv[1]) if len(argv) > 1 else 5
+    n_threads = int(argv[2]) if len(argv) > 2 else 4
+
+    with contextlib.redirect_stdout(io.StringIO()): # hide game logging
+        corpus = build_corpus(n_games)
+    boards = list({state_to_board_bytes(state): True for state in corpus})
+
+    pooled = ImageCache()
+    pooled.start(max(2, RENDER_PROCESSES)) # before any threads, as in heroku/app.py
+    for name, cache in [('request thread', ImageCache()), ('pool', pooled)]:
+        cache.get(boards[-1]) # start pygame before timing
+        seconds, slowest = time_gets(cache, boards[:-1], n_threads)
+        print('{:>14}: {} boards in {:.2f}s, {:.1f}ms per board, slowest request {:.0f}ms'.format(
+            name, len(boards) - 1, seconds, 1000 * seconds / (len(boards) - 1), 1000 * slowest))
+
+    pooled.images.clear()
+    time_gets(pooled, boards[:1] * n_threads, n_threads)
+    print('{:>14}: {} renders for {} requests of one board'.format('same board', pooled.stats()['image_renders'] - len(boards), n_threads))
+    pooled.close()
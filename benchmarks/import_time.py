@@ -0,0 +1,57 @@
+"""
+Cold start of the server: the time to import heroku.app, as reported by
+python -X importtime, and the memory of the process afterwards, with the
+backend importing only the js frontend (as it does now) and with pygame
+imported too (as it was when backend/spell.py and backend/game.py imported
+both frontends).
+
+Each run is a fresh interpreter so nothing is cached between runs, apart
+from the bytecode on disk.
+
+run with: python -m benchmarks.import_time [N_RUNS]
+"""
+import os
+import subprocess
+import sys
+from statistics import median
+
+SETUPS = [
+    ('server', 'import heroku.app'),
+    ('server + pygame', 'import graphics.pygame_screen, heroku.app'),
+]
+
+REPORT = (
+    "import resource, sys;"
+    "print('maxrss', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss);"
+    "print('pygame', 'pygame' in sys.modules)"
+)
+
+# returns the total import time in seconds, the max rss in KB and
+# whether pygame was imported
+def run(code):
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', PYGAME_HIDE_SUPPORT_PROMPT='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code + '\n' + REPORT],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    # lines are "import time: self [us] | cumulative | imported package",
+    # top level imports are the ones not indented
+    total = 0
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            cumulative, name = line.split('|')[1:3]
+            if cumulative.strip().isdigit() and not name.startswith('  '):
+                total += int(cumulative)
+    report = dict(line.split(' ', 1) for line in result.stdout.splitlines() if ' ' in line)
+    return total / 1e6, int(report['maxrss']), report['pygame'] == 'True'
+
+if __name__ == "__main__":
+    n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    run(SETUPS[-1][1]) # write bytecode before timing
+    for name, code in SETUPS:
+        runs = [run(code) for _ in range(n_runs)]
+        seconds = median(r[0] for r in runs)
+        maxrss = median(r[1] for r in runs)
+        print('{:>16}: {:.0f}ms imports, {:.1f}MB max rss, pygame imported: {}'.format(
+            name, 1000 * seconds, maxrss / 1024, runs[0][2]))
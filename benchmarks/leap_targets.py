@@ -0,0 +1,78 @@
+"""
+Time to find the objects the current player can Leap with (Leap.find_targets)
+on boards from the middle of games played with the random policy of
+heroku/loadtest.py:
+ - rays: looked up in the board's Layout (backend/location.py)
+ - new layout: the Layout built first, as after a room moves
+ - scan: walking each row with a search of all hexes per position, as
+   leap_eligible used to, which must find the same objects
+
+run with: python -m benchmarks.leap_targets [N_GAMES]
+"""
+import contextlib
+import io
+from json import dumps, loads
+from sys import argv
+from time import perf_counter
+
+import numpy as np
+from backend.game import Game
+from backend.location import unit_directions
+from benchmarks.binary_format import build_corpus
+
+def scan_find_hex(board, location):
+    for test_hex in board.get_all_hexes():
+        if (test_hex.location == location).all():
+            return test_hex
+    return None
+
+def scan_leap_eligible(board, hex1, hex2):
+    if hex1 == hex2:
+        return False
+    displacement = hex1.location - hex2.location
+    number_of_tiles = np.gcd.reduce([x for x in displacement.flat if x != 0])
+    u = (1/number_of_tiles) * displacement
+    if all([(u-x).any() for x in unit_directions]):
+        return False
+    for i in range(number_of_tiles):
+        if not scan_find_hex(board, hex2.location + i*u):
+            return False
+    return True
+
+def scan_leap_targets(board):
+    player_hex = board.get_current_player().hex
+    return [obj for obj in board.get_placed_non_player_objects() if scan_leap_eligible(board, player_hex, obj.hex)]
+
+def leap_targets(board):
+    return board.spells[11].find_targets(board)
+
+def new_layout_leap_targets(board):
+    board.layout_key = None
+    return leap_targets(board)
+
+def time_boards(function, boards):
+    start = perf_counter()
+    for board in boards:
+        function(board)
+    return (perf_counter() - start) / len(boards)
+
+if __name__ == "__main__":
+    n_games = int(argv[1]) if len(argv) > 1 else 10
+
+    with contextlib.redirect_stdout(io.StringIO()): # hide game logging
+        corpus = build_corpus(n_games)
+        boards = [Game.from_hash(loads(dumps(state))).current_board for state in corpus]
+    # mid game: both players placed and some artworks out
+    boards = [
+        board for board in boards
+        if all(player.hex for player in board.players.values()) and len(board.get_placed_objects()) > 3
+    ]
+
+    mismatches = sum(leap_targets(board) != scan_leap_targets(board) for board in boards)
+    n_objects = sum(len(board.get_placed_non_player_objects()) for board in boards) / len(boards)
+    n_targets = sum(len(leap_targets(board)) for board in boards) / len(boards)
+    print('{} boards, {:.1f} objects and {:.1f} Leap targets per board, {} mismatches'.format(
+        len(boards), n_objects, n_targets, mismatches))
+
+    for name, function in [('rays', leap_targets), ('new layout', new_layout_leap_targets), ('scan', scan_leap_targets)]:
+        print('{:>10}: {:.3f}ms per board'.format(name, 1000 * time_boards(function, boards)))
@@ -0,0 +1,119 @@
+"""
+Frame times of the pygame frontend (graphics/pygame_screen.py), without
+waiting for input, for:
+ - idle: no input and nothing changing, should draw nothing
+ - hover: the mouse moving across the board every frame
+ - full: the whole window drawn every frame, as before dirty rects
+ - room move: a room moved a step, as during setup, with the board layer
+   updated where the room moved and with every tile made and drawn again
+
+The text cache (graphics/fonts.py) is checked to render no text once the
+hover labels have been seen.
+
+Then the CPU used while waiting for a keypress and the time from the key
+being pressed to get_keypress returning, for the event driven loop (which
+waits in pg.event.wait only on WAIT_DRIVERS and otherwise polls at IDLE_FPS)
+and for frames paced at FPS (how the loop used to spin).
+
+Runs on SDL's dummy video driver unless SDL_VIDEODRIVER is set.
+
+run with: python -m benchmarks.pygame_frames [N_FRAMES] [N_KEYS]
+"""
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import random
+from sys import argv
+from threading import Thread
+from time import perf_counter, process_time, sleep
+
+import pygame as pg
+import graphics.pygame_input as pygame_input
+from backend.board import Board
+from graphics.fonts import TEXTS
+from graphics.pygame_screen import IDLE_FPS, HexTile, PygameScreen
+
+def frame(screen):
+    for event in pg.event.get():
+        screen.handle_event(event)
+    screen.update()
+    screen.render()
+
+def time_frames(screen, n_frames, before_frame):
+    start = perf_counter()
+    for idx in range(n_frames):
+        before_frame(idx)
+        frame(screen)
+    return (perf_counter() - start) / n_frames
+
+# press a key after a random delay, n_keys times, returns the cpu
+# fraction used while waiting and the average keypress latency
+def time_keypresses(screen, n_keys):
+    pressed = []
+    def press_keys():
+        rng = random.Random(0)
+        for _ in range(n_keys):
+            sleep(rng.uniform(0.05, 0.25))
+            pressed.append(perf_counter())
+            pg.event.post(pg.event.Event(pg.KEYDOWN, key=pg.K_a, mod=0, unicode='a', scancode=4))
+
+    thread = Thread(target=press_keys)
+    latencies = []
+    start_wall, start_cpu = perf_counter(), process_time()
+    thread.start()
+    for _ in range(n_keys):
+        pygame_input.get_keypress(screen)
+        latencies.append(perf_counter() - pressed[-1])
+    thread.join()
+    cpu = (process_time() - start_cpu) / (perf_counter() - start_wall)
+    return cpu, sum(latencies) / n_keys
+
+if __name__ == "__main__":
+    n_frames = int(argv[1]) if len(argv) > 1 else 500
+    n_keys = int(argv[2]) if len(argv) > 2 else 20
+
+    screen = PygameScreen()
+    board = Board(screen)
+    board.flush_hex_data()
+    board.flush_gamepieces()
+    frame(screen)
+
+    # walk the mouse back and forth over the middle of the board
+    x, y = screen.screen_rect.center
+    def move_mouse(idx):
+        pos = (x - 150 + 3 * (idx % 100), y + (idx % 7))
+        pg.event.post(pg.event.Event(pg.MOUSEMOTION, pos=pos, rel=(3, 0), buttons=(0, 0, 0)))
+    def redraw_all(idx):
+        screen.full_redraw = True
+
+    # move the first room back and forth
+    room = board.rooms[0]
+    def move_room(idx):
+        room.keyboard_movement('left' if idx % 2 else 'right')
+        board.flush_hex_data()
+    def move_room_rebuild(idx):
+        HexTile.images = {}
+        screen.board_layer = None
+        move_room(idx)
+
+    idle = time_frames(screen, n_frames, lambda idx: None)
+    hover = time_frames(screen, n_frames, move_mouse)
+    full = time_frames(screen, n_frames, redraw_all)
+    room_move = time_frames(screen, n_frames, move_room)
+    room_rebuild = time_frames(screen, n_frames, move_room_rebuild)
+
+    for name, seconds in [('idle', idle), ('hover', hover), ('full', full), ('room move', room_move), ('room move, rebuild', room_rebuild)]:
+        print('{:>18}: {:.3f}ms per frame ({:.0f} fps)'.format(name, 1000 * seconds, 1 / seconds))
+
+    # everything has been rendered once, hovering again should only hit the cache
+    TEXTS.reset_stats()
+    time_frames(screen, n_frames, move_mouse)
+    stats = TEXTS.stats()
+    print('{:>18}: {} texts rendered, {:.0%} cache hits'.format('steady hover', stats['text_misses'], stats['text_hit_rate']))
+
+    idle_name = 'event wait' if screen.blocking_wait else 'idle {} fps'.format(IDLE_FPS)
+    for name, animating in [(idle_name, False), ('{} fps'.format(screen.fps), True)]:
+        screen.animating = animating
+        cpu, latency = time_keypresses(screen, n_keys)
+        print('{:>18}: {:.1f}% cpu while waiting, {:.1f}ms keypress latency'.format(name, 100 * cpu, 1000 * latency))
+    pg.quit()
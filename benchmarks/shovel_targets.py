@@ -0,0 +1,59 @@
+"""
+Time to find where the Shovel can go from the Shovel (the perimeter of the
+board, see Layout.get_perimeter in backend/location.py) on boards from games
+played with the random policy of heroku/loadtest.py:
+ - perimeter: kept by the board's Layout
+ - new layout: the Layout built first, as after a room or the Shovel moves
+ - scan: a search of all hexes for each neighbor of each hex, as Shovel
+   used to, which found each location up to three times. It must find the
+   same locations.
+
+run with: python -m benchmarks.shovel_targets [N_GAMES]
+"""
+import contextlib
+import io
+from json import dumps, loads
+from sys import argv
+
+from backend.game import Game
+from backend.location import axial_to_location, location_to_axial, unit_directions
+from benchmarks.binary_format import build_corpus
+from benchmarks.leap_targets import scan_find_hex, time_boards
+
+def scan_perimeter(board):
+    unoccupied_locations = []
+    for hex in board.get_all_hexes():
+        for u in unit_directions:
+            if not scan_find_hex(board, hex.location + u):
+                unoccupied_locations.append(hex.location + u)
+    return unoccupied_locations
+
+def perimeter(board):
+    return [axial_to_location(axial) for axial in board.get_layout().get_perimeter()]
+
+def new_layout_perimeter(board):
+    board.layout_key = None
+    return perimeter(board)
+
+def axials(locations):
+    return [tuple(int(x) for x in location_to_axial(location)) for location in locations]
+
+if __name__ == "__main__":
+    n_games = int(argv[1]) if len(argv) > 1 else 10
+
+    with contextlib.redirect_stdout(io.StringIO()): # hide game logging
+        corpus = build_corpus(n_games)
+        boards = [Game.from_hash(loads(dumps(state))).current_board for state in corpus]
+
+    mismatches = 0
+    n_scanned = n_unique = 0
+    for board in boards:
+        scanned, found = axials(scan_perimeter(board)), axials(perimeter(board))
+        mismatches += set(scanned) != set(found) or len(set(found)) != len(found)
+        n_scanned += len(scanned)
+        n_unique += len(found)
+    print('{} boards, {:.1f} Shovel locations per board, {:.1f} with duplicates, {} mismatches'.format(
+        len(boards), n_unique / len(boards), n_scanned / len(boards), mismatches))
+
+    for name, function in [('perimeter', perimeter), ('new layout', new_layout_perimeter), ('scan', scan_perimeter)]:
+        print('{:>10}: {:.3f}ms per board'.format(name, 1000 * time_boards(function, boards)))
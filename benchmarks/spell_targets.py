@@ -0,0 +1,43 @@
+"""
+Time to find the castable spells and their targets (see
+Board.get_castable_spells) for the states of games played with the random
+policy of heroku/loadtest.py: once for a new state, and again for the same
+state, as for a poll or a repeated prompt, which should only cost the
+fingerprint.
+
+run with: python -m benchmarks.spell_targets [N_GAMES]
+"""
+import contextlib
+import io
+from json import dumps, loads
+from sys import argv
+from time import perf_counter
+
+from backend.game import Game
+from benchmarks.binary_format import build_corpus
+
+def time_boards(function, boards):
+    start = perf_counter()
+    for board in boards:
+        function(board)
+    return (perf_counter() - start) / len(boards)
+
+if __name__ == "__main__":
+    n_games = int(argv[1]) if len(argv) > 1 else 10
+
+    with contextlib.redirect_stdout(io.StringIO()): # hide game logging
+        corpus = build_corpus(n_games)
+        boards = [Game.from_hash(loads(dumps(state))).current_board for state in corpus]
+    boards = [board for board in boards if board.get_eligible_spells()]
+
+    def new_state(board):
+        board.spell_targets_key = None
+        board.get_castable_spells()
+
+    cold = time_boards(new_state, boards)
+    warm = time_boards(lambda board: board.get_castable_spells(), boards)
+    n_castable = sum(len(board.get_castable_spells()) for board in boards) / len(boards)
+
+    print('{} boards with spells to cast, {:.1f} castable spells per board'.format(len(boards), n_castable))
+    print('{:>10}: {:.3f}ms per board'.format('new state', 1000 * cold))
+    print('{:>10}: {:.3f}ms per board'.format('same state', 1000 * warm))
@@ -0,0 +1,95 @@
+"""
+Compare request latency with saves on the request path and with
+write-behind saving (see WriteBehindStore in backend/store.py).
+
+Plays several games through the Flask test client, saving to a temporary
+json store with fsync on so disk latency shows up.
+
+run with: python -m benchmarks.write_behind [N_GAMES] [N_TURNS]
+"""
+import contextlib
+import io
+import tempfile
+from sys import argv
+from time import perf_counter
+
+import heroku.app as server
+from backend.game import Game
+from backend.store import JsonStore, WriteBehindStore
+
+def percentile(times, pct):
+    times = sorted(times)
+    return times[min(len(times) - 1, int(len(times) * pct / 100))]
+
+def request(client, times, game_id, player, **data):
+    data.update({'game_id': game_id, 'request_player': player})
+    start = perf_counter()
+    response = client.post('/api/do_action', json=data)
+    times.append(perf_counter() - start)
+    return response.get_json()
+
+# send data, then answer any list prompts with the first choice
+def act(client, times, game_id, player, **data):
+    response = request(client, times, game_id, player, **data)
+    while '(1)' in response['info'] and response['current_action'] != 'none':
+        response = request(client, times, game_id, player, current_action=response['current_action'], choice_idx='1')
+    return response
+
+def set_up_game(client, times, game_id):
+    request(client, times, game_id, 'Dark', current_action='start')
+    request(client, times, game_id, 'Dark', current_action='place rooms', current_keypress='Enter')
+    response = request(client, times, game_id, 'Light', current_action='choose first player', choice_idx='1')
+    hexes = response['hexes']
+    request(client, times, game_id, 'Light', current_action='place players', click_x=hexes[0]['x'], click_y=hexes[0]['y'])
+    request(client, times, game_id, 'Dark', current_action='place players', click_x=hexes[5]['x'], click_y=hexes[5]['y'])
+
+def run(store, n_games, n_turns):
+    Game.store = store
+    server.GAMES.games.clear()
+    client = server.app.test_client()
+    times = []
+    game_ids = ['bench{}'.format(idx) for idx in range(n_games)]
+
+    for game_id in game_ids:
+        set_up_game(client, times, game_id)
+    player = 'Light'
+    for turn in range(n_turns):
+        for game_id in game_ids:
+            act(client, times, game_id, player, current_action='bless')
+            act(client, times, game_id, player, current_action='reset turn')
+            act(client, times, game_id, player, current_action='bless')
+            act(client, times, game_id, player, current_action='end turn')
+        player = 'Dark' if player == 'Light' else 'Light'
+
+    start = perf_counter()
+    store.close()
+    close_seconds = perf_counter() - start
+    return times, close_seconds
+
+def report(name, times, close_seconds):
+    print('{:>14}: {} requests, p50 {:.2f}ms, p99 {:.2f}ms, max {:.2f}ms, close {:.2f}ms'.format(
+        name,
+        len(times),
+        1000 * percentile(times, 50),
+        1000 * percentile(times, 99),
+        1000 * max(times),
+        1000 * close_seconds,
+    ))
+
+if __name__ == "__main__":
+    n_games = int(argv[1]) if len(argv) > 1 else 10
+    n_turns = int(argv[2]) if len(argv) > 2 else 10
+
+    results = []
+    for name in ['synchronous', 'write-behind']:
+        with tempfile.TemporaryDirectory() as directory:
+            store = JsonStore(directory, fsync=True)
+            if name == 'write-behind':
+                store = WriteBehindStore(store, interval=0.5)
+            with contextlib.redirect_stdout(io.StringIO()):
+                times, close_seconds = run(store, n_games, n_turns)
+            results.append((name, times, close_seconds, store.stats()))
+
+    for name, times, close_seconds, stats in results:
+        report(name, times, close_seconds)
+    print('write-behind stats: {}'.format(results[-1][-1]))
@@ -0,0 +1,306 @@
+"""
+Headless PNG images of game boards, drawn by PygameScreen on SDL's dummy
+video driver, for the /<game_id>/image.png endpoint, shared links and
+archives.
+
+Boards are passed around in the binary board format (see
+backend/binary_format.py): it holds exactly what is drawn, is cheap to send
+to worker processes, and its hash keys the ImageCache, so a board is only
+drawn once however many times it is viewed.
+
+pygame has one display per process, so a process can only draw one board at
+a time. The server draws in a pool of render processes (ImageCache.start),
+forked at startup before it takes requests: a request that misses the cache
+waits for its image without holding a lock, misses for different boards are
+drawn in parallel, and misses for the same board share one render. A render
+that outlasts RENDER_TIMEOUT_SECONDS is still cached when it ends. The server
+never draws itself (render_here=False), so it never imports pygame: without
+render processes it only serves images that are already cached. Elsewhere,
+without a pool, boards are drawn in the calling thread, one at a time.
+
+render all saved games with: python -m graphics.board_image IN_DIR OUT_DIR [--processes N]
+"""
+import argparse
+import glob
+import hashlib
+import os
+import signal
+import struct
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from json import load
+from multiprocessing import Pool, get_context
+from threading import Lock, Thread
+from time import sleep
+
+import backend.binary_format as binary_format
+
+RENDER_VERSION = 1 # bump when the drawing changes, so cached images are not reused
+MAX_IMAGES = 200 # images kept in memory, least recently viewed are dropped
+# render processes of the server, see ImageCache.start. At least one, to keep
+# pygame out of the server, and two only with a cpu to spare for them
+RENDER_PROCESSES = max(1, min(2, (os.cpu_count() or 1) - 1))
+RENDER_TIMEOUT_SECONDS = 10 # longest wait of a request for a render process
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+SCREEN = None # one PygameScreen per process, pygame only has one display
+RENDER_LOCK = Lock()
+
+def get_screen():
+    global SCREEN
+    if SCREEN == None:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        # SDL would otherwise turn SIGTERM into a quit event that nothing reads
+        os.environ.setdefault('SDL_NO_SIGNAL_HANDLERS', '1')
+        from graphics.pygame_screen import PygameScreen
+        SCREEN = PygameScreen()
+    return SCREEN
+
+def image_key(board_bytes):
+    return hashlib.sha1(bytes([RENDER_VERSION]) + board_bytes).hexdigest()
+
+# board_bytes of a json hash from Game.get_game_state or a saved game
+def state_to_board_bytes(state):
+    return binary_format.encode_board(binary_format.hash_board_parts(state))
+
+def render_png(board_bytes):
+    from backend.board import Board
+
+    with RENDER_LOCK:
+        screen = get_screen()
+        board = Board.from_bytes(board_bytes, screen)
+        board.flush_hex_data()
+        board.flush_gamepieces()
+        return encode_png(screen.draw_snapshot())
+
+# pygame 1.9 can only write TGA to file objects, so PNGs are written here:
+# 8 bit RGB, no filtering, which suits the flat colours of the board
+def encode_png(surface):
+    import pygame as pg
+
+    width, height = surface.get_size()
+    pixels = pg.image.tostring(surface, 'RGB')
+    stride = 3 * width
+    rows = b''.join(b'\x00' + pixels[y * stride:(y + 1) * stride] for y in range(height))
+    return b''.join([
+        PNG_SIGNATURE,
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        _png_chunk(b'IDAT', zlib.compress(rows, 6)),
+        _png_chunk(b'IEND', b''),
+    ])
+
+# render processes exit on SIGTERM (on heroku, sent to every process of the
+# dyno) without the server's handlers, leave ctrl-c to the server, and exit
+# if the server was killed without closing the pool
+def _init_render_process(server_pid):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def watch_server():
+        while os.getppid() == server_pid:
+            sleep(1)
+        os._exit(0)
+    Thread(target=watch_server, name='watch-server', daemon=True).start()
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+class ImageCache(object):
+    # images are also kept in directory, if given, so they survive restarts
+    # render_here is whether to draw in the calling thread without a pool
+    def __init__(self, directory=None, max_images=MAX_IMAGES, render_here=True):
+        self.directory = directory
+        self.max_images = max_images
+        self.render_here = render_here
+        self.images = OrderedDict() # key to png bytes, least recently viewed first
+        self.rendering = {} # key to the Future of a render in the pool
+        self.pool = None # render processes, see start
+        self.lock = Lock()
+
+        # counters
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+        self.shared_renders = 0 # misses that waited for a render already in progress
+        self.timeouts = 0 # misses that gave up waiting for a render
+        self.unavailable = 0 # misses that could not be drawn, without a pool or render_here
+
+    # draw in a pool of processes forked now, call before starting threads
+    # that could hold locks the processes would inherit
+    def start(self, processes=RENDER_PROCESSES):
+        if processes > 0 and self.pool == None:
+            self.pool = ProcessPoolExecutor(processes, mp_context=get_context('fork'),
+                initializer=_init_render_process, initargs=(os.getpid(),))
+            # the processes are forked on the first submit
+            self.pool.submit(int).result()
+
+    def close(self):
+        pool, self.pool = self.pool, None
+        if pool != None:
+            pool.shutdown(cancel_futures=True)
+
+    # returns the image key and png bytes, or None instead of the png if it
+    # was not drawn within RENDER_TIMEOUT_SECONDS or cannot be drawn here
+    def get(self, board_bytes):
+        key = image_key(board_bytes)
+        with self.lock:
+            png = self.images.get(key)
+            if png != None:
+                self.images.move_to_end(key)
+                self.memory_hits += 1
+                return key, png
+
+        png = self._read(key)
+        if png != None:
+            self.disk_hits += 1
+            self._keep(key, png)
+            return key, png
+
+        pool = self.pool # None once closed
+        if pool != None:
+            try:
+                return key, self._render_in_pool(pool, key, board_bytes)
+            except FutureTimeoutError:
+                self.timeouts += 1
+                return key, None
+            except BrokenProcessPool:
+                # a render process died, as when heroku stops the dyno
+                print('board image render processes stopped')
+                self.pool = None
+
+        if not self.render_here:
+            self.unavailable += 1
+            return key, None
+        png = self._render(key, board_bytes)
+        self._keep(key, png)
+        return key, png
+
+    def stats(self):
+        with self.lock:
+            return {
+                'images_cached': len(self.images),
+                'image_memory_hits': self.memory_hits,
+                'image_disk_hits': self.disk_hits,
+                'image_renders': self.renders,
+                'image_shared_renders': self.shared_renders,
+                'image_renders_in_progress': len(self.rendering),
+                'image_timeouts': self.timeouts,
+                'image_unavailable': self.unavailable,
+            }
+
+    ############################
+    # INTERNAL METHODS
+    ############################
+
+    def _render(self, key, board_bytes):
+        png = render_png(board_bytes)
+        self.renders += 1
+        self._write(key, png)
+        return png
+
+    def _keep(self, key, png):
+        with self.lock:
+            self.images[key] = png
+            self.images.move_to_end(key)
+            if len(self.images) > self.max_images:
+                self.images.popitem(last=False)
+
+    # the first miss for key starts the render, later misses wait for the same
+    # render. Raises FutureTimeoutError after RENDER_TIMEOUT_SECONDS.
+    def _render_in_pool(self, pool, key, board_bytes):
+        with self.lock:
+            future = self.rendering.get(key)
+            first = future == None
+            if first:
+                future = pool.submit(render_png, board_bytes)
+                self.rendering[key] = future
+                self.renders += 1
+            else:
+                self.shared_renders += 1
+        if first:
+            # outside the lock, the callback runs right away if the render is done
+            future.add_done_callback(lambda future: self._rendered(key, future))
+        return future.result(RENDER_TIMEOUT_SECONDS)
+
+    # called when a render in the pool ends, caches the image even if every
+    # request for it stopped waiting
+    def _rendered(self, key, future):
+        png = None
+        if not future.cancelled() and future.exception() == None:
+            png = future.result()
+            self._write(key, png)
+        if png != None:
+            self._keep(key, png)
+        with self.lock:
+            self.rendering.pop(key, None)
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{}.png'.format(key))
+
+    def _read(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def _write(self, key, png):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # rename so a reader never sees half an image
+            temp_path = '{}.{}.tmp'.format(self._path(key), os.getpid())
+            with open(temp_path, "wb") as file:
+                file.write(png)
+            os.replace(temp_path, self._path(key))
+        except OSError as error:
+            print('could not cache board image {}: {}'.format(key, error))
+
+############################
+# BATCH RENDERING
+############################
+
+# render IN_DIR/<game_id>.json to OUT_DIR/<game_id>.png, skipping images
+# newer than their game, returns the number of images rendered
+def render_directory(directory, out_directory, processes=None):
+    os.makedirs(out_directory, exist_ok=True)
+    jobs = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        out_path = os.path.join(out_directory, '{}.png'.format(name))
+        if not os.path.exists(out_path) or os.path.getmtime(out_path) < os.path.getmtime(path):
+            jobs.append((path, out_path))
+
+    pool = Pool(processes)
+    try:
+        results = pool.map(_render_file, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    return sum(results)
+
+def _render_file(job):
+    path, out_path = job
+    try:
+        with open(path, "r") as file:
+            png = render_png(state_to_board_bytes(load(file)))
+    except Exception as error:
+        print('could not render {}: {}'.format(path, error))
+        return 0
+    with open(out_path, "wb") as file:
+        file.write(png)
+    return 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render PNG images of saved games.')
+    parser.add_argument('directory', help='directory of saved game json files')
+    parser.add_argument('out_directory', help='where to write <game_id>.png')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, defaults to the number of cpus')
+    args = parser.parse_args()
+
+    print('rendered {} images'.format(render_directory(args.directory, args.out_directory, args.processes)))
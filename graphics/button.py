@@ -5,8 +5,13 @@ on hover, can be disabled, and can also be "clicked" via a keybinding.
 This file also has the TextBox class which displays 1-2 lines of text
 and an additional description on hover.
 
+Both are retained: text is only rendered again when it changes, and update()
+returns the rects that need to be drawn again (empty if nothing changed) so
+the screen only redraws and updates those parts of the display.
+
 Color and font properties are hard coded.
 """
+from graphics.fonts import render_text
 import pygame as pg
 
 BLACK     = (  0,   0,   0)
@@ -36,7 +41,6 @@ class Button(object):
         self.disabled_color = DISABLED_COLOR
         self.hover_color = HOVER_COLOR
         self.text_color = BLACK
-        self.font = pg.font.SysFont(FONT, FONT_SIZE)
 
         # surface objs for each button state
         self.surfaceNormal = pg.Surface(self.rect.size)
@@ -44,6 +48,10 @@ class Button(object):
         self.surfaceHover = pg.Surface(self.rect.size)
         self.versions = [self.surfaceNormal, self.surfaceDisabled, self.surfaceHover]
 
+        # what the surfaces and the screen last showed, see update
+        self.rendered_text = None
+        self.drawn_state = None
+
     def handle_event(self, event):
         if self.disabled:
             return None
@@ -81,7 +89,7 @@ class Button(object):
         antialias = True
         w, h = self.rect.size # button dimensions
 
-        text_surface = self.font.render(text, antialias, self.text_color)
+        text_surface = render_text(text, FONT, FONT_SIZE, self.text_color, antialias)
         text_rect = text_surface.get_rect()
         text_rect.center = int(w / 2), int(h / 2) # center text on button
 
@@ -103,12 +111,23 @@ class Button(object):
         if bevel:
             self.render_bevel(surface)
 
+    # returns the rects to draw again
     def update(self):
-        self.render_button(self.surfaceNormal, BUTTON_COLOR)
-        self.render_button(self.surfaceDisabled, DISABLED_COLOR)
-        self.render_button(self.surfaceHover, HOVER_COLOR)
-
-        self.render_text_all_surfaces()
+        text = (self.text, self.keybinding)
+        if text != self.rendered_text:
+            self.rendered_text = text
+            self.render_button(self.surfaceNormal, BUTTON_COLOR)
+            self.render_button(self.surfaceDisabled, DISABLED_COLOR)
+            self.render_button(self.surfaceHover, HOVER_COLOR)
+
+            self.render_text_all_surfaces()
+            self.drawn_state = None
+
+        state = (self.disabled, self.hovered)
+        if state == self.drawn_state:
+            return []
+        self.drawn_state = state
+        return [self.rect]
 
 class TextBox(object):
     def __init__(self, rect, screen):
@@ -119,16 +138,16 @@ class TextBox(object):
 
         self.color = DISABLED_COLOR
         self.text_color = BLACK
-        self.font = pg.font.SysFont(FONT, FONT_SIZE)
 
         self.surface = pg.Surface(self.rect.size)
+        self.drawn_state = None # (text, error) last rendered
 
     # adds 1 (if not self.error) or 2 (if self.error) lines of text to the button surface
     def render_text(self):
         antialias = True
         w, h = self.rect.size # button dimensions
 
-        text_surface = self.font.render(self.text, antialias, self.text_color)
+        text_surface = render_text(self.text, FONT, FONT_SIZE, self.text_color, antialias)
         text_rect = text_surface.get_rect()
         text_rect.center = int(w / 2), int(h / 2) # center text on button
 
@@ -136,7 +155,7 @@ class TextBox(object):
         if self.error:
             text_rect.center = int(w / 2), int(h / 3) # place text above button center
 
-            error_surface = self.font.render(self.error, antialias, self.text_color)
+            error_surface = render_text(self.error, FONT, FONT_SIZE, self.text_color, antialias)
             error_rect = error_surface.get_rect()
             error_rect.center = int(w / 2), int(3*h / 4) # place text below button center
             self.surface.blit(error_surface, error_rect)
@@ -147,7 +166,14 @@ class TextBox(object):
     def draw(self):
         self.screen.blit(self.surface, self.rect)
 
+    # returns the rects to draw again
     def update(self):
+        state = (self.text, self.error)
+        if state == self.drawn_state:
+            return []
+        self.drawn_state = state
+
         self.surface.fill(self.color)
         pg.draw.rect(self.surface, DARKGRAY, pg.Rect((0, 0), self.rect.size), 1) # outline
         self.render_text()
+        return [self.rect]
@@ -0,0 +1,69 @@
+"""
+Fonts and rendered text shared by all pygame widgets.
+
+Fonts are loaded once per (name, size) by get_font. render_text keeps the
+most recently used MAX_TEXTS rendered surfaces keyed by text, font, size,
+colour and antialias, so text already on screen is never rasterized again.
+The surfaces are shared: blit them, never draw on them.
+
+TEXTS.stats() counts hits and misses, a miss being a call to font.render,
+to check that steady state frames render no text.
+"""
+from collections import OrderedDict
+import pygame as pg
+
+FONT = "Arial"
+FONT_SIZE = 24
+BLACK = (0, 0, 0)
+MAX_TEXTS = 512
+
+FONTS = {} # (name, size) to pg.font.Font
+
+def get_font(name=FONT, size=FONT_SIZE):
+    key = (name, size)
+    if key not in FONTS:
+        FONTS[key] = pg.font.SysFont(name, size)
+    return FONTS[key]
+
+class TextCache(object):
+    def __init__(self, max_texts=MAX_TEXTS):
+        self.max_texts = max_texts
+        self.texts = OrderedDict() # key to surface, least recently used first
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, name=FONT, size=FONT_SIZE, color=BLACK, antialias=True):
+        key = (text, name, size, tuple(color), antialias)
+        surface = self.texts.get(key)
+        if surface != None:
+            self.texts.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = get_font(name, size).render(text, antialias, color)
+        self.texts[key] = surface
+        if len(self.texts) > self.max_texts:
+            self.texts.popitem(last=False)
+        return surface
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'text_hits': self.hits,
+            'text_misses': self.misses,
+            'text_hit_rate': self.hits / lookups if lookups else 1,
+            'texts_cached': len(self.texts),
+            'fonts_loaded': len(FONTS),
+        }
+
+TEXTS = TextCache()
+
+def render_text(text, name=FONT, size=FONT_SIZE, color=BLACK, antialias=True):
+    return TEXTS.render(text, name, size, color, antialias)
@@ -1,9 +1,13 @@
+import graphics.js_input as js_input
+
 class MockTextbox(object):
     def __init__(self):
         self.text = ''
         self.error = ''
 
 class MockScreen(object):
+    input = js_input # input functions for this frontend, see Game.screen_input
+
     def __init__(self):
         self.info = MockTextbox()
         self.board_state = MockTextbox()
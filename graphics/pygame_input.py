@@ -4,7 +4,8 @@ User input helper functions for pygame frontend.
 from backend.location import location_to_axial
 from backend.errors import InvalidMove
 
-def get_keypress(screen):
+# enable_buttons is only used by the js frontend, which hides buttons while waiting
+def get_keypress(screen, enable_buttons=True):
     screen.key = None
     while True:
         screen.loop_once()
@@ -96,10 +97,10 @@ Params:
 
 Returns: chosen hex, or index of chosen hex if return_index is True
 """
-def choose_hexes(screen, hex_list, prompt_text="Choose a hex:", return_index = False):
+def choose_hexes(screen, hex_list, prompt_text="Choose a hex:", error_text="No valid hexes", return_index = False):
     # get a list of axial coordinates for the hexes
     axial_coordinates = [location_to_axial(x.location) for x in hex_list]
-    chosen_index = choose_location(screen, axial_coordinates, prompt_text)
+    chosen_index = choose_location(screen, axial_coordinates, prompt_text, error_text)
     if return_index:
         return chosen_index
     elif chosen_index != None:
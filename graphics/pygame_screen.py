@@ -2,10 +2,32 @@
 This file implements a display for Piously using pygame
 
 credit to Mekire for the starting code - https://github.com/Mekire/hex_pygame_redit
+
+Rendering is retained: each frame update() collects the rects that changed
+(widgets that were updated, the hovered hex, moved game pieces), and render()
+draws the scene again clipped to just those rects and only passes them to
+pg.display.update. A frame where nothing changed draws nothing. The hex
+tiles are pre-composited into board_layer, which make_map only draws again
+where rooms moved; auras, players and artworks are drawn over it.
+
+Hover and clicks find their hex with screen_to_axial, the inverse of
+axial_to_screen, and a hash of axial position to tile, so no collisions are
+checked in the frame loop.
+
+Input is event driven: loop_once draws what changed, then on pygame 2 with a
+video driver that can sleep until input (WAIT_DRIVERS) blocks in
+pg.event.wait for up to idle_timeout_ms, so waiting for the player costs no
+CPU and an input is handled as soon as it arrives. Elsewhere (pygame 1.9, or
+the dummy and offscreen drivers) SDL's wait polls every few milliseconds,
+which costs more than polling at IDLE_FPS, so the loop does that instead.
+Queued events are handled together, mouse motion collapsed to the latest
+position. While animating is set, frames are paced at fps.
 '''
 from backend.helpers import other_faction
 from graphics.button import Button, TextBox
+from graphics.fonts import render_text
 from graphics.spell import Spell
+import graphics.pygame_input as pygame_input
 from numpy import average, sqrt, unique
 from sys import exit
 import pygame as pg
@@ -13,8 +35,14 @@ import pygame as pg
 BACKGROUND = pg.Color("white")
 SCREEN_SIZE = (800, 600)
 TRANSPARENT = (0, 0, 0, 0)
-FPS = 10 # 60
+FPS = 10 # 60, frame rate while animating
+IDLE_TIMEOUT_MS = 1000 # longest wait for input before updating anyway
+IDLE_FPS = 10 # polls per second while waiting for input without pg.event.wait
+WAIT_DRIVERS = ['x11', 'wayland', 'windows', 'cocoa'] # where SDL 2.0.16+ waits without polling
 FONT = "Arial"
+MAX_DIRTY_RECTS = 16 # redraw the union of the rects instead past this
+PIECE_RADIUS = 10 # players and artworks
+AURA_RADIUS = 15
 
 ROOMS = ["P", "I", "O", "U", "S", "L", "Y", "Shovel", "Temp"]
 
@@ -53,36 +81,34 @@ HOVER_TEXT_POS = (5, 2*BUTTON_SIZE[1] + 5)
 # - make the player object prettier
 #   - https://www.google.com/url?sa=i&url=https%3A%2F%2Fdlpng.com%2Fpng%2F4443758&psig=AOvVaw0OV8088DkAY7x2EFMcegXh&ust=1592797306363000&source=images&cd=vfe&ved=0CAIQjRxqFwoTCODByL_-keoCFQAAAAAdAAAAABAM
 # - move some classes into seperate files
-# - improve handle_click to use mask not rect (right now it will sometimes take wrong hex)
 # - figure out + probably remove layer
 # - make spells clickable
 class HexTile(pg.sprite.Sprite):
+    # all tiles of a room look the same, so they share an image
+    images = {} # room to tile image
+
     def __init__(self, pos, room, axial_pos, *groups):
         # *groups is initialized as pg.sprite.LayeredUpdates()
-        super(HexTile, self).__init__(*groups)
+        super(HexTile, self).__init__()
         self.color =  ROOM_COLORS[room]
         self.image = self.make_tile(room)
         self.rect = self.image.get_rect(center=pos)
-        self.mask = self.make_mask()
         self.room = room
-        self.layer = 0 # used to control the render order of the hex_tiles
+        self.layer = self.rect.bottom # used to control the render order of the hex_tiles
         self.axial_pos = axial_pos
+        self.add(*groups) # after setting layer, which can't change once in a group
 
     def name(self):
         return '{}: ({}, {})'.format(self.room, self.axial_pos[0], self.axial_pos[1])
 
     def make_tile(self, room):
-        image = pg.Surface(HEX_FOOTPRINT).convert_alpha()
-        image.fill(TRANSPARENT)
-        pg.draw.polygon(image, self.color, HEX_POINTS)
-        pg.draw.lines(image, pg.Color("black"), 1, HEX_POINTS, 2)
-        return image
-
-    def make_mask(self):
-        temp_image = pg.Surface(self.image.get_size()).convert_alpha()
-        temp_image.fill(TRANSPARENT)
-        pg.draw.polygon(temp_image, pg.Color("red"), HEX_POINTS)
-        return pg.mask.from_surface(temp_image)
+        if room not in HexTile.images:
+            image = pg.Surface(HEX_FOOTPRINT).convert_alpha()
+            image.fill(TRANSPARENT)
+            pg.draw.polygon(image, self.color, HEX_POINTS)
+            pg.draw.lines(image, pg.Color("black"), 1, HEX_POINTS, 2)
+            HexTile.images[room] = image
+        return HexTile.images[room]
 
 # When the mouse is over a HexTile, displays the room + coordinates of the
 # hex and changes the color of the hex slightly
@@ -95,25 +121,25 @@ class HexHover(pg.sprite.Sprite):
         self.image.fill(TRANSPARENT)
         pg.draw.polygon(self.image, self.COLOR, HEX_POINTS)
 
-        self.rect = pg.Rect((0,0,1,1))
-        self.mask = pg.Mask((1,1))
-        self.mask.fill()
         self.target = None
         self.hex = None
         self.hex_label = None
         self.hex_label_rect = None
-        self.font = pg.font.SysFont(FONT, 24)
+        self.hit = None # hovered HexTile
+
+    # true_hit is the HexTile under the mouse or None, returns the rects to draw again
+    def update(self, true_hit, screen_rect):
+        if true_hit == self.hit:
+            return []
 
-    def update(self, pos, hex_tiles, screen_rect):
-        self.rect.topleft = pos
-        hits = pg.sprite.spritecollide(self, hex_tiles, 0, pg.sprite.collide_mask)
-        if hits:
-            true_hit = max(hits, key=lambda x: x.rect.bottom)
+        rects = self.drawn_rects()
+        self.hit = true_hit
+        if true_hit:
             self.target = true_hit.rect.topleft
             self.hex = true_hit.room
 
             # diplay the room info for the hovered hex
-            self.hex_label = text_render(true_hit.name(), self.font)
+            self.hex_label = render_text(true_hit.name(), FONT, 24)
 
             # to make text follow hex_hover pass midbottom=pos to get_rect
             # or midbottom=screen_rect.midbottom to put at bottom of screen
@@ -121,6 +147,19 @@ class HexHover(pg.sprite.Sprite):
             self.hex_label_rect.clamp_ip(screen_rect)
         else:
             self.hex = None
+        return rects + self.drawn_rects()
+
+    # forget the hovered hex, for when the tiles change, returns the rects to draw again
+    def reset(self):
+        rects = self.drawn_rects()
+        self.hit = None
+        self.hex = None
+        return rects
+
+    def drawn_rects(self):
+        if self.hex:
+            return [pg.Rect(self.target, HEX_FOOTPRINT), self.hex_label_rect]
+        return []
 
     def draw(self, surface):
         if self.hex:
@@ -128,7 +167,9 @@ class HexHover(pg.sprite.Sprite):
             surface.blit(self.hex_label, self.hex_label_rect)
 
 class PygameScreen(object):
-    def __init__(self):
+    input = pygame_input # input functions for this frontend, see Game.screen_input
+
+    def __init__(self, fps=FPS, idle_timeout_ms=IDLE_TIMEOUT_MS):
         pg.init()
         pg.display.set_mode(SCREEN_SIZE)
         pg.display.set_caption('Piously')
@@ -137,12 +178,24 @@ class PygameScreen(object):
         self.screen_rect = self.screen.get_rect()
         self.clock = pg.time.Clock()
 
+        # frame pacing, see loop_once
+        self.fps = fps
+        self.animating = False # set while something moves, to draw at fps without waiting for input
+        self.pending_events = [] # events left over after an input, handled next loop
+        self.idle_timeout_ms = idle_timeout_ms
+        # pg.event.wait's timeout is new in pygame 2
+        self.blocking_wait = pg.get_sdl_version() >= (2, 0, 16) and pg.display.get_driver() in WAIT_DRIVERS
+
         # variables for rendering the board of hex tiles
         self.hex_tiles = None
+        self.tiles = {} # (x, y, room) to HexTile
+        self.tile_at = {} # (x, y) to the HexTile drawn on top there
+        self.board_layer = None # all hex tiles drawn in order
         self.hex_data = None
         self.axial_avg_x = 0
         self.axial_avg_y = 0
         self.hex_hover = HexHover()
+        self.mouse_pos = None # from the latest mouse motion event
 
         # variables for rendering game objects
         self.spells = []
@@ -150,6 +203,11 @@ class PygameScreen(object):
         self.player_data = []
         self.artwork_data = []
         self.aura_data = []
+        self.drawn_pieces = [[], [], []] # aura, player and artwork data last drawn
+
+        # what changed since the last render, see update
+        self.dirty_rects = []
+        self.full_redraw = True
 
         # variables for backend to read
         self.key = None # most recent keypress
@@ -196,19 +254,64 @@ class PygameScreen(object):
         #  'x': int, x-coord axial
         #  'y': int, y-coord axial
         #  'room': string, which room the hex is in
-        hex_tiles = pg.sprite.LayeredUpdates()
+        if hexes == self.hex_data:
+            return
+        self.hex_data = hexes
 
         # used to center tiles on the screen
-        self.axial_avg_x = int(average(unique([hex['x'] for hex in hexes])))
-        self.axial_avg_y = int(average(unique([hex['y'] for hex in hexes])))
-
+        axial_avg = (
+            int(average(unique([hex['x'] for hex in hexes]))),
+            int(average(unique([hex['y'] for hex in hexes]))),
+        )
+        # every tile moves on screen when the center changes
+        recenter = self.board_layer == None or axial_avg != (self.axial_avg_x, self.axial_avg_y)
+        self.axial_avg_x, self.axial_avg_y = axial_avg
+
+        # keep the tiles that did not move, the rest need drawing again
+        old_tiles = {} if recenter else self.tiles
+        tiles = {}
+        changed = []
         for hex in hexes:
-            pos = self.axial_to_screen(hex['x'], hex['y'])
-            HexTile(pos, hex['room'], (hex['x'], hex['y']), hex_tiles)
+            key = (hex['x'], hex['y'], hex['room'])
+            tile = old_tiles.pop(key, None)
+            if tile == None:
+                pos = self.axial_to_screen(hex['x'], hex['y'])
+                tile = HexTile(pos, hex['room'], (hex['x'], hex['y']))
+                changed.append(tile.rect)
+            tiles[key] = tile
+        changed += [tile.rect for tile in old_tiles.values()] # removed tiles
+        changed = clip_rects(changed, self.screen_rect)
+
+        self.tiles = tiles
+        self.hex_tiles = pg.sprite.LayeredUpdates(*tiles.values())
+        # rooms may overlap while being placed, later tiles are drawn on top
+        self.tile_at = {tile.axial_pos: tile for tile in self.hex_tiles.sprites()}
+        self.dirty_rects += self.hex_hover.reset()
+        if recenter:
+            self.board_layer = pg.Surface(SCREEN_SIZE, pg.SRCALPHA)
+            self.draw_board_layer(self.screen_rect)
+            self.full_redraw = True
+        else:
+            for rect in changed:
+                self.draw_board_layer(rect)
+            self.dirty_rects += changed
 
-        self.hex_tiles = hex_tiles
+    # draw the hex tiles in rect of board_layer again
+    def draw_board_layer(self, rect):
+        self.board_layer.fill(TRANSPARENT, rect)
+        self.board_layer.set_clip(rect)
+        self.hex_tiles.draw(self.board_layer)
+        self.board_layer.set_clip(None)
 
     def make_spells(self, spell_data):
+        if [spell['name'] for spell in spell_data] == [spell.name for spell in self.spells]:
+            # same spells, update() redraws the ones that changed
+            for spell, data in zip(self.spells, spell_data):
+                spell.faction = data['faction']
+                spell.tapped = data['tapped']
+                spell.unplaced_artwork = data['artwork']
+            return
+
         spells = []
         for idx, spell in enumerate(spell_data):
             # putting buttons in column along the left
@@ -230,6 +333,7 @@ class PygameScreen(object):
             )
             spells.append(spell_obj)
         self.spells = spells
+        self.full_redraw = True
 
     def axial_to_screen(self, x, y):
         # put the (axial_avg_x, axial_avg_y) hex in the center
@@ -246,6 +350,32 @@ class PygameScreen(object):
         )
         return pos
 
+    # the axial position of the hex containing pos, the inverse of axial_to_screen
+    def screen_to_axial(self, pos):
+        start_x, start_y = self.screen_rect.center
+        rowsize_x, rowsize_y = ROW_OFFSET
+        colsize_x, colsize_y = COL_OFFSET
+
+        # solve axial_to_screen for fractional x_idx and y_idx (rowsize_x is 0)
+        y_idx = (pos[0] - start_x) / colsize_x
+        x_idx = (pos[1] - start_y - colsize_y * y_idx) / rowsize_y
+
+        # round to the nearest hex in cube coordinates, fixing the coordinate
+        # that rounded furthest so the three still sum to 0
+        z_idx = -x_idx - y_idx
+        x, y, z = round(x_idx), round(y_idx), round(z_idx)
+        dx, dy, dz = abs(x - x_idx), abs(y - y_idx), abs(z - z_idx)
+        if dx > dy and dx > dz:
+            x = -y - z
+        elif dy > dz:
+            y = -x - z
+
+        return (x + self.axial_avg_x, y + self.axial_avg_y)
+
+    # the HexTile at screen position pos, or None
+    def tile_at_pos(self, pos):
+        return self.tile_at.get(self.screen_to_axial(pos))
+
     def draw_players(self):
         # player_data is a list of hashes each with
         #  'x': int, x-coord axial of player's hex
@@ -255,7 +385,7 @@ class PygameScreen(object):
             color = FACTION_COLORS[player['faction']]
             other_color = FACTION_COLORS[other_faction(player['faction'])]
             center = self.axial_to_screen(player['x'], player['y'])
-            radius = 10
+            radius = PIECE_RADIUS
             pg.draw.circle(self.screen, other_color, center, radius+1)
             pg.draw.circle(self.screen, color, center, radius)
 
@@ -268,7 +398,7 @@ class PygameScreen(object):
             color = ROOM_COLORS[artwork['room']]
             other_color = FACTION_COLORS["Dark"]
             center = self.axial_to_screen(artwork['x'], artwork['y'])
-            radius = 10
+            radius = PIECE_RADIUS
             pg.draw.circle(self.screen, other_color, center, radius+1)
             pg.draw.circle(self.screen, color, center, radius)
 
@@ -281,71 +411,148 @@ class PygameScreen(object):
             color = FACTION_COLORS[aura['faction']]
             other_color = FACTION_COLORS[other_faction(aura['faction'])]
             center = self.axial_to_screen(aura['x'], aura['y'])
-            radius = 15
+            radius = AURA_RADIUS
             pg.draw.circle(self.screen, other_color, center, radius+1)
             pg.draw.circle(self.screen, color, center, radius)
 
+    # rects covering the auras, players and artworks in pieces
+    def piece_rects(self, pieces):
+        rects = []
+        size = 2*AURA_RADIUS + 4 # outline included
+        for data in pieces:
+            for piece in data:
+                rect = pg.Rect((0, 0), (size, size))
+                rect.center = self.axial_to_screen(piece['x'], piece['y'])
+                rects.append(rect)
+        return rects
+
+    # collect what changed since the last frame in self.dirty_rects
     def update(self):
-        [button.update() for button in self.buttons]
-        [spell.update() for spell in self.spells]
-        if self.hex_tiles:
-            for sprite in self.hex_tiles:
-                if sprite.layer != sprite.rect.bottom:
-                    self.hex_tiles.change_layer(sprite, sprite.rect.bottom)
-            self.hex_hover.update(pg.mouse.get_pos(), self.hex_tiles, self.screen_rect)
+        for widget in self.buttons + self.spells:
+            self.dirty_rects += widget.update()
 
-    def render(self):
+        pieces = [self.aura_data, self.player_data, self.artwork_data]
+        if pieces != self.drawn_pieces:
+            self.dirty_rects += self.piece_rects(self.drawn_pieces) + self.piece_rects(pieces)
+            self.drawn_pieces = [list(data) for data in pieces]
+
+        if self.mouse_pos:
+            self.dirty_rects += self.hex_hover.update(self.tile_at_pos(self.mouse_pos), self.screen_rect)
+
+    # draw the whole scene, clipped to the screen's clip rect
+    def draw_scene(self):
         self.screen.fill(BACKGROUND)
         [button.draw() for button in self.buttons]
         [spell.draw() for spell in self.spells]
         if self.hex_tiles:
-            self.hex_tiles.draw(self.screen)
+            self.screen.blit(self.board_layer, (0, 0))
             self.hex_hover.draw(self.screen)
             self.draw_auras()
             self.draw_players()
             self.draw_artworks()
-        pg.display.update()
+
+    # draw the board, spells and text boxes without the action buttons or
+    # hover and return the surface, for graphics/board_image.py
+    def draw_snapshot(self):
+        self.update()
+        self.screen.set_clip(None)
+        self.screen.fill(BACKGROUND)
+        self.board_state.draw()
+        self.info.draw()
+        [spell.draw() for spell in self.spells]
+        if self.hex_tiles:
+            self.screen.blit(self.board_layer, (0, 0))
+            self.draw_auras()
+            self.draw_players()
+            self.draw_artworks()
+        self.dirty_rects = []
+        self.full_redraw = True # the display no longer matches what was drawn
+        return self.screen
+
+    def render(self):
+        rects = [self.screen_rect] if self.full_redraw else clip_rects(self.dirty_rects, self.screen_rect)
+        self.full_redraw = False
+        self.dirty_rects = []
+        if not rects:
+            return
+        if len(rects) > MAX_DIRTY_RECTS:
+            rects = [rects[0].unionall(rects[1:])]
+
+        for rect in rects:
+            self.screen.set_clip(rect)
+            self.draw_scene()
+        self.screen.set_clip(None)
+        pg.display.update(rects)
+
+    # all queued events, waiting for one unless there is something to do
+    def next_events(self):
+        if self.animating:
+            self.clock.tick(self.fps)
+            events = pg.event.get()
+        elif self.blocking_wait:
+            # NOEVENT when the timeout ran out, which nothing handles
+            events = [pg.event.wait(self.idle_timeout_ms)] + pg.event.get()
+        else:
+            self.clock.tick(IDLE_FPS)
+            events = pg.event.get()
+
+        # only the latest mouse position matters
+        motions = [event for event in events if event.type == pg.MOUSEMOTION]
+        return [event for event in events if event.type != pg.MOUSEMOTION or event == motions[-1]]
 
     def event_loop(self):
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                self.close()
-
-            # send events to buttons and spells so they can update state
-            for button in self.action_buttons:
-                if button.handle_event(event):
-                    self.key = button.text
-                    return
-            for spell in self.spells:
-                spell.handle_event(event)
-
-            # store most recent click / keypress for backend to read
-            if event.type == pg.MOUSEBUTTONDOWN:
-               self.handle_click(event.pos)
-            elif event.type == pg.KEYDOWN:
-                self.key = pg.key.name(event.key)
+        events = self.pending_events or self.next_events()
+        self.pending_events = []
+        for idx, event in enumerate(events):
+            if self.handle_event(event):
+                # the backend reads one input at a time, keep the rest for the next loop
+                self.pending_events = events[idx + 1:]
+                return
+
+    # returns True if the event was an input for the backend to read
+    def handle_event(self, event):
+        if event.type == pg.QUIT:
+            self.close()
+        elif event.type == pg.VIDEOEXPOSE:
+            self.full_redraw = True
+        elif event.type == pg.MOUSEMOTION:
+            self.mouse_pos = event.pos
+
+        # send events to buttons and spells so they can update state
+        for button in self.action_buttons:
+            if button.handle_event(event):
+                self.key = button.text
+                return True
+        for spell in self.spells:
+            spell.handle_event(event)
+
+        # store most recent click / keypress for backend to read
+        if event.type == pg.MOUSEBUTTONDOWN:
+            return self.handle_click(event.pos)
+        elif event.type == pg.KEYDOWN:
+            self.key = pg.key.name(event.key)
+            return True
+        return False
 
     def close(self):
         pg.quit()
         exit()
 
+    # returns True if a hex was clicked
     def handle_click(self, pos):
-        for hex in self.hex_tiles:
-            if hex.rect.collidepoint(pos):
-                self.click_hex = hex.axial_pos
-                return
+        tile = self.tile_at_pos(pos)
+        if tile == None:
+            return False
+        self.click_hex = tile.axial_pos
+        return True
 
-    # main game loop
+    # main game loop: draw what the backend changed, then handle input
     def loop_once(self):
-        self.event_loop()
         self.update()
         self.render()
-        self.clock.tick(FPS)
-
-def text_render(text, font, color=pg.Color("black")):
-    text_rend = font.render(text, 1, color)
-    text_rect = text_rend.get_rect()
-    image = pg.Surface(text_rect.size).convert_alpha()
-    image.fill(TRANSPARENT)
-    image.blit(text_rend, text_rect)
-    return image
+        self.event_loop()
+
+# the parts of rects inside bounds, set_clip misbehaves for rects outside the surface
+def clip_rects(rects, bounds):
+    rects = [rect.clip(bounds) for rect in rects]
+    return [rect for rect in rects if rect.width and rect.height]
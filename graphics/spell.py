@@ -1,9 +1,11 @@
 """
 Used to display spell info on the screen. Hovering over a spell shows its
 description, and spells also show their faction, artwork, and tapped state.
+Like graphics/button.py, spells are only drawn again when they change.
 
 Color and font properties are hard coded.
 """
+from graphics.fonts import render_text
 import pygame as pg
 
 # TODO: dont dup colors from screen
@@ -46,13 +48,16 @@ class Spell(object):
         self.hovered = False
 
         self.text_color = BLACK
-        self.font = pg.font.SysFont(FONT, FONT_SIZE)
 
         # surface objs for spell
         self.surface = pg.Surface(self.rect.size)
         self.spell_label = None
         self.spell_label_rect = None
 
+        # what the surface and the screen last showed, see update
+        self.drawn_state = None
+        self.drawn_hovered = False
+
     def handle_event(self, event):
         if event.type == pg.MOUSEMOTION:
             if self.rect.collidepoint(event.pos):
@@ -65,7 +70,7 @@ class Spell(object):
 
         # write spell name on spell box
         w, h = self.rect.size # spell box dimensions
-        text_surface = self.font.render(self.name, antialias, self.text_color)
+        text_surface = render_text(self.name, FONT, FONT_SIZE, self.text_color, antialias)
         text_rect = text_surface.get_rect()
 
         # faction indicator extends 3*h2 into the box - center text in remaining space
@@ -81,7 +86,7 @@ class Spell(object):
 
         # write spell description at description_pos
         description_txt = ' {}'.format(self.description)
-        self.spell_label = self.font.render(description_txt, antialias, self.text_color)
+        self.spell_label = render_text(description_txt, FONT, FONT_SIZE, self.text_color, antialias)
         self.spell_label_rect = self.spell_label.get_rect(topleft=self.description_pos)
 
     def draw(self):
@@ -89,7 +94,7 @@ class Spell(object):
         if self.hovered:
             self.screen.blit(self.spell_label, self.spell_label_rect)
 
-    def update(self):
+    def render_surface(self):
         # background
         self.surface.fill(FACTION_COLORS[None])
 
@@ -127,3 +132,16 @@ class Spell(object):
 
         # text last so it is on top
         self.render_text()
+
+    # returns the rects to draw again
+    def update(self):
+        rects = []
+        state = (self.name, self.faction, self.tapped, self.unplaced_artwork)
+        if state != self.drawn_state:
+            self.drawn_state = state
+            self.render_surface()
+            rects.append(self.rect)
+        if self.hovered != self.drawn_hovered:
+            self.drawn_hovered = self.hovered
+            rects.append(self.spell_label_rect)
+        return rects
@@ -0,0 +1,163 @@
+"""
+Admission control: keeps latency bounded for people already playing by
+shedding other work when the server is saturated.
+
+Requests are sorted into kinds, from highest to lowest priority:
+ - move: an action in an existing game
+ - poll: current_action 'none', which clients send on a timer
+ - spectator: read-only views like /<game_id>/json and the game listings
+ - new_game: starting a game
+Moves may use up to max_in_flight concurrent requests, waiting up to
+MOVE_WAIT_SECONDS for a slot. The other kinds only get a slot while no move
+is waiting and fewer than shed_in_flight requests are running. Under
+overload (in-flight at the shed limit, recent move p99 latency over
+target_p99_ms, or memory pressure) polls and spectators are rejected at once
+with a Retry-After hint, and new games wait up to NEW_GAME_WAIT_SECONDS for
+the overload to clear before being rejected.
+
+Memory pressure is checked at most every MEMORY_CHECK_SECONDS, before taking
+the lock, since it may read files (see rss_mb).
+"""
+import os
+from collections import deque
+from threading import Condition
+from time import monotonic
+
+MAX_IN_FLIGHT = 64
+SHED_IN_FLIGHT = 32
+TARGET_P99_MS = 500
+MOVE_WAIT_SECONDS = 10
+NEW_GAME_WAIT_SECONDS = 2
+N_LATENCIES = 500 # recent move latencies used for the p99
+LATENCY_CHECK_SECONDS = 1 # how often the p99 is recomputed
+MEMORY_CHECK_SECONDS = 1 # how often memory_pressure is called
+RETRY_AFTER_SECONDS = {'poll': 2, 'spectator': 5, 'new_game': 10, 'move': 1}
+
+KINDS = ['move', 'poll', 'spectator', 'new_game']
+
+class AdmissionController(object):
+    # memory_pressure is a function returning whether memory is running out
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, shed_in_flight=SHED_IN_FLIGHT, target_p99_ms=TARGET_P99_MS, memory_pressure=None):
+        self.max_in_flight = max_in_flight
+        self.shed_in_flight = min(shed_in_flight, max_in_flight)
+        self.target_p99_seconds = target_p99_ms / 1000
+        self.memory_pressure = memory_pressure or (lambda: False)
+
+        self.condition = Condition()
+        self.in_flight = 0
+        self.moves_waiting = 0
+        self.waiting = 0
+        self.latencies = deque(maxlen=N_LATENCIES)
+        self.p99_seconds = 0
+        self.p99_checked = monotonic()
+        self.memory_pressed = False # last result of memory_pressure
+        self.memory_checked = None
+
+        # counters
+        self.admitted = {kind: 0 for kind in KINDS}
+        self.rejected = {kind: 0 for kind in KINDS}
+        self.delayed = {kind: 0 for kind in KINDS}
+        self.max_waiting = 0
+
+    # returns None if the request may run, which must be followed by
+    # release(), or the number of seconds the client should wait before retrying
+    def acquire(self, kind):
+        self.check_memory()
+        with self.condition:
+            if self._can_run(kind):
+                return self._admit(kind)
+            if kind in ['poll', 'spectator']:
+                self.rejected[kind] += 1
+                return RETRY_AFTER_SECONDS[kind]
+
+            # moves and new games wait for a slot, moves get woken first
+            self.delayed[kind] += 1
+            self.waiting += 1
+            self.moves_waiting += kind == 'move'
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                wait_seconds = MOVE_WAIT_SECONDS if kind == 'move' else NEW_GAME_WAIT_SECONDS
+                if self.condition.wait_for(lambda: self._can_run(kind), wait_seconds):
+                    return self._admit(kind)
+                self.rejected[kind] += 1
+                return RETRY_AFTER_SECONDS[kind]
+            finally:
+                self.waiting -= 1
+                self.moves_waiting -= kind == 'move'
+
+    def release(self, kind, seconds):
+        with self.condition:
+            self.in_flight -= 1
+            if kind == 'move':
+                self.latencies.append(seconds)
+            self.condition.notify_all()
+
+    # call without self.condition held
+    def check_memory(self):
+        now = monotonic()
+        if self.memory_checked == None or now - self.memory_checked > MEMORY_CHECK_SECONDS:
+            self.memory_checked = now
+            self.memory_pressed = bool(self.memory_pressure())
+
+    def overloaded(self):
+        with self.condition:
+            return self._overloaded()
+
+    def stats(self):
+        with self.condition:
+            stats = {
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'max_waiting': self.max_waiting,
+                'move_p99_ms': 1000 * self._p99(),
+                'overloaded': self._overloaded(),
+            }
+            for kind in KINDS:
+                stats['admitted_{}'.format(kind)] = self.admitted[kind]
+                stats['delayed_{}'.format(kind)] = self.delayed[kind]
+                stats['rejected_{}'.format(kind)] = self.rejected[kind]
+            return stats
+
+    ############################
+    # INTERNAL METHODS
+    # call with self.condition held
+    ############################
+
+    def _can_run(self, kind):
+        if kind == 'move':
+            return self.in_flight < self.max_in_flight
+        # lower priority requests give way to waiting moves
+        if self.moves_waiting or self._overloaded():
+            return False
+        return True
+
+    def _admit(self, kind):
+        self.in_flight += 1
+        self.admitted[kind] += 1
+        return None
+
+    def _overloaded(self):
+        return (
+            self.in_flight >= self.shed_in_flight
+            or self._p99() > self.target_p99_seconds
+            or self.memory_pressed
+        )
+
+    def _p99(self):
+        # sorting on every request would cost more than the requests themselves
+        now = monotonic()
+        if now - self.p99_checked > LATENCY_CHECK_SECONDS:
+            self.p99_checked = now
+            latencies = sorted(self.latencies)
+            self.p99_seconds = latencies[int(len(latencies) * 0.99)] if latencies else 0
+            # forget old latencies so a past spike does not shed load forever
+            self.latencies.clear()
+        return self.p99_seconds
+
+# current resident memory of this process in MB, or None if it is not known
+def rss_mb():
+    try:
+        with open('/proc/self/statm', "r") as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return None
@@ -1,61 +1,99 @@
 import os
+import atexit
+import hmac
+import signal
 # import json
-from json import load
 from traceback import format_exception
-from sys import exc_info
-from flask import Flask, url_for, render_template, request, make_response, jsonify, abort
+from sys import exc_info, exit
+from flask import Flask, url_for, render_template, request, make_response, jsonify, abort, g, send_file
 from markupsafe import escape
 from copy import deepcopy
 from collections import OrderedDict
+from time import perf_counter
+from urllib.parse import urlencode
 
 from backend.game import Game
 from backend.errors import InvalidMove
+from backend.store import store_from_url, WriteBehindStore
+from heroku.game_cache import GameCache, IDLE_SECONDS, FINISHED_IDLE_SECONDS, MAX_MEMORY_MB, SWEEP_SECONDS
+from heroku.game_index import GameIndex, STATUSES
+from heroku.recorder import RequestRecorder
+from heroku.metrics import Metrics
+from heroku.profiler import RequestProfiler, SlowRequestLog, SAMPLE_EVERY
+from heroku.spectator import SpectatorCache
+from heroku.warm_snapshot import WarmSnapshot, claim, write_snapshot
+from heroku.admission import AdmissionController, rss_mb, MAX_IN_FLIGHT, SHED_IN_FLIGHT, TARGET_P99_MS
+from graphics.board_image import ImageCache, state_to_board_bytes, RENDER_PROCESSES
 
 # run with: python -m heroku.app
 
 app = Flask(__name__)
-GAMES = {}
-MAX_GAMES = 50
-
-def load_games():
-    games = {}
-    path = Game.filename()
-    print('path is', path)
-
-    for fn in os.listdir(path):
-        print('filename is', fn)
-        # TODO: check if os.path.isfile(os.path.join(path, name))
-        with open(os.path.join(path, fn), "r") as file:
-            game = Game.from_hash(load(file))
-            games[game.game_id] = game
-            print('loaded {}'.format(game.game_id))
-
-    return games
-
-# def game_exists(game_id):
-#     filepath = Game.filename(game_id)
-#     if game_id in GAMES or os.path.exists(filepath):
-#         return True
-#     else:
-#         return False
-#
-# def get_game(game_id):
-#     if game_id in GAMES:
-#         return GAMES[game_id]
-#     elif game_exists(game_id):
-#         game = load_game(game_id)
-#         GAMES[game_id] = game
-#         return game
-#     else:
-#         print('no game {}'.format(game_id))
-#         return None
-#
-# def load_game(game_id):
-#     filepath = Game.filename(game_id)
-#     if os.path.exists(filepath):
-#         with open(filepath, "r") as file:
-#             game = Game.from_hash(load(file))
-#         return game
+Game.store = store_from_url(
+    os.environ.get('PIOUSLY_STORE', 'json:saved_games'),
+    fsync = os.environ.get('PIOUSLY_FSYNC') == '1',
+)
+if float(os.environ.get('PIOUSLY_WRITE_BEHIND_SECONDS', 0)) > 0:
+    # save games in a background thread instead of on the request path
+    Game.store = WriteBehindStore(
+        Game.store,
+        interval = float(os.environ['PIOUSLY_WRITE_BEHIND_SECONDS']),
+        flush_on_shutdown = os.environ.get('PIOUSLY_FLUSH_ON_SHUTDOWN', '1') == '1',
+    )
+GAMES = GameCache(
+    idle_seconds = int(os.environ.get('PIOUSLY_IDLE_SECONDS', IDLE_SECONDS)),
+    finished_idle_seconds = int(os.environ.get('PIOUSLY_FINISHED_IDLE_SECONDS', FINISHED_IDLE_SECONDS)),
+    max_memory_mb = int(os.environ.get('PIOUSLY_MAX_MEMORY_MB', MAX_MEMORY_MB)),
+)
+INDEX = GameIndex() # metadata for all games, including ones not in memory
+# in-memory games are pickled here on shutdown and read back on boot, '' to disable
+WARM_SNAPSHOT_PATH = os.environ.get('PIOUSLY_WARM_SNAPSHOT', os.path.join(Game.filename(), 'warm.snapshot'))
+SPECTATORS = SpectatorCache() # snapshots served to /<game_id>/json and /<game_id>/show
+# served to /<game_id>/image.png, drawn in render processes (see the end of this file) so pygame is not imported here
+BOARD_IMAGES = ImageCache(os.environ.get('PIOUSLY_IMAGE_CACHE', os.path.join(Game.filename(), 'images')), render_here=False)
+IMAGE_RETRY_SECONDS = 2 # Retry-After for an image that is not drawn yet
+
+# opt-in recording of /api/do_action requests, see heroku/recorder.py
+RECORDER = RequestRecorder(os.environ['PIOUSLY_RECORD']) if os.environ.get('PIOUSLY_RECORD') else None
+
+METRICS = Metrics() # request timings and counters, served at /metrics
+
+# profiling of live requests, started from /admin/profile or at startup, see heroku/profiler.py
+PROFILER = RequestProfiler(os.environ.get('PIOUSLY_PROFILE_DIR', 'profiles'))
+if os.environ.get('PIOUSLY_PROFILE_REQUESTS') or os.environ.get('PIOUSLY_PROFILE_GAME'):
+    PROFILER.start(
+        mode = os.environ.get('PIOUSLY_PROFILE_MODE', 'cprofile'),
+        n_requests = int(os.environ['PIOUSLY_PROFILE_REQUESTS']) if os.environ.get('PIOUSLY_PROFILE_REQUESTS') else None,
+        game_id = os.environ.get('PIOUSLY_PROFILE_GAME'),
+    )
+# opt-in log of requests slower than PIOUSLY_SLOW_REQUEST_MS
+SLOW_LOG = SlowRequestLog(
+    os.environ.get('PIOUSLY_SLOW_LOG', 'slow_requests.jsonl'),
+    float(os.environ['PIOUSLY_SLOW_REQUEST_MS']) / 1000,
+    sample_every = int(os.environ.get('PIOUSLY_SLOW_LOG_SAMPLE', SAMPLE_EVERY)),
+) if os.environ.get('PIOUSLY_SLOW_REQUEST_MS') else None
+# admin endpoints need ?token=PIOUSLY_ADMIN_TOKEN, and are disabled if it is not set
+ADMIN_TOKEN = os.environ.get('PIOUSLY_ADMIN_TOKEN')
+
+# load shedding to keep moves in existing games fast, see heroku/admission.py
+MAX_RSS_MB = int(os.environ.get('PIOUSLY_MAX_RSS_MB', 0)) # 0 for no limit
+ADMISSION = AdmissionController(
+    max_in_flight = int(os.environ.get('PIOUSLY_MAX_IN_FLIGHT', MAX_IN_FLIGHT)),
+    shed_in_flight = int(os.environ.get('PIOUSLY_SHED_IN_FLIGHT', SHED_IN_FLIGHT)),
+    target_p99_ms = int(os.environ.get('PIOUSLY_TARGET_P99_MS', TARGET_P99_MS)),
+    # games the cache could not evict, or the process is over its memory limit
+    memory_pressure = lambda: len(GAMES) > GAMES.capacity() or bool(MAX_RSS_MB and (rss_mb() or 0) > MAX_RSS_MB),
+)
+# admission kind of the routes other than /api/do_action
+ENDPOINT_KINDS = {
+    'index': 'spectator',
+    'list_games_json': 'spectator',
+    'list_games_html': 'spectator',
+    'show_json': 'spectator',
+    'show_board': 'spectator',
+    'show_image': 'spectator',
+    'new_game': 'new_game',
+    'reset_turn': 'move',
+}
 
 # @app.route("/delete_oldest")
 # def delete_oldest():
@@ -63,16 +101,31 @@ def load_games():
 #     oldest_game = min(games_dict.values(), key=lambda x: x.updated)
 #     os.remove(Game.filename(oldest_game.game_id))
 
-def game_str(show_active):
-    ret = []
-    for game in GAMES.values():
-        if (show_active and not game.current_board.game_over) or (game.current_board.game_over and not show_active):
-            ret.append(' - {}: {}'.format(game.updated, game.game_id))
+GAMES_PER_PAGE = 50
+MAX_GAMES_PER_PAGE = 500
 
-    return ret
+def game_str(entries):
+    return [' - {}: {}'.format(entry['updated'], escape(entry['game_id'])) for entry in entries]
+
+def html_page(title, text):
+    return """
+    <html>
+        <head>
+            <h3>{title}</h3>
+        </head>
+        <body>
+            <p>{text}</p>
+        </body>
+    </html>
+    """.format(
+        title = title,
+        text = '</p><p>'.join(text),
+    )
 
 @app.route("/")
 def index():
+    active, n_active = INDEX.page(game_over=False, limit=GAMES_PER_PAGE)
+    ended, n_ended = INDEX.page(game_over=True, limit=GAMES_PER_PAGE)
     text = [
         'Designed by Jonah Ostroff and implemented by Rachel Diamond and Josh Mundinger',
         '<b>Usage:</b>',
@@ -82,88 +135,219 @@ def index():
         ' - To delete a game go to /GAMEID/delete',
         # ' - To delete the oldest game go to /delete_oldest'
         ' - To play send requests to /api/do_action',
-        '<br /><b>Saved Games (+ last updated time): {}</b>'.format(len(GAMES)),
-        '<b>active</b>',
-    ] + game_str(True) + [
-        '<b>ended</b>',
-    ] + game_str(False)
-    html = """
-    <html>
-        <head>
-            <h3>{title}</h3>
-        </head>
-        <body>
-            <p>{text}</p>
-        </body>
-    </html>
-    """.format(
-        title = 'Welcome to Piously!',
-        text = '</p><p>'.join(text),
+        ' - To list games go to /games (or /api/games for json), with ?status=active|finished, ?after=DATE, ?before=DATE, ?page=N',
+        '<br /><b>Saved Games (+ last updated time): {}</b>'.format(len(INDEX)),
+        '<b>active</b> (<a href="/games?status=active">{} total</a>)'.format(n_active),
+    ] + game_str(active) + [
+        '<b>ended</b> (<a href="/games?status=finished">{} total</a>)'.format(n_ended),
+    ] + game_str(ended)
+    return html_page('Welcome to Piously!', text), 200
+
+# returns the page of index entries for the request args, with paging info
+def list_games():
+    status = request.args.get('status', 'all')
+    if status not in STATUSES:
+        abort(400)
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(MAX_GAMES_PER_PAGE, max(1, int(request.args.get('per_page', GAMES_PER_PAGE))))
+    except ValueError:
+        abort(400)
+
+    entries, total = INDEX.page(
+        game_over = STATUSES[status],
+        updated_after = request.args.get('after'),
+        updated_before = request.args.get('before'),
+        limit = per_page,
+        offset = (page - 1) * per_page,
     )
-    return html, 200
+    return {
+        'games': entries,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'status': status,
+    }
+
+@app.route('/api/games')
+def list_games_json():
+    return list_games(), 200
+
+@app.route('/games')
+def list_games_html():
+    listing = list_games()
+    args = request.args.to_dict()
+    text = ['<b>{} games (+ last updated time): {}</b>'.format(listing['status'], listing['total'])]
+    text += game_str(listing['games'])
+
+    links = []
+    if listing['page'] > 1:
+        links.append('<a href="/games?{}">newer</a>'.format(urlencode(dict(args, page=listing['page'] - 1))))
+    if listing['page'] * listing['per_page'] < listing['total']:
+        links.append('<a href="/games?{}">older</a>'.format(urlencode(dict(args, page=listing['page'] + 1))))
+    text.append(' '.join(links))
+    return html_page('Piously games', text), 200
 
 @app.route('/about')
 def about():
     return 'Designed by Jonah Ostroff and implemented by Rachel Diamond and Josh Mundinger', 200
 
+@app.route('/stats')
+def stats():
+    return dict(GAMES.stats(), **Game.store.stats(), **SPECTATORS.stats(), **BOARD_IMAGES.stats(), **ADMISSION.stats(), rss_mb=rss_mb()), 200
+
+@app.route('/metrics')
+def metrics():
+    gauges = {
+        'piously_{}'.format(k): v
+        for k, v in dict(GAMES.stats(), **Game.store.stats(), **SPECTATORS.stats(), **BOARD_IMAGES.stats(), **ADMISSION.stats(), rss_mb=rss_mb()).items()
+        if isinstance(v, (int, float)) and not isinstance(v, bool)
+    }
+    gauges['piously_indexed_games'] = len(INDEX)
+    text = METRICS.render(gauges)
+    return text, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.before_request
+def admit_request():
+    kind = ENDPOINT_KINDS.get(request.endpoint)
+    if kind:
+        retry_after = ADMISSION.acquire(kind)
+        if retry_after:
+            return busy_response(kind, retry_after)
+        g.admission = (kind, perf_counter())
+
+@app.teardown_request
+def release_request(error=None):
+    if 'admission' in g:
+        kind, start = g.pop('admission')
+        ADMISSION.release(kind, perf_counter() - start)
+
+def busy_response(kind, retry_after):
+    METRICS.inc('piously_shed_total', 'kind', kind)
+    response = jsonify({
+        'error': 'Server busy, please retry in {} seconds'.format(retry_after),
+        'retry_after': retry_after,
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
+# admission kind of a /api/do_action request
+def request_kind(payload):
+    action = payload.get('current_action')
+    if action == 'start':
+        # the js frontend also sends start when reopening a game. Only looks
+        # in memory (GAMES.games, INDEX), as the request may yet be shed
+        game_id = payload.get('game_id')
+        return 'poll' if game_id in GAMES.games or game_id in INDEX else 'new_game'
+    if action == 'none':
+        return 'poll'
+    return 'move'
+
+def check_admin():
+    if not ADMIN_TOKEN:
+        abort(404)
+    if not hmac.compare_digest(request.args.get('token', ''), ADMIN_TOKEN):
+        abort(403)
+
+# start profiling with ?requests=N and/or ?game_id=GAMEID (+ ?mode=cprofile or sample),
+# without arguments returns the profiler status
+@app.route('/admin/profile')
+def start_profile():
+    check_admin()
+    n_requests = request.args.get('requests')
+    game_id = request.args.get('game_id')
+    if n_requests or game_id:
+        try:
+            PROFILER.start(
+                mode = request.args.get('mode', 'cprofile'),
+                n_requests = int(n_requests) if n_requests else None,
+                game_id = game_id,
+            )
+        except ValueError as error:
+            return {'error': str(error)}, 400
+    return PROFILER.status(), 200
+
+@app.route('/admin/profile/stop')
+def stop_profile():
+    check_admin()
+    PROFILER.stop()
+    return PROFILER.status(), 200
+
+@app.route('/admin/profile.pstats')
+def download_pstats():
+    check_admin()
+    PROFILER.save()
+    if not os.path.exists(PROFILER.pstats_path()):
+        return {'error': 'No cprofile profile yet'}, 404
+    return send_file(os.path.abspath(PROFILER.pstats_path()), as_attachment=True)
+
+@app.route('/admin/profile.collapsed')
+def download_collapsed():
+    check_admin()
+    PROFILER.save()
+    if not os.path.exists(PROFILER.collapsed_path()):
+        return {'error': 'No sample profile yet'}, 404
+    return send_file(os.path.abspath(PROFILER.collapsed_path()), mimetype='text/plain')
+
 @app.route('/<game_id>/json')
 def show_json(game_id):
-    if game_id in GAMES:
-        game = GAMES[game_id]
-        state = game.get_game_state(include_metadata=True)
-        return state, 200
+    game = GAMES.get(game_id)
+    if game:
+        snapshot = SPECTATORS.get(game)
+        return spectator_response(snapshot, snapshot.json, 'application/json')
     else:
-        return {'error': 'No game "{}"'.format(game_id)}, 500
+        return {'error': 'No game "{}"'.format(game_id)}, 404
 
 @app.route('/<game_id>/show')
 def show_board(game_id):
-    # TODO: escape() game_id
+    game = GAMES.get(game_id)
+    if game:
+        snapshot = SPECTATORS.get(game)
+        return spectator_response(snapshot, snapshot.get_html(), 'text/html')
+    else:
+        return {'error': 'No game "{}"'.format(game_id)}, 404
 
-    if game_id in GAMES:
-        game = GAMES[game_id]
-        state = game.get_game_state(include_metadata=True)
-        state_text = ['<p><b>{}: </b>{}</p>'.format(k, v) for k, v in state.items()]
-
-        html = """
-        <html>
-            <head>
-                <h3>{title}</h3>
-            </head>
-            <body>
-                {text}
-            </body>
-        </html>
-        """.format(
-            title = 'Game "{}"'.format(game_id),
-            text = ''.join(state_text),
-        )
-        return html, 200
+@app.route('/<game_id>/image.png')
+def show_image(game_id):
+    game = GAMES.get(game_id)
+    if game:
+        snapshot = SPECTATORS.get(game)
+        # keyed by what is drawn, so unchanged boards are not drawn again
+        key, png = BOARD_IMAGES.get(state_to_board_bytes(snapshot.state))
+        if png == None:
+            # still drawing, or no render processes
+            return busy_response('image', IMAGE_RETRY_SECONDS)
+        return spectator_response(snapshot, png, 'image/png', etag=key)
     else:
-        return {'error': 'No game "{}"'.format(game_id)}, 500
+        return {'error': 'No game "{}"'.format(game_id)}, 404
+
+# spectators that already have this version get a 304 without a body
+def spectator_response(snapshot, body, mimetype, etag=None):
+    response = make_response(body, 200)
+    response.mimetype = mimetype
+    response.set_etag(etag or snapshot.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 @app.route('/<game_id>/new')
 def new_game(game_id):
     if game_id in GAMES:
         return {'error': 'Game "{}" already exists'.format(game_id)}, 500
 
-    if len(GAMES) >= MAX_GAMES:
-        return {
-            'error': 'Too many games: Please wait for another game to complete',
-            'game_over': True,
-        }, 500
-
-    GAMES[game_id] = Game(game_id)
+    game = Game(game_id)
+    GAMES.add(game)
+    INDEX.update(game)
     print('[{}] NEW_GAME'.format(game_id))
     return 'Created game {}'.format(game_id), 200
 
 @app.route('/<game_id>/delete')
 def delete_game(game_id):
-    if game_id in GAMES:
-        GAMES.pop(game_id)
-
-    filepath = Game.filename(game_id)
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    GAMES.pop(game_id)
+    INDEX.remove(game_id)
+    SPECTATORS.pop(game_id)
+    Game.store.delete(game_id)
 
     return 'Ended game {}'.format(game_id), 200
 
@@ -174,23 +358,25 @@ def delete_game(game_id):
     # else:
     #     print("No game file exists")
 
-def get_response(request):
+# if timings is a hash it is filled with the seconds spent in each game phase
+def get_response(request, timings=None):
     try:
         data = request.json
         game_id = data['game_id']
-        if not game_id in GAMES:
+        game = GAMES.get(game_id)
+        if not game:
             if data['current_action'] == 'start':
                 # start a new game
                 error, status = new_game(game_id)
                 if status != 200:
                     return error, status
+                game = GAMES.get(game_id)
             else:
                 return {
                     'error': 'Game "{}" does not exist'.format(data['game_id']),
                     'game_over': True,
                 }, 404
 
-        game = GAMES[game_id]
         # if not game:
         #     # should never happen because just checked game_exists before this
         #     return {
@@ -201,9 +387,14 @@ def get_response(request):
         if data['current_action'] in ['start', 'none']:
             data['current_action'] = game.start_action
 
+        if SLOW_LOG and SLOW_LOG.should_capture(game_id):
+            # kept in case the request is slow, see do_action
+            g.state_before = game.get_game_state(include_metadata=True)
+
         # maybe_ending_turn = True if data['current_action'] == 'end turn' else False
 
-        response_data = game.do_action(data)
+        response_data = game.do_action(data, timings)
+        INDEX.update(game)
 
         # if response_data['current_action'] == 'end game' and game_id in GAMES:
         #     print('[{}] END_GAME'.format(game_id))
@@ -232,11 +423,13 @@ def get_response(request):
 
 @app.route('/<game_id>/reset')
 def reset_turn(game_id):
-    if game_id in GAMES:
-        GAMES[game_id].do_action({
+    game = GAMES.get(game_id)
+    if game:
+        game.do_action({
             'current_action': 'reset turn',
             'request_player': 'All',
         })
+        INDEX.update(game)
         return 'Reset turn on game {}'.format(game_id), 200
     else:
         return {'error': 'No game "{}"'.format(game_id)}, 404
@@ -246,12 +439,57 @@ def do_action():
     if request.method == "OPTIONS": # CORS preflight
         return _build_cors_prelight_response()
 
-    response_data, status = get_response(request)
+    start = perf_counter()
+    payload = dict(request.get_json(silent=True) or {}) # get_response changes current_action
+    timings = {'parse_json': perf_counter() - start}
+
+    kind = request_kind(payload)
+    retry_after = ADMISSION.acquire(kind)
+    if retry_after:
+        return busy_response(kind, retry_after)
+    try:
+        if PROFILER.should_profile(payload.get('game_id')):
+            response_data, status = PROFILER.profile(get_response, request, timings)
+        else:
+            response_data, status = get_response(request, timings)
+    finally:
+        ADMISSION.release(kind, perf_counter() - start)
+
+    if RECORDER:
+        RECORDER.record(payload, response_data, status, perf_counter() - start)
+
+    serialize_start = perf_counter()
     response = jsonify(response_data)
     response.headers.add("Access-Control-Allow-Origin", "*")
+    timings['serialize'] = perf_counter() - serialize_start
+    timings['total'] = perf_counter() - start
 
+    observe_request(payload, response_data, status, timings)
+    if SLOW_LOG and SLOW_LOG.is_slow(timings['total']):
+        SLOW_LOG.record(payload, g.get('state_before'), timings, status)
     return response, status
 
+def observe_request(payload, response_data, status, timings):
+    game = GAMES.games.get(payload.get('game_id')) # no loading or cache stats
+    METRICS.observe_request(
+        timings,
+        action = payload.get('current_action'),
+        spell = game.last_spell if game else None,
+        status = status,
+    )
+    if status == 404:
+        METRICS.inc('piously_errors_total', 'type', 'not_found')
+    elif status != 200:
+        METRICS.inc('piously_errors_total', 'type', 'internal')
+    elif (response_data.get('error') or '').startswith('INVALID MOVE'):
+        METRICS.inc('piously_errors_total', 'type', 'invalid_move')
+
+def save_warm_snapshot():
+    start = perf_counter()
+    raw_games = GAMES.warm.raw_games() if GAMES.warm != None else ()
+    n_games = write_snapshot(WARM_SNAPSHOT_PATH, GAMES.values(), raw_games)
+    print('wrote warm snapshot of {} games in {:.1f}ms'.format(n_games, 1000 * (perf_counter() - start)))
+
 def _build_cors_prelight_response():
     response = make_response()
     response.headers.add("Access-Control-Allow-Origin", "*")
@@ -261,8 +499,29 @@ def _build_cors_prelight_response():
 
 if __name__ == "__main__":
     print('STARTING APP')
-    GAMES = load_games()
-    print('existing games: {}'.format(', '.join(GAMES.keys())))
+    # fork the processes that draw /<game_id>/image.png before the request
+    # and index threads start, with 0 only cached images are served
+    BOARD_IMAGES.start(int(os.environ.get('PIOUSLY_RENDER_PROCESSES', RENDER_PROCESSES)))
+    atexit.register(BOARD_IMAGES.close)
+    # games are loaded on first access, only the index (and the map of the
+    # warm snapshot, if the last shutdown left one) is read at startup
+    warm_restarts = bool(WARM_SNAPSHOT_PATH) and claim(WARM_SNAPSHOT_PATH)
+    if WARM_SNAPSHOT_PATH and not warm_restarts:
+        print('another process is using the warm snapshot {}, not using it'.format(WARM_SNAPSHOT_PATH))
+    if warm_restarts:
+        GAMES.warm = WarmSnapshot(WARM_SNAPSHOT_PATH)
+        GAMES.warm.load()
+    INDEX.load()
+    INDEX.rebuild_in_background()
+    INDEX.save_in_background()
+    GAMES.sweep_in_background(float(os.environ.get('PIOUSLY_SWEEP_SECONDS', SWEEP_SECONDS)))
+    atexit.register(INDEX.save)
+    atexit.register(Game.store.close)
+    if warm_restarts:
+        atexit.register(save_warm_snapshot)
+    atexit.register(PROFILER.save)
+    # exit normally on SIGTERM (sent by heroku on restart) so atexit handlers run
+    signal.signal(signal.SIGTERM, lambda signum, frame: exit(0))
 
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port)
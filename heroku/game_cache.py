@@ -0,0 +1,199 @@
+"""
+Memory-budgeted cache of in-memory Games for the server.
+
+Games are kept in least-recently-used order. Games that have been idle for
+too long (or that ended a while ago), and the oldest games once the memory
+budget is used up, are saved with Game.save_to_file and dropped from memory.
+Asking for an evicted game loads it back from Game.store with Game.from_hash.
+
+The memory budget is soft: it only controls how eagerly games are evicted,
+new games are never rejected because of it.
+
+Loading or adding a game evicts games over the budget, and sweep_in_background
+evicts idle games every sweep_seconds, so they go even while every request
+hits the cache. Evicted games are chosen under the lock but saved after
+releasing it, and only dropped if nobody used them while they were saved.
+
+After a warm restart, warm is the WarmSnapshot of the games that were in
+memory at shutdown, and those games are taken from it before Game.store.
+"""
+from collections import OrderedDict
+from threading import RLock, Thread
+from time import monotonic, sleep
+
+from backend.game import Game
+
+IDLE_SECONDS = 30 * 60 # evict games nobody has touched for this long
+FINISHED_IDLE_SECONDS = 60 # finished games only need to stay around for final polls
+MAX_MEMORY_MB = 256
+GAME_SIZE_KB = 64 # approximate memory used by one Game (measured with tracemalloc)
+SWEEP_SECONDS = 30 # time between evictions of idle games, see sweep_in_background
+
+class GameCache(object):
+    def __init__(self, idle_seconds=IDLE_SECONDS, finished_idle_seconds=FINISHED_IDLE_SECONDS, max_memory_mb=MAX_MEMORY_MB):
+        self.idle_seconds = idle_seconds
+        self.finished_idle_seconds = finished_idle_seconds
+        self.max_memory_mb = max_memory_mb
+
+        self.games = OrderedDict() # game_id to Game, least recently used first
+        self.last_used = {} # game_id to monotonic time of last access
+        self.evicting = set() # ids of games being saved to be evicted
+        self.lock = RLock()
+        self.warm = None # WarmSnapshot, see heroku/warm_snapshot.py
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.games)
+
+    def __contains__(self, game_id):
+        return game_id in self.games or (self.warm != None and game_id in self.warm) or Game.store.exists(game_id)
+
+    def __getitem__(self, game_id):
+        game = self.get(game_id)
+        if game == None:
+            raise KeyError(game_id)
+        return game
+
+    def __setitem__(self, game_id, game):
+        self.add(game)
+
+    def keys(self):
+        return list(self.games.keys())
+
+    def values(self):
+        return list(self.games.values())
+
+    def capacity(self):
+        # number of games that fit in the memory budget
+        return max(1, int(self.max_memory_mb * 1024 / GAME_SIZE_KB))
+
+    def get(self, game_id):
+        # return the game, reloading it from disk if it was evicted
+        with self.lock:
+            if game_id in self.games:
+                self.hits += 1
+                self._touch(game_id)
+                return self.games[game_id]
+
+            self.misses += 1
+            game = self._load(game_id)
+            if game == None:
+                return None
+
+            self.loads += 1
+            self.games[game_id] = game
+            self._touch(game_id)
+            print('[{}] LOADED'.format(game_id))
+        self.evict(keep=game_id)
+        return game
+
+    def add(self, game):
+        with self.lock:
+            self.games[game.game_id] = game
+            self._touch(game.game_id)
+        self.evict(keep=game.game_id)
+
+    def pop(self, game_id, default=None):
+        with self.lock:
+            self.last_used.pop(game_id, None)
+            if self.warm != None:
+                self.warm.discard(game_id)
+            return self.games.pop(game_id, default)
+
+    def evict(self, keep=None):
+        # evict idle games, then the least recently used ones while over budget
+        # keep is the id of a game that is about to be used and must stay loaded
+        # call without holding self.lock, games are saved outside it
+        now = monotonic()
+        min_idle = min(self.idle_seconds, self.finished_idle_seconds)
+        victims = [] # (game_id, game, last_used)
+        with self.lock:
+            over_budget = len(self.games) - self.capacity()
+            for game_id, game in list(self.games.items()):
+                idle = now - self.last_used[game_id]
+                if over_budget <= 0 and idle < min_idle:
+                    break # games are in LRU order so the rest are more recent
+
+                # unless the store can rebuild them, games that are mid setup
+                # or mid spell cannot be rebuilt with from_hash yet (see the
+                # TODO there), so keep them in memory
+                if game_id == keep or game_id in self.evicting or not evictable(game):
+                    continue
+
+                max_idle = self.finished_idle_seconds if game.current_board.game_over else self.idle_seconds
+                if over_budget > 0 or idle >= max_idle:
+                    victims.append((game_id, game, self.last_used[game_id]))
+                    self.evicting.add(game_id)
+                    over_budget -= 1
+
+        for game_id, game, last_used in victims:
+            self._evict_game(game_id, game, last_used)
+
+    # evict idle games every sweep_seconds in a daemon thread
+    def sweep_in_background(self, sweep_seconds=SWEEP_SECONDS):
+        def sweep():
+            while True:
+                sleep(sweep_seconds)
+                try:
+                    self.evict()
+                except Exception as error:
+                    print('could not evict idle games: {}'.format(error))
+
+        thread = Thread(target=sweep, name='game-cache-sweep', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            'games_in_memory': len(self.games),
+            'capacity': self.capacity(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'loads': self.loads,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else None,
+        }
+        if self.warm != None:
+            stats.update(self.warm.stats())
+        return stats
+
+    ############################
+    # INTERNAL METHODS
+    ############################
+
+    def _touch(self, game_id):
+        self.games.move_to_end(game_id)
+        self.last_used[game_id] = monotonic()
+
+    # save game, then drop it unless it was used (or replaced) since last_used
+    def _evict_game(self, game_id, game, last_used):
+        try:
+            game.save_to_file()
+        except Exception as error:
+            print('[{}] could not save to evict: {}'.format(game_id, error))
+            return False
+        finally:
+            with self.lock:
+                self.evicting.discard(game_id)
+        with self.lock:
+            if self.games.get(game_id) is not game or self.last_used[game_id] != last_used:
+                return False
+            self.games.pop(game_id)
+            self.last_used.pop(game_id)
+            self.evictions += 1
+        print('[{}] EVICTED'.format(game_id))
+        return True
+
+    def _load(self, game_id):
+        game = self.warm.pop_game(game_id) if self.warm != None else None
+        return game or Game.store.load_game(game_id)
+
+# return whether game can be saved and later rebuilt without losing state
+def evictable(game):
+    return Game.store.restores_any_state or game.can_snapshot()
@@ -0,0 +1,192 @@
+"""
+Lightweight index of saved games, used so the server can start without
+loading every saved game and so the listing pages don't need live Games.
+
+Each entry holds the game id, created + updated times, and whether the game
+is over. Entries for games in the json store also have the size and mtime of
+the game's file so a rebuild can skip files that have not changed.
+
+The index is kept in memory, written to INDEX_FILENAME every SAVE_SECONDS
+if it changed (by save_in_background, never on a request) and on shutdown,
+and rebuilt from Game.store in a background thread. Besides the entries it
+keeps sorted (updated, game_id) lists of all, active and finished games,
+updated incrementally, so a page of the listing costs O(log n + page size).
+"""
+import os
+from bisect import bisect_left, insort
+from json import dump, load, JSONDecodeError
+from threading import RLock, Thread
+from time import sleep
+
+from backend.game import Game
+
+INDEX_FILENAME = 'games.index' # inside Game.filename(), does not end in .json
+SAVE_SECONDS = 10 # time between writes of the changed index file, see save_in_background
+STATUSES = {'all': None, 'active': False, 'finished': True} # status name to game_over filter
+
+class GameIndex(object):
+    def __init__(self, path=None):
+        self.path = path or os.path.join(Game.filename(), INDEX_FILENAME)
+        self.entries = {} # game_id to entry hash
+        self.ordered = {status: [] for status in STATUSES.values()} # game_over filter to sorted (updated, game_id)
+        self.lock = RLock()
+        self.save_lock = RLock() # held while writing the index file
+        self.dirty = False
+        self.rebuilding = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, game_id):
+        return game_id in self.entries
+
+    def get(self, game_id):
+        return self.entries.get(game_id)
+
+    def values(self):
+        with self.lock:
+            return list(self.entries.values())
+
+    def update(self, game):
+        # record the current metadata of a live game
+        with self.lock:
+            entry = dict(self.entries.get(game.game_id, {}))
+            entry.update(entry_for_game(game))
+            self._set(entry)
+            self.dirty = True
+
+    def remove(self, game_id):
+        with self.lock:
+            if self._pop(game_id):
+                self.dirty = True
+
+    def count(self, game_over=None):
+        with self.lock:
+            return len(self.ordered[game_over])
+
+    # returns a page of entries, most recently updated first, and the number
+    # of entries matching the filters. Dates compare as strings like
+    # Game.updated, so a prefix like '2024-05' works
+    def page(self, game_over=None, updated_after=None, updated_before=None, limit=50, offset=0):
+        with self.lock:
+            ordered = self.ordered[game_over]
+            start = bisect_left(ordered, (updated_after,)) if updated_after else 0
+            end = bisect_left(ordered, (updated_before,)) if updated_before else len(ordered)
+            end = max(start, end)
+            page_end = max(start, end - offset)
+            page_start = max(start, page_end - limit)
+            entries = [self.entries[game_id] for _, game_id in reversed(ordered[page_start:page_end])]
+            return entries, end - start
+
+    def load(self):
+        # read the index file written by a previous run, if there is one
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as file:
+                entries = load(file)
+        except (JSONDecodeError, OSError) as error:
+            print('could not read game index: {}'.format(error))
+            return
+
+        with self.lock:
+            for entry in entries:
+                if entry['game_id'] not in self.entries:
+                    self._set(entry)
+        print('loaded index of {} games'.format(len(entries)))
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                entries = list(self.entries.values())
+                self.dirty = False
+
+            # write to a temp file and rename so a crash never leaves half an index
+            temp_path = self.path + '.tmp'
+            with open(temp_path, "w") as file:
+                dump(entries, file)
+            os.replace(temp_path, self.path)
+
+    # write the index every save_seconds if it changed, in a daemon thread,
+    # so requests that update it never wait for the write
+    def save_in_background(self, save_seconds=SAVE_SECONDS):
+        def save():
+            while True:
+                sleep(save_seconds)
+                if self.dirty:
+                    try:
+                        self.save()
+                    except OSError as error:
+                        self.dirty = True
+                        print('could not save game index: {}'.format(error))
+
+        thread = Thread(target=save, name='game-index-save', daemon=True)
+        thread.start()
+        return thread
+
+    def rebuild(self):
+        # sync the index with Game.store. The json store only parses files
+        # that are new or have changed since they were indexed
+        with self.lock:
+            known = dict(self.entries)
+        stored_games = Game.store.list_games(known=known)
+        stored_ids = set()
+
+        with self.lock:
+            for metadata in stored_games:
+                game_id = metadata['game_id']
+                stored_ids.add(game_id)
+                entry = self.entries.get(game_id)
+                # live games may have been updated while the store was read
+                if entry and entry['updated'] > metadata['updated']:
+                    entry['stored'] = True
+                else:
+                    self._set(dict(metadata, stored=True))
+
+            # drop deleted games (games that were never saved are not in the store yet)
+            for game_id, entry in list(self.entries.items()):
+                if entry.get('stored') and game_id not in stored_ids:
+                    self._pop(game_id)
+            self.dirty = True
+
+        self.save()
+        print('indexed {} games'.format(len(self.entries)))
+
+    # entries must only be added or removed through _set and _pop, which keep
+    # the ordered lists in sync. Call with self.lock held
+    def _set(self, entry):
+        self._pop(entry['game_id'])
+        self.entries[entry['game_id']] = entry
+        key = (entry['updated'], entry['game_id'])
+        insort(self.ordered[None], key)
+        insort(self.ordered[bool(entry['game_over'])], key)
+
+    def _pop(self, game_id):
+        entry = self.entries.pop(game_id, None)
+        if entry:
+            key = (entry['updated'], entry['game_id'])
+            for ordered in [self.ordered[None], self.ordered[bool(entry['game_over'])]]:
+                idx = bisect_left(ordered, key)
+                if idx < len(ordered) and ordered[idx] == key:
+                    ordered.pop(idx)
+        return entry
+
+    def rebuild_in_background(self):
+        def rebuild():
+            self.rebuilding = True
+            try:
+                self.rebuild()
+            finally:
+                self.rebuilding = False
+
+        thread = Thread(target=rebuild, name='game-index-rebuild', daemon=True)
+        thread.start()
+        return thread
+
+def entry_for_game(game):
+    return {
+        'game_id': game.game_id,
+        'created': game.created,
+        'updated': game.updated,
+        'game_over': game.current_board.game_over,
+    }
@@ -0,0 +1,261 @@
+"""
+Synthetic load test: plays many games at once through /api/do_action to find
+how many concurrent games one server process can sustain.
+
+Each simulated game starts with current_action 'start', goes through setup,
+then plays turns with a scripted policy (move, bless, end the turn) or a
+random one (random actions, clicking random active hexes and picking random
+choices). Between moves, both players poll with current_action 'none' every
+--poll-seconds, like the js frontend does. When a game ends (or reaches
+--max-turns) a new one is started in its place.
+
+Concurrency is ramped through the stages given with --concurrency, each
+lasting --stage-seconds, and throughput + latency are reported per stage so
+the saturation point shows up as the stage where requests/s stops growing
+and latency climbs. --csv writes the same curves to a file.
+
+Requests are sent in process through the Flask test client (saving to a
+temporary directory), or to a running server with --url.
+
+run with: python -m heroku.loadtest [--url http://localhost:5000] [--concurrency 1,2,4,8,16] [--policy random]
+"""
+import argparse
+import contextlib
+import csv
+import os
+import random
+import re
+import tempfile
+from threading import Event, Lock, Thread
+from time import monotonic, perf_counter, sleep
+
+from heroku.replay import FlaskClient, HttpClient, percentile
+
+PLAYERS = ['Light', 'Dark']
+SCRIPTED_ACTIONS = ['move', 'bless']
+RANDOM_ACTIONS = ['move', 'bless', 'drop', 'pick up', 'cast spell']
+MAX_PROMPTS = 10 # give up on an action (and reset the turn) after this many prompts
+MAX_ATTEMPTS = 6 # random actions tried per turn before ending it
+N_OPTIONS_PATTERN = re.compile(r'\((\d+)\)')
+
+class Results(object):
+    def __init__(self):
+        self.requests = [] # (end time, seconds, current_action, status, invalid move)
+        self.games_started = [] # start times
+        self.games_finished = [] # end times
+        self.lock = Lock()
+
+    def add_request(self, seconds, action, status, response_data):
+        invalid = (response_data.get('error') or '').startswith('INVALID MOVE')
+        with self.lock:
+            self.requests.append((monotonic(), seconds, action, status, invalid))
+
+    def add_game(self, started=True):
+        with self.lock:
+            (self.games_started if started else self.games_finished).append(monotonic())
+
+class GameSession(object):
+    def __init__(self, client, game_id, results, args, rng):
+        self.client = client
+        self.game_id = game_id
+        self.results = results
+        self.policy = args.policy
+        self.poll_seconds = args.poll_seconds
+        self.think_seconds = args.think_seconds
+        self.max_turns = args.max_turns
+        self.rng = rng
+        self.next_poll = monotonic()
+        self.response = {}
+
+    def send(self, player, **data):
+        data.update({'game_id': self.game_id, 'request_player': player})
+        start = perf_counter()
+        status, response_data = self.client.post(data)
+        self.results.add_request(perf_counter() - start, data['current_action'], status, response_data)
+        if status == 200 and data['current_action'] != 'none':
+            self.response = response_data
+        return status, response_data
+
+    # wait think_seconds before the next move, polling for both players meanwhile
+    def think(self):
+        deadline = monotonic() + self.think_seconds
+        while True:
+            now = monotonic()
+            if self.poll_seconds and self.next_poll <= now:
+                for player in PLAYERS:
+                    self.send(player, current_action='none')
+                self.next_poll += self.poll_seconds
+                continue
+            wake = min(deadline, self.next_poll) if self.poll_seconds else deadline
+            if wake <= now:
+                return
+            sleep(wake - now)
+
+    def play(self, stop):
+        self.results.add_game()
+        self.set_up()
+        turns = 0
+        while not stop.is_set() and not self.response.get('game_over') and turns < self.max_turns:
+            if not self.take_turn(stop):
+                break
+            turns += 1
+        self.results.add_game(started=False)
+        self.client.get('/{}/delete'.format(self.game_id))
+
+    def set_up(self):
+        self.send('Dark', current_action='start')
+        self.think()
+        self.send('Dark', current_action='place rooms', current_keypress='Enter')
+        self.think()
+        self.send('Light', current_action='choose first player', choice_idx='1')
+        for player in PLAYERS:
+            self.think()
+            x, y = self.pick_hex(empty=True)
+            self.send(player, current_action='place players', click_x=x, click_y=y)
+
+    # returns False if the game can not continue
+    def take_turn(self, stop):
+        player = self.response.get('current_player')
+        if not player:
+            return False
+
+        if self.policy == 'scripted':
+            for action in SCRIPTED_ACTIONS:
+                self.act(player, action)
+        else:
+            for _ in range(MAX_ATTEMPTS):
+                if stop.is_set() or self.response.get('game_over') or not self.response.get('actions_remaining'):
+                    break
+                self.act(player, self.rng.choice(RANDOM_ACTIONS))
+
+        if not self.response.get('game_over'):
+            self.act(player, 'end turn')
+        return True
+
+    # start an action, then answer its prompts according to the policy
+    def act(self, player, action):
+        self.think()
+        status, response_data = self.send(player, current_action=action)
+        for _ in range(MAX_PROMPTS):
+            if status != 200 or response_data.get('game_over') or response_data.get('current_action') in ['none', 'end game']:
+                return
+            self.think()
+            action = response_data['current_action']
+            active = [h for h in response_data['hexes'] if h['active']]
+            n_options = len(N_OPTIONS_PATTERN.findall(response_data.get('info') or ''))
+            if active:
+                hex = active[0] if self.policy == 'scripted' else self.rng.choice(active)
+                status, response_data = self.send(player, current_action=action, click_x=hex['x'], click_y=hex['y'])
+            elif n_options:
+                # always confirm ending the turn
+                choice = 1 if self.policy == 'scripted' or action == 'end turn' else self.rng.randint(1, n_options)
+                status, response_data = self.send(player, current_action=action, choice_idx=str(choice))
+            else:
+                break
+        # stuck waiting for input the policy can not give
+        self.send(player, current_action='reset turn')
+
+    def pick_hex(self, empty=False):
+        hexes = self.response.get('hexes') or [{'x': 0, 'y': 0}]
+        if empty:
+            hexes = [h for h in hexes if not h.get('obj_type')] or hexes
+        hex = hexes[0] if self.policy == 'scripted' else self.rng.choice(hexes)
+        return hex['x'], hex['y']
+
+def run_worker(make_client, worker_idx, results, args, stop):
+    client = make_client()
+    rng = random.Random(args.seed + worker_idx)
+    n_games = 0
+    while not stop.is_set():
+        game_id = '{}{}-{}'.format(args.prefix, worker_idx, n_games)
+        GameSession(client, game_id, results, args, rng).play(stop)
+        n_games += 1
+
+def run(make_client, args):
+    results = Results()
+    stop = Event()
+    workers = []
+    stages = [] # (concurrency, start, end)
+
+    for concurrency in args.concurrency:
+        while len(workers) < concurrency:
+            worker = Thread(target=run_worker, args=(make_client, len(workers), results, args, stop), daemon=True)
+            worker.start()
+            workers.append(worker)
+        start = monotonic()
+        sleep(args.stage_seconds)
+        stages.append((concurrency, start, monotonic()))
+
+    stop.set()
+    [worker.join() for worker in workers]
+    return summarize(results, stages)
+
+def summarize(results, stages):
+    rows = []
+    for concurrency, start, end in stages:
+        requests = [r for r in results.requests if start <= r[0] < end]
+        times = [r[1] for r in requests] or [0]
+        polls = [r[1] for r in requests if r[2] == 'none'] or [0]
+        moves = [r[1] for r in requests if r[2] != 'none'] or [0]
+        rows.append({
+            'concurrency': concurrency,
+            'requests': len(requests),
+            'requests_per_second': len(requests) / (end - start),
+            'p50_ms': 1000 * percentile(times, 50),
+            'p95_ms': 1000 * percentile(times, 95),
+            'p99_ms': 1000 * percentile(times, 99),
+            'max_ms': 1000 * max(times),
+            'poll_p95_ms': 1000 * percentile(polls, 95),
+            'move_p95_ms': 1000 * percentile(moves, 95),
+            'errors': len([r for r in requests if r[3] != 200]),
+            'invalid_moves': len([r for r in requests if r[4]]),
+            'games_started': len([t for t in results.games_started if start <= t < end]),
+            'games_finished': len([t for t in results.games_finished if start <= t < end]),
+        })
+    return rows
+
+def report(rows, csv_path=None):
+    columns = list(rows[0].keys()) if rows else []
+    print(' '.join('{:>14}'.format(column) for column in columns))
+    for row in rows:
+        print(' '.join('{:>14.2f}'.format(v) if isinstance(v, float) else '{:>14}'.format(v) for v in row.values()))
+
+    if rows:
+        peak = max(rows, key=lambda row: row['requests_per_second'])
+        print('peak throughput {:.1f} requests/s at concurrency {}'.format(peak['requests_per_second'], peak['concurrency']))
+
+    if csv_path:
+        with open(csv_path, "w", newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Play many synthetic games at once against /api/do_action')
+    parser.add_argument('--url', help='server to send requests to, default is in process')
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help='comma separated number of concurrent games per stage')
+    parser.add_argument('--stage-seconds', type=float, default=10, help='length of each stage')
+    parser.add_argument('--policy', choices=['scripted', 'random'], default='random')
+    parser.add_argument('--poll-seconds', type=float, default=1, help='time between polls of each player, 0 for no polling')
+    parser.add_argument('--think-seconds', type=float, default=0.5, help='time between moves')
+    parser.add_argument('--max-turns', type=int, default=40, help='turns before a game is abandoned and a new one started')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--prefix', default='load-', help='added to game ids so load tests do not touch real games')
+    parser.add_argument('--csv', help='also write the per stage results to this file')
+    args = parser.parse_args()
+    args.concurrency = [int(n) for n in args.concurrency.split(',')]
+
+    if args.url:
+        rows = run(lambda: HttpClient(args.url), args)
+    else:
+        import heroku.app as server
+        from backend.game import Game
+        from backend.store import JsonStore
+
+        with tempfile.TemporaryDirectory() as directory:
+            Game.store = JsonStore(directory)
+            server.INDEX.path = os.path.join(directory, 'games.index')
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): # hide game logging
+                rows = run(lambda: FlaskClient(server.app), args)
+
+    report(rows, args.csv)
@@ -0,0 +1,110 @@
+"""
+In-memory request metrics, served at /metrics in the Prometheus text format.
+
+/api/do_action requests are timed by phase (see Game.do_action) and each
+phase is added to a fixed-bucket histogram labeled with the request's
+current_action and, for 'cast spell', the spell name. Counters track
+requests by status and errors by type. Values are reset when the process
+restarts.
+"""
+from bisect import bisect_left
+from threading import Lock
+
+# upper bounds in seconds, the last bucket is +Inf
+BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+# other values of current_action are grouped as 'other' so clients cannot
+# create an unbounded number of labels
+ACTIONS = [
+    'none',
+    'start',
+    'move',
+    'bless',
+    'drop',
+    'pick up',
+    'cast spell',
+    'end turn',
+    'reset turn',
+    'place rooms',
+    'choose first player',
+    'place players',
+    'maybe end game',
+    'end game',
+]
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics(object):
+    def __init__(self):
+        self.histograms = {} # (phase, action, spell) to Histogram
+        self.counters = {} # (name, label name, label value) to count
+        self.lock = Lock()
+
+    # timings is the hash filled in by Game.do_action, plus the phases timed
+    # by the server
+    def observe_request(self, timings, action, spell, status):
+        action = action if action in ACTIONS else 'other'
+        spell = spell or ''
+        with self.lock:
+            for phase, seconds in timings.items():
+                key = (phase, action, spell)
+                histogram = self.histograms.get(key)
+                if not histogram:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.observe(seconds)
+            self._inc('piously_requests_total', 'status', str(status))
+            if 'save_to_file' in timings:
+                self._inc('piously_saves_total')
+
+    def inc(self, name, label=None, value=None):
+        with self.lock:
+            self._inc(name, label, value)
+
+    # gauges is a hash of metric name to value, for values read on demand
+    def render(self, gauges=None):
+        lines = [
+            '# HELP piously_request_phase_seconds Time spent in each phase of /api/do_action requests',
+            '# TYPE piously_request_phase_seconds histogram',
+        ]
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items(), key=lambda x: [str(k) for k in x[0]])
+
+        for (phase, action, spell), histogram in histograms:
+            labels = 'phase="{}",action="{}",spell="{}"'.format(phase, action, spell)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append('piously_request_phase_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, cumulative))
+            lines.append('piously_request_phase_seconds_sum{{{}}} {}'.format(labels, histogram.sum))
+            lines.append('piously_request_phase_seconds_count{{{}}} {}'.format(labels, histogram.count))
+
+        typed = set()
+        for (name, label, value), count in counters:
+            if name not in typed:
+                lines.append('# TYPE {} counter'.format(name))
+                typed.add(name)
+            if label:
+                lines.append('{}{{{}="{}"}} {}'.format(name, label, value, count))
+            else:
+                lines.append('{} {}'.format(name, count))
+
+        for name, value in sorted((gauges or {}).items()):
+            if value != None:
+                lines.append('# TYPE {} gauge'.format(name))
+                lines.append('{} {}'.format(name, value))
+
+        return '\n'.join(lines) + '\n'
+
+    def _inc(self, name, label=None, value=None):
+        key = (name, label, value)
+        self.counters[key] = self.counters.get(key, 0) + 1
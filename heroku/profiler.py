@@ -0,0 +1,206 @@
+"""
+On-demand profiling of live /api/do_action requests, and a log of slow ones.
+
+RequestProfiler profiles the next N requests, or every request for one game
+id, without restarting the server. It is started with /admin/profile or with
+PIOUSLY_PROFILE_REQUESTS / PIOUSLY_PROFILE_GAME at startup, in one of two
+modes:
+ - cprofile: deterministic profile of every call, aggregated into one pstats
+   file (open with python -m pstats or snakeviz)
+ - sample: a thread samples the request's stack every SAMPLE_SECONDS,
+   aggregated into collapsed-stack text (one "frame;frame;frame count" line
+   per stack, the input format of flamegraph.pl and speedscope)
+Profiled requests run one at a time since only one profiler can be active.
+
+SlowRequestLog appends a JSON line with the request payload, the game state
+before the request and the per-phase timings (see Game.do_action) for every
+request slower than a threshold, so slow requests can be reproduced. Getting
+the state costs about as much as a request, so it is only captured for one in
+sample_every requests and for every request of games that were slow before.
+"""
+import cProfile
+import os
+import pstats
+import sys
+from json import dumps
+from collections import OrderedDict
+from threading import Event, Lock, Thread, get_ident
+from time import time
+
+MODES = ['cprofile', 'sample']
+SAMPLE_SECONDS = 0.001
+PSTATS_FILENAME = 'profile.pstats'
+COLLAPSED_FILENAME = 'profile.collapsed'
+SAMPLE_EVERY = 20 # the slow log captures the state before one in this many requests
+MAX_SLOW_GAMES = 100 # games whose state is captured before every request
+
+class RequestProfiler(object):
+    def __init__(self, directory='profiles'):
+        self.directory = directory
+        self.lock = Lock() # protects the settings and aggregated stats
+        self.run_lock = Lock() # held while a request is profiled
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.mode = None # None when not profiling
+            self.remaining = None # number of requests left to profile, None for no limit
+            self.game_id = None # only profile requests for this game
+            self.n_profiled = 0
+            self.stats = None # pstats.Stats for cprofile mode
+            self.stacks = {} # collapsed stack to number of samples for sample mode
+
+    def start(self, mode='cprofile', n_requests=None, game_id=None):
+        if mode not in MODES:
+            raise ValueError('mode must be one of {}'.format(MODES))
+        if n_requests == None and game_id == None:
+            raise ValueError('profile a number of requests or a game id')
+        self.reset()
+        with self.lock:
+            self.mode = mode
+            self.remaining = n_requests
+            self.game_id = game_id
+
+    def stop(self):
+        with self.lock:
+            self.mode = None
+        self.save()
+
+    def should_profile(self, game_id):
+        with self.lock:
+            if not self.mode or self.remaining == 0:
+                return False
+            if self.game_id != None and game_id != self.game_id:
+                return False
+            if self.remaining != None:
+                self.remaining -= 1
+            return True
+
+    # call function, profiling it with the current mode, and return its result
+    def profile(self, function, *args):
+        with self.run_lock:
+            if self.mode == 'sample':
+                result = self._sample(function, *args)
+            else:
+                result = self._cprofile(function, *args)
+
+        with self.lock:
+            self.n_profiled += 1
+            done = self.remaining == 0
+            if done:
+                self.mode = None
+        if done:
+            self.save()
+        return result
+
+    def status(self):
+        with self.lock:
+            return {
+                'mode': self.mode,
+                'remaining': self.remaining,
+                'game_id': self.game_id,
+                'n_profiled': self.n_profiled,
+                'n_samples': sum(self.stacks.values()),
+            }
+
+    def save(self):
+        # write the aggregated stats of whichever mode was used
+        with self.lock:
+            if self.stats or self.stacks:
+                os.makedirs(self.directory, exist_ok=True)
+            if self.stats:
+                self.stats.dump_stats(self.pstats_path())
+            if self.stacks:
+                with open(self.collapsed_path(), "w") as file:
+                    file.write(self.collapsed())
+
+    def pstats_path(self):
+        return os.path.join(self.directory, PSTATS_FILENAME)
+
+    def collapsed_path(self):
+        return os.path.join(self.directory, COLLAPSED_FILENAME)
+
+    def collapsed(self):
+        return ''.join('{} {}\n'.format(stack, count) for stack, count in sorted(self.stacks.items()))
+
+    def _cprofile(self, function, *args):
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args)
+        finally:
+            with self.lock:
+                if self.stats:
+                    self.stats.add(profile)
+                else:
+                    self.stats = pstats.Stats(profile)
+
+    def _sample(self, function, *args):
+        thread_id = get_ident()
+        done = Event()
+        stacks = {}
+
+        def sample():
+            while not done.wait(SAMPLE_SECONDS):
+                frame = sys._current_frames().get(thread_id)
+                stack = []
+                while frame:
+                    code = frame.f_code
+                    stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                if stack:
+                    key = ';'.join(reversed(stack))
+                    stacks[key] = stacks.get(key, 0) + 1
+
+        sampler = Thread(target=sample, name='request-sampler', daemon=True)
+        sampler.start()
+        try:
+            return function(*args)
+        finally:
+            done.set()
+            sampler.join()
+            with self.lock:
+                for stack, count in stacks.items():
+                    self.stacks[stack] = self.stacks.get(stack, 0) + count
+
+class SlowRequestLog(object):
+    def __init__(self, path, threshold_seconds, sample_every=SAMPLE_EVERY):
+        self.path = path
+        self.threshold_seconds = threshold_seconds
+        self.sample_every = sample_every
+        self.file = open(path, "a", buffering=1) # line buffered
+        self.lock = Lock()
+        self.n_logged = 0
+        self.n_requests = 0
+        self.slow_games = OrderedDict() # game ids with slow requests, most recent last
+
+    def is_slow(self, seconds):
+        return seconds >= self.threshold_seconds
+
+    # whether to capture the state of game_id before this request
+    def should_capture(self, game_id):
+        with self.lock:
+            self.n_requests += 1
+            return game_id in self.slow_games or self.n_requests % self.sample_every == 0
+
+    # state is the game's get_game_state(include_metadata=True) before the
+    # request, or None if it was not captured
+    def record(self, payload, state, timings, status):
+        line = dumps({
+            'time': time(),
+            'seconds': timings.get('total'),
+            'status': status,
+            'timings': timings,
+            'payload': payload,
+            'state': state,
+        }, separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+            self.n_logged += 1
+            self.slow_games[payload.get('game_id')] = True
+            self.slow_games.move_to_end(payload.get('game_id'))
+            if len(self.slow_games) > MAX_SLOW_GAMES:
+                self.slow_games.popitem(last=False)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,55 @@
+"""
+Records /api/do_action requests to a JSON lines file so real traffic can be
+replayed later as a load test (see heroku/replay.py).
+
+Recording is opt-in: set PIOUSLY_RECORD to the file to append to, for
+example PIOUSLY_RECORD=requests.jsonl. Each line has:
+ - time: unix time the request arrived
+ - offset: seconds since recording started, used to replay at 1x speed
+ - payload: the request json
+ - status: the response status code
+ - seconds: time taken to build the response
+ - response_digest: hash of the response json, to find state divergences
+ - response_summary: a few response fields, to explain divergences
+"""
+import hashlib
+from json import dumps
+from threading import Lock
+from time import monotonic, time
+
+SUMMARY_KEYS = ['current_action', 'current_player', 'actions_remaining', 'game_over', 'error']
+
+class RequestRecorder(object):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", buffering=1) # line buffered
+        self.lock = Lock()
+        self.start = monotonic()
+        self.n_recorded = 0
+
+    def record(self, payload, response_data, status, seconds):
+        line = dumps({
+            'time': time(),
+            'offset': monotonic() - self.start,
+            'payload': payload,
+            'status': status,
+            'seconds': seconds,
+            'response_digest': response_digest(response_data),
+            'response_summary': response_summary(response_data),
+        }, separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+            self.n_recorded += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def response_digest(response_data):
+    # tracebacks have machine specific paths, so only compare that there was one
+    if 'backend_error' in response_data:
+        response_data = dict(response_data, backend_error=True)
+    return hashlib.sha1(dumps(response_data, sort_keys=True).encode()).hexdigest()
+
+def response_summary(response_data):
+    return {key: response_data.get(key) for key in SUMMARY_KEYS}
@@ -0,0 +1,183 @@
+"""
+Replays a recording of /api/do_action requests (made by setting
+PIOUSLY_RECORD, see heroku/recorder.py) as a load test, and reports
+throughput, latency per current_action, and responses that differ from the
+recorded ones.
+
+Requests are sent in process through the Flask test client (saving to a
+temporary directory), or to a running server with --url. Requests for one
+game are always sent in order, different games are spread over
+--concurrency threads. --speed 1 keeps the recorded timing, --speed max
+sends requests as fast as possible.
+
+run with: python -m heroku.replay RECORDING [--url http://localhost:5000] [--speed max] [--concurrency 4]
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import urllib.error
+import urllib.request
+from json import dumps, loads, JSONDecodeError
+from threading import Thread
+from time import monotonic, perf_counter, sleep
+
+from heroku.recorder import response_digest, response_summary
+
+N_DIVERGENCES_SHOWN = 5
+
+class FlaskClient(object):
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, payload):
+        response = self.client.post('/api/do_action', json=payload)
+        return response.status_code, response.get_json()
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+class HttpClient(object):
+    def __init__(self, url):
+        self.base_url = url.rstrip('/')
+        self.url = self.base_url + '/api/do_action'
+
+    def post(self, payload):
+        request = urllib.request.Request(
+            self.url,
+            data = dumps(payload).encode(),
+            headers = {'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, loads(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, loads(error.read() or '{}')
+
+    def get(self, path):
+        try:
+            with urllib.request.urlopen(self.base_url + path) as response:
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+def load_recording(path):
+    records = []
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                records.append(loads(line))
+            except JSONDecodeError:
+                continue # skip a partly written line
+    return records
+
+# returns a list of results, one per request, and the total time taken
+def replay(records, make_client, speed=None, concurrency=1, prefix=''):
+    # keep each game's requests together and in order
+    shards = [[] for _ in range(concurrency)]
+    game_shards = {}
+    for record in records:
+        game_id = record['payload'].get('game_id')
+        shard = game_shards.setdefault(game_id, len(game_shards) % concurrency)
+        shards[shard].append(record)
+
+    first_offset = records[0]['offset'] if records else 0
+    results = []
+    start = monotonic()
+
+    def send_all(shard):
+        client = make_client()
+        for record in shard:
+            if speed:
+                delay = start + (record['offset'] - first_offset) / speed - monotonic()
+                if delay > 0:
+                    sleep(delay)
+
+            payload = dict(record['payload'])
+            payload['game_id'] = '{}{}'.format(prefix, payload.get('game_id'))
+            request_start = perf_counter()
+            status, response_data = client.post(payload)
+            seconds = perf_counter() - request_start
+
+            results.append({
+                'action': record['payload'].get('current_action'),
+                'seconds': seconds,
+                'status': status,
+                'diverged': status != record['status'] or response_digest(response_data) != record['response_digest'],
+                'record': record,
+                'summary': response_summary(response_data),
+            })
+
+    threads = [Thread(target=send_all, args=(shard,)) for shard in shards if shard]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    return results, monotonic() - start
+
+def percentile(times, pct):
+    times = sorted(times)
+    return times[min(len(times) - 1, int(len(times) * pct / 100))]
+
+def report(results, total_seconds):
+    print('{} requests in {:.2f}s ({:.1f} requests/s)'.format(
+        len(results),
+        total_seconds,
+        len(results) / total_seconds if total_seconds else 0,
+    ))
+
+    by_action = {}
+    for result in results:
+        by_action.setdefault(result['action'], []).append(result['seconds'])
+    print('{:>22} {:>7} {:>9} {:>9} {:>9}'.format('current_action', 'count', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for action, times in sorted(by_action.items(), key=lambda x: str(x[0])):
+        print('{:>22} {:>7} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+            str(action),
+            len(times),
+            1000 * percentile(times, 50),
+            1000 * percentile(times, 95),
+            1000 * percentile(times, 99),
+        ))
+
+    statuses = {}
+    for result in results:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+    print('statuses: {}'.format(', '.join('{}: {}'.format(k, v) for k, v in sorted(statuses.items()))))
+
+    diverged = [result for result in results if result['diverged']]
+    print('divergences: {}'.format(len(diverged)))
+    for result in diverged[:N_DIVERGENCES_SHOWN]:
+        print(' - game {} {}: recorded {} {}, replayed {} {}'.format(
+            result['record']['payload'].get('game_id'),
+            result['action'],
+            result['record']['status'],
+            result['record']['response_summary'],
+            result['status'],
+            result['summary'],
+        ))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay recorded /api/do_action requests')
+    parser.add_argument('recording', help='JSON lines file written with PIOUSLY_RECORD')
+    parser.add_argument('--url', help='server to send requests to, default is in process')
+    parser.add_argument('--speed', default='max', help='"max" or a multiple of the recorded speed, like 1')
+    parser.add_argument('--concurrency', type=int, default=1, help='number of threads sending requests')
+    parser.add_argument('--prefix', default='replay-', help='added to game ids so replays do not touch real games')
+    args = parser.parse_args()
+
+    records = load_recording(args.recording)
+    speed = None if args.speed == 'max' else float(args.speed)
+
+    if args.url:
+        results, total_seconds = replay(records, lambda: HttpClient(args.url), speed, args.concurrency, args.prefix)
+    else:
+        import heroku.app as server
+        from backend.game import Game
+        from backend.store import JsonStore
+
+        with tempfile.TemporaryDirectory() as directory:
+            Game.store = JsonStore(directory)
+            server.INDEX.path = os.path.join(directory, 'games.index')
+            with contextlib.redirect_stdout(io.StringIO()): # hide game logging
+                results, total_seconds = replay(records, lambda: FlaskClient(server.app), speed, args.concurrency, args.prefix)
+
+    report(results, total_seconds)
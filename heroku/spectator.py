@@ -0,0 +1,88 @@
+"""
+Cache of the read-only views of games served at /<game_id>/json and
+/<game_id>/show, so any number of spectators cost one
+get_game_state(include_metadata=True) per state change.
+
+Snapshots are keyed by Game.version, which changes on every do_action that
+changes the game state (not on polls) and is unique across all games in the
+process, so a game reloaded after eviction never matches a snapshot of its
+earlier copy. Versions count from 1 in every process, so the ETag sent with a
+snapshot is the version prefixed with BOOT_ID, random for each process: an
+ETag from before a restart, or from another worker, never matches, and
+polling spectators only get a 304 without a body when nothing changed.
+"""
+import os
+from collections import OrderedDict
+from threading import Lock
+
+from flask import json
+from markupsafe import escape
+
+MAX_SNAPSHOTS = 1000 # games with a cached snapshot, least recently viewed are dropped
+BOOT_ID = os.urandom(6).hex() # makes ETags unique across processes, see Snapshot.etag
+
+class Snapshot(object):
+    def __init__(self, game):
+        self.version = game.version
+        self.etag = '{}-{}'.format(BOOT_ID, game.version)
+        self.state = game.get_game_state(include_metadata=True)
+        self.json = json.dumps(self.state)
+        self.html = None # built on first view of /show
+
+    def get_html(self):
+        if self.html == None:
+            state_text = ['<p><b>{}: </b>{}</p>'.format(k, v) for k, v in self.state.items()]
+            self.html = """
+            <html>
+                <head>
+                    <h3>{title}</h3>
+                </head>
+                <body>
+                    <img src="image.png" alt="board">
+                    {text}
+                </body>
+            </html>
+            """.format(
+                title = 'Game "{}"'.format(escape(self.state['game_id'])),
+                text = ''.join(state_text),
+            )
+        return self.html
+
+class SpectatorCache(object):
+    def __init__(self, max_snapshots=MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self.snapshots = OrderedDict() # game_id to Snapshot, least recently viewed first
+        self.lock = Lock()
+
+        # counters
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, game):
+        with self.lock:
+            snapshot = self.snapshots.get(game.game_id)
+            if snapshot and snapshot.version == game.version:
+                self.hits += 1
+                self.snapshots.move_to_end(game.game_id)
+                return snapshot
+
+            # built under the lock so concurrent spectators build it only once
+            snapshot = Snapshot(game)
+            self.builds += 1
+            self.snapshots[game.game_id] = snapshot
+            self.snapshots.move_to_end(game.game_id)
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+            return snapshot
+
+    def pop(self, game_id):
+        with self.lock:
+            self.snapshots.pop(game_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'spectator_snapshots': len(self.snapshots),
+                'spectator_hits': self.hits,
+                'spectator_builds': self.builds,
+            }
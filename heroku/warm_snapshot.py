@@ -0,0 +1,208 @@
+"""
+Warm restarts: on shutdown every in-memory game is pickled into one
+snapshot file, and on boot the games are read back from it instead of being
+rebuilt from Game.store. Pickling keeps the whole Game, including screen
+state and in-progress choices, so games mid setup or mid spell survive a
+restart (Game.from_hash can only rebuild games between actions).
+
+File layout:
+ - MAGIC, then FORMAT_VERSION as a 4 byte little endian int
+ - the code fingerprint: sha1 of the source of PICKLED_MODULES, so a snapshot
+   written before a deploy that changed the pickled classes is dropped
+ - one pickled Game after another
+ - the pickled index, a hash of game_id to (offset, length)
+ - the offset of the index as an 8 byte little endian int
+
+On boot the file is memory-mapped and only the index is read, each game is
+unpickled the first time it is asked for. The file is unlinked once mapped
+so a later crash can never bring back these (by then stale) games.
+
+Only one process may use a snapshot path: claim() takes an exclusive lock on
+PATH.lock, which is held until the process exits. A process starting while
+the last one is still writing its snapshot waits for it.
+"""
+import hashlib
+import importlib
+import mmap
+import os
+import pickle
+import struct
+from threading import Lock
+from time import perf_counter, sleep
+
+MAGIC = b'PIOUSLY-WARM'
+FORMAT_VERSION = 2
+HEADER = struct.Struct('<I')
+FINGERPRINT_LENGTH = 20 # sha1
+FOOTER = struct.Struct('<Q')
+CLAIM_SECONDS = 10 # how long claim() waits for another process to let go
+
+# modules of the classes pickled with a Game
+PICKLED_MODULES = [
+    'backend.artwork',
+    'backend.board',
+    'backend.game',
+    'backend.hex',
+    'backend.location',
+    'backend.player',
+    'backend.room',
+    'backend.spell',
+    'graphics.js_screen',
+]
+
+FINGERPRINT = None # see code_fingerprint
+CLAIMED = {} # path to the open lock file, kept open to hold the lock
+
+class WarmSnapshot(object):
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.data = b'' # mmap of the snapshot, or bytes if it could not be mapped
+        self.index = {} # game_id to (offset, length) of games not yet materialized
+        self.lock = Lock()
+
+        # counters
+        self.materialized = 0
+        self.failed = 0
+        self.load_seconds = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, game_id):
+        return game_id in self.index
+
+    def load(self):
+        # map the snapshot left by the last graceful shutdown, if there is one
+        if not os.path.exists(self.path):
+            return
+        start = perf_counter()
+        try:
+            self.file = open(self.path, "rb")
+            try:
+                self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError): # empty file, or no mmap support
+                self.data = self.file.read()
+            self.index = read_index(self.data)
+        except (OSError, ValueError, pickle.UnpicklingError, struct.error) as error:
+            print('could not read warm snapshot: {}'.format(error))
+            self.close()
+            self.index = {}
+        try:
+            os.remove(self.path) # the mapping stays valid on posix
+        except OSError:
+            pass
+        self.load_seconds = perf_counter() - start
+        print('mapped warm snapshot of {} games in {:.1f}ms'.format(len(self.index), 1000 * self.load_seconds))
+
+    # return the game and forget it, or None if it is not in the snapshot or
+    # can not be unpickled (then it is loaded from Game.store instead)
+    def pop_game(self, game_id):
+        with self.lock:
+            location = self.index.pop(game_id, None)
+        if not location:
+            return None
+        offset, length = location
+        try:
+            game = pickle.loads(self.data[offset:offset + length])
+        except Exception as error:
+            print('[{}] could not unpickle from warm snapshot: {}'.format(game_id, error))
+            self.failed += 1
+            return None
+        self.materialized += 1
+        return game
+
+    def discard(self, game_id):
+        with self.lock:
+            self.index.pop(game_id, None)
+
+    # raw pickles of the games that were never materialized, so they can be
+    # written to the next snapshot without unpickling them
+    def raw_games(self):
+        with self.lock:
+            index = dict(self.index)
+        for game_id, (offset, length) in index.items():
+            yield game_id, self.data[offset:offset + length]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = b''
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def stats(self):
+        return {
+            'warm_games_pending': len(self.index),
+            'warm_games_materialized': self.materialized,
+            'warm_games_failed': self.failed,
+        }
+
+# write games (an iterable of Game) and raw_games (game_id, pickle bytes
+# pairs) to path, returns the number of games written
+def write_snapshot(path, games, raw_games=()):
+    index = {}
+    temp_path = path + '.tmp'
+    with open(temp_path, "wb") as file:
+        file.write(MAGIC + HEADER.pack(FORMAT_VERSION) + code_fingerprint())
+        for game in games:
+            data = pickle.dumps(game, protocol=pickle.HIGHEST_PROTOCOL)
+            index[game.game_id] = (file.tell(), len(data))
+            file.write(data)
+        for game_id, data in raw_games:
+            if game_id not in index:
+                index[game_id] = (file.tell(), len(data))
+                file.write(data)
+        index_offset = file.tell()
+        file.write(pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL))
+        file.write(FOOTER.pack(index_offset))
+        file.flush()
+        os.fsync(file.fileno())
+    # rename so a crash while writing never leaves half a snapshot
+    os.replace(temp_path, path)
+    return len(index)
+
+def read_index(data):
+    header_length = len(MAGIC) + HEADER.size
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a warm snapshot')
+    version, = HEADER.unpack(data[len(MAGIC):header_length])
+    if version != FORMAT_VERSION:
+        raise ValueError('unsupported warm snapshot version {}'.format(version))
+    if data[header_length:header_length + FINGERPRINT_LENGTH] != code_fingerprint():
+        raise ValueError('warm snapshot was written by different code')
+    index_offset, = FOOTER.unpack(data[len(data) - FOOTER.size:])
+    return pickle.loads(data[index_offset:len(data) - FOOTER.size])
+
+def code_fingerprint():
+    global FINGERPRINT
+    if FINGERPRINT == None:
+        digest = hashlib.sha1()
+        for name in PICKLED_MODULES:
+            with open(importlib.import_module(name).__file__, "rb") as file:
+                digest.update(file.read())
+        FINGERPRINT = digest.digest()
+    return FINGERPRINT
+
+# returns whether this process may read and write the snapshot at path,
+# waiting up to CLAIM_SECONDS for another process to exit
+def claim(path):
+    if path in CLAIMED:
+        return True
+    try:
+        import fcntl
+    except ImportError: # no file locks, assume one process
+        return True
+    file = open(path + '.lock', "w")
+    deadline = perf_counter() + CLAIM_SECONDS
+    while True:
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            CLAIMED[path] = file
+            return True
+        except OSError:
+            if perf_counter() > deadline:
+                file.close()
+                return False
+            sleep(0.1)
@@ -99,6 +99,11 @@ class App extends Component {
 
     this.tick_cnt++;
 
+    // the server asked us to back off, see fetchBoard
+    if (this.retry_at && Date.now() < this.retry_at) {
+      return;
+    }
+
     // only need to check for updates when game_id is set
     // and it is not your turn
     if (this.state.game_id && !this.play_enabled()) {
@@ -134,6 +139,19 @@ class App extends Component {
       });
 
       const response_data = await response.json();
+
+      // the server is busy: keep polling, but not before it says to retry
+      if (response.status === 503) {
+        const retry_after = Number(response.headers.get('Retry-After') || response_data.retry_after || 1);
+        console.log(`server busy, retrying in ${retry_after}s`);
+        this.retry_at = Date.now() + 1000 * retry_after;
+        if (user_initiated) {
+          this.setState({error: response_data.error});
+        }
+        return;
+      }
+      this.retry_at = null;
+
       this.setState(response_data);
       console.log(response_data);
 
@@ -0,0 +1,21 @@
+"""
+Copy saved games from one game store to another, for example from the
+saved_games directory to an SQLite database:
+
+    python migrate_games.py json:saved_games sqlite:saved_games.sqlite3
+
+See backend/store.py for the store urls.
+"""
+from sys import argv, exit
+from backend.store import migrate, store_from_url
+
+if __name__ == "__main__":
+    if len(argv) != 3:
+        print('usage: python migrate_games.py FROM_STORE TO_STORE')
+        exit(1)
+
+    from_store = store_from_url(argv[1])
+    to_store = store_from_url(argv[2])
+    n_games = migrate(from_store, to_store)
+    to_store.close()
+    print('copied {} games from {} to {}'.format(n_games, argv[1], argv[2]))
@@ -4,5 +4,5 @@ Run this file to play Piously
 from backend.game import Game
 
 if __name__ == "__main__":
-    piously = Game("Dark")
+    piously = Game("Dark", mode="pygame")
     piously.play()